@@ -0,0 +1,193 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Hashable, Iterable, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+_EXHAUSTED = object()
+
+
+async def _iterate(items: Iterable[T] | AsyncIterable[T]) -> AsyncIterator[T]:
+    if isinstance(items, AsyncIterable):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def batched(items: Iterable[T] | AsyncIterable[T], size: int) -> AsyncIterator[list[T]]:
+    """Group a sync or async iterable into lists of at most ``size`` items."""
+    batch = []
+    async for item in _iterate(items):
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def bounded_as_completed(func: Callable[[T], Awaitable[R]],
+                               items: Iterable[T] | AsyncIterable[T],
+                               limit: int) -> AsyncIterator[R]:
+    """Yield ``func(item)`` results in completion order with at most ``limit`` calls in flight.
+
+    Items are pulled lazily, so memory stays bounded however long ``items`` is. The first
+    exception cancels the calls still in flight and is raised to the consumer.
+    """
+    iterator = _iterate(items)
+    pending: set[asyncio.Future] = set()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < limit:
+                item = await anext(iterator, _EXHAUSTED)
+                if item is _EXHAUSTED:
+                    exhausted = True
+                else:
+                    pending.add(asyncio.ensure_future(func(item)))
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def ordered_prefetch(func: Callable[[T], Awaitable[R]],
+                           items: Iterable[T] | AsyncIterable[T],
+                           limit: int,
+                           discard: Callable[[R], Awaitable[Any]] | None = None) -> AsyncIterator[R]:
+    """Yield ``func(item)`` results in input order while up to ``limit`` calls run ahead.
+
+    When the consumer stops early, calls still running are cancelled and results that were
+    never yielded are handed to ``discard``, e.g. to release a response body.
+    """
+    iterator = _iterate(items)
+    prefetched: deque[asyncio.Future] = deque()
+    try:
+        while True:
+            while len(prefetched) < limit:
+                item = await anext(iterator, _EXHAUSTED)
+                if item is _EXHAUSTED:
+                    break
+                prefetched.append(asyncio.ensure_future(func(item)))
+            if not prefetched:
+                return
+            yield await prefetched.popleft()
+    finally:
+        for task in prefetched:
+            task.cancel()
+        for result in await asyncio.gather(*prefetched, return_exceptions=True):
+            if discard is not None and not isinstance(result, BaseException):
+                await discard(result)
+
+
+async def bounded_merge(func: Callable[[T], AsyncIterator[R]],
+                        items: Iterable[T] | AsyncIterable[T],
+                        limit: int,
+                        max_buffered: int = 1) -> AsyncIterator[R]:
+    """Interleave the values of ``func(item)`` iterators with at most ``limit`` of them running.
+
+    Producers hand values over through a queue of ``max_buffered`` entries and wait while it
+    is full, so a slow consumer holds back every producer instead of buffering their output.
+    The first exception stops the remaining producers and is raised to the consumer.
+    """
+    queue: asyncio.Queue = asyncio.Queue(max_buffered)
+
+    async def drain(item: T) -> None:
+        async for value in func(item):
+            await queue.put((True, value))
+
+    async def produce() -> None:
+        try:
+            async for _ in bounded_as_completed(drain, items, limit):
+                pass
+        except Exception as e:
+            await queue.put((False, e))
+        else:
+            await queue.put((False, None))
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            is_value, value = await queue.get()
+            if not is_value:
+                if value is not None:
+                    raise value
+                return
+            yield value
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+
+class SingleFlight:
+    """Let concurrent callers asking for the same key share one in-flight call.
+
+    The first caller starts ``func``; callers arriving while it runs await the same result or
+    exception. A caller being cancelled doesn't cancel the shared call for the others.
+    ``forget`` detaches a key, so callers arriving afterwards start a fresh call, e.g. once the
+    underlying object has been written.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[R]]) -> R:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+            self.calls += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(future)
+
+    def forget(self, key: Hashable) -> None:
+        self._calls.pop(key, None)
+
+    def _finish(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # mark the exception as retrieved in case every caller was cancelled meanwhile
+            future.exception()
+
+
+class KeyedLock:
+    """One asyncio lock per key, created on demand and dropped once nobody holds or waits for it."""
+
+    def __init__(self) -> None:
+        self._locks: dict[Hashable, tuple[asyncio.Lock, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def __call__(self, key: Hashable) -> AsyncIterator[None]:
+        lock, users = self._locks.get(key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
@@ -0,0 +1,84 @@
+"""Overhead of upload checksums and download verification on put/get.
+
+Uploads and downloads random data through SomeStuffRepository with each checksum algorithm
+against the in-memory fake, whose link is unthrottled so the CPU cost shows. ``peak_MB`` is
+the peak Python allocation of the put: the fake keeps a copy of the object, so any growth
+over the ``none`` row is a copy made for the checksum. CRC32C rows need the crc32c package.
+Run from the repository root::
+
+    python -m benchmarks.bench_checksums --size-mb 1 --size-mb 64
+"""
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+from io import BytesIO
+
+from benchmarks.common import print_table
+from benchmarks.fake_s3 import FakeAioClient, FakeS3Backend
+from checksums import CHECKSUMS, checksum_of, new_checksum
+from repo_s3 import SomeStuffRepository
+
+BUCKET = "bench"
+OBJECT_NAME = "photo.jpeg"
+
+
+def algorithms():
+    yield None
+    for algorithm in CHECKSUMS:
+        try:
+            new_checksum(algorithm)
+        except ImportError:
+            continue
+        yield algorithm
+
+
+async def measure(algorithm, data, args):
+    size_mb = len(data) / 1024 / 1024
+    checksum_mbps = None
+    if algorithm is not None:
+        started = time.perf_counter()
+        checksum_of(algorithm, data)
+        checksum_mbps = round(size_mb / (time.perf_counter() - started), 1)
+
+    backend = FakeS3Backend(latency_s=args.latency_ms / 1000)
+    repository = SomeStuffRepository(FakeAioClient(backend), bucket=BUCKET, checksum_algorithm=algorithm,
+                                     verify_checksums=algorithm is not None)
+    put_s, get_s, peak = [], [], 0
+    for _ in range(args.repeat):
+        tracemalloc.start()
+        started = time.perf_counter()
+        await repository.put_some_stuff(OBJECT_NAME, BytesIO(data), "image/jpeg")
+        put_s.append(time.perf_counter() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        started = time.perf_counter()
+        async with await repository.get_some_stuff(OBJECT_NAME) as body:
+            received = await body.read()
+        get_s.append(time.perf_counter() - started)
+        assert received == data, algorithm
+    return {
+        "size_MB": round(size_mb, 1),
+        "checksum": algorithm or "none",
+        "checksum_MB/s": checksum_mbps,
+        "put_MB/s": round(size_mb / min(put_s), 1),
+        "get_MB/s": round(size_mb / min(get_s), 1),
+        "peak_MB": round(peak / 1024 / 1024, 1),
+    }
+
+
+async def main(args):
+    rows = []
+    for size_mb in args.size_mb or [1, 64]:
+        data = os.urandom(int(size_mb * 1024 * 1024))
+        rows.extend([await measure(algorithm, data, args) for algorithm in algorithms()])
+    print_table(rows, ["size_MB", "checksum", "checksum_MB/s", "put_MB/s", "get_MB/s", "peak_MB"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, action="append")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
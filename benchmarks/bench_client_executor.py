@@ -0,0 +1,40 @@
+"""Concurrent throughput and p99 latency of client.S3Client, inline vs executor mode.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_client_executor --latency-ms 20 --requests 400 --concurrency 50
+"""
+import argparse
+import asyncio
+from unittest import mock
+
+import client
+from benchmarks.common import print_table, run_concurrently
+from benchmarks.fake_s3 import FakeBotoClient, FakeS3Backend
+
+
+async def bench_mode(mode, backend, requests, concurrency):
+    with mock.patch("boto3.client", return_value=FakeBotoClient(backend)):
+        s3_client = client.S3Client(execution_mode=mode)
+    await s3_client.put_binary_file("photo_index.jpeg", b"x" * 1024, "image/jpeg")
+    try:
+        result = await run_concurrently(
+            lambda i: s3_client.get_file_metadata("photo_index.jpeg"), requests, concurrency
+        )
+    finally:
+        s3_client.close()
+    return {"mode": mode, "concurrency": concurrency, **result}
+
+
+async def main(args):
+    backend = FakeS3Backend(latency_s=args.latency_ms / 1000)
+    rows = [await bench_mode(mode, backend, args.requests, args.concurrency) for mode in ("inline", "executor")]
+    print_table(rows, ["mode", "concurrency", "requests", "throughput_rps", "p50_ms", "p99_ms"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
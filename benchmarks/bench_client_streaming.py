@@ -0,0 +1,88 @@
+"""Time-to-first-byte and peak Python heap of client.S3Client image reads.
+
+Compares get_binary_file (BytesIO + getvalue), get_binary_file_stream and
+read_binary_file_into. Run from the repository root::
+
+    python -m benchmarks.bench_client_streaming --size-mb 16
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from unittest import mock
+
+import client
+from benchmarks.common import print_table
+from benchmarks.fake_s3 import FakeBotoClient, FakeS3Backend
+
+OBJECT_NAME = "photo_index.jpeg"
+
+
+async def read_whole(s3_client, buffer):
+    data = await s3_client.get_binary_file(OBJECT_NAME)
+    return len(data)
+
+
+async def read_stream(s3_client, buffer):
+    received = 0
+    async for chunk in await s3_client.get_binary_file_stream(OBJECT_NAME):
+        received += len(chunk)
+    return received
+
+
+async def read_into(s3_client, buffer):
+    return await s3_client.read_binary_file_into(OBJECT_NAME, buffer)
+
+
+async def measure(name, read, s3_client, size):
+    first_byte_at = None
+    original_iter_body = s3_client._iter_body
+
+    async def timed_iter_body(body, chunk_size):
+        nonlocal first_byte_at
+        async for chunk in original_iter_body(body, chunk_size):
+            first_byte_at = first_byte_at or time.perf_counter()
+            yield chunk
+
+    # the caller-supplied buffer is allocated up front, like a reused serving buffer
+    buffer = bytearray(size)
+    tracemalloc.start()
+    started = time.perf_counter()
+    with mock.patch.object(s3_client, "_iter_body", timed_iter_body):
+        received = await read(s3_client, buffer)
+    finished = time.perf_counter()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert received == size, (name, received, size)
+    return {
+        "method": name,
+        "ttfb_ms": round(((first_byte_at or finished) - started) * 1000, 3),
+        "total_ms": round((finished - started) * 1000, 3),
+        "peak_heap_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+async def main(args):
+    size = args.size_mb * 1024 * 1024
+    backend = FakeS3Backend()
+    with mock.patch("boto3.client", return_value=FakeBotoClient(backend)):
+        s3_client = client.S3Client()
+    backend.store(s3_client.bucket, OBJECT_NAME, b"\xff" * size, "image/jpeg")
+    try:
+        rows = [
+            await measure(name, read, s3_client, size)
+            for name, read in (
+                ("get_binary_file", read_whole),
+                ("get_binary_file_stream", read_stream),
+                ("read_binary_file_into", read_into),
+            )
+        ]
+    finally:
+        s3_client.close()
+    print_table(rows, ["method", "ttfb_ms", "total_ms", "peak_heap_mb"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=16)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,174 @@
+"""Cold start of the S3 adapters: import time, client creation and first requests.
+
+Every run is a fresh interpreter, as for a new worker or a short-lived job, and each scenario
+reports the median of --runs. ``<module> import`` rows time the import alone and list the
+HEAVY_MODULES it pulled in, which the adapters only load when a client is created.
+``SomeStuffRepository``/``S3Client`` rows need moto[server]: they time the import, creating a first and
+a second client and the first request of each, against a local moto server. Run from the
+repository root::
+
+    python -m benchmarks.bench_cold_start --runs 10 --output cold.json
+    python -m benchmarks.bench_cold_start --compare cold.json
+
+With --compare the run fails when a median grows by more than --tolerance against the
+baseline, or when a module imports heavy modules it did not import in the baseline.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import print_table
+
+BUCKET = "bench"
+OBJECT_NAME = "photo_index.jpeg"
+MODULES = ("client", "repo_s3", "session", "sharding")
+HEAVY_MODULES = ("boto3", "botocore.client", "aiobotocore.client", "aiobotocore.session", "fastapi")
+COLUMNS = ["scenario", "median_ms", "max_ms", "heavy_modules"]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"import": elapsed, "heavy_modules": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+REPOSITORY_SCRIPT = """
+import asyncio, json, time
+started = time.perf_counter()
+import session
+from repo_s3 import SomeStuffRepository
+timings = {{"import": time.perf_counter() - started}}
+session.settings.S3_ENDPOINT = {endpoint!r}
+session.settings.S3_ACCESS_KEY = session.settings.S3_SECRET_KEY = "bench"
+
+async def main():
+    for n in (1, 2):
+        started = time.perf_counter()
+        async with session._create_client() as s3_client:
+            timings[f"client {{n}}"] = time.perf_counter() - started
+            started = time.perf_counter()
+            await SomeStuffRepository(s3_client, bucket={bucket!r}).get_some_stuff_metadata({object_name!r})
+            timings[f"first request {{n}}"] = time.perf_counter() - started
+
+asyncio.run(main())
+print(json.dumps(timings))
+"""
+
+CLIENT_SCRIPT = """
+import asyncio, json, time
+started = time.perf_counter()
+import client
+timings = {{"import": time.perf_counter() - started}}
+settings = client.get_settings()
+settings.s3_endpoint, settings.s3_bucket = {endpoint!r}, {bucket!r}
+settings.s3_access_key = settings.s3_secret_key = "bench"
+
+async def main():
+    for n in (1, 2):
+        started = time.perf_counter()
+        s3_client = client.S3Client()
+        timings[f"client {{n}}"] = time.perf_counter() - started
+        started = time.perf_counter()
+        await s3_client.get_file_metadata({object_name!r})
+        timings[f"first request {{n}}"] = time.perf_counter() - started
+        s3_client.close()
+
+asyncio.run(main())
+print(json.dumps(timings))
+"""
+
+
+def run_script(script):
+    completed = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def summarize(name, samples):
+    """A row per timing of the per-run ``samples``."""
+    rows = []
+    for timing in samples[0]:
+        if timing == "heavy_modules":
+            continue
+        values = [sample[timing] * 1000 for sample in samples]
+        rows.append({
+            "scenario": f"{name} {timing}",
+            "median_ms": round(statistics.median(values), 1),
+            "max_ms": round(max(values), 1),
+            "heavy_modules": ",".join(samples[0].get("heavy_modules", [])),
+        })
+    return rows
+
+
+def first_request_rows(args):
+    import boto3
+
+    from benchmarks.fake_s3 import moto_server
+
+    rows = []
+    with moto_server(BUCKET) as endpoint:
+        boto3.client(
+            "s3", endpoint_url=endpoint, aws_access_key_id="bench", aws_secret_access_key="bench", region_name="us-east-1"
+        ).put_object(Bucket=BUCKET, Key=OBJECT_NAME, Body=b"\xff" * 1024)
+        for name, script in (("SomeStuffRepository", REPOSITORY_SCRIPT), ("S3Client", CLIENT_SCRIPT)):
+            script = script.format(endpoint=endpoint, bucket=BUCKET, object_name=OBJECT_NAME)
+            rows.extend(summarize(name, [run_script(script) for _ in range(args.runs)]))
+    return rows
+
+
+def compare(results, baseline, tolerance):
+    """Return the scenarios that regressed against ``baseline`` by more than ``tolerance``."""
+    previous = {row["scenario"]: row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        before = previous.get(row["scenario"])
+        if before is None:
+            continue
+        if row["median_ms"] > before["median_ms"] * (1 + tolerance):
+            regressions.append((row, "median_ms", before["median_ms"], row["median_ms"]))
+        added = set(filter(None, row["heavy_modules"].split(","))) - set(before["heavy_modules"].split(","))
+        if added:
+            regressions.append((row, "heavy_modules", before["heavy_modules"], row["heavy_modules"]))
+    return regressions
+
+
+def main(args):
+    results = []
+    for module in args.modules:
+        script = IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+        results.extend(summarize(module, [run_script(script) for _ in range(args.runs)]))
+    if not args.skip_requests:
+        results.extend(first_request_rows(args))
+
+    print_table(results, COLUMNS)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"meta": {"python": sys.version.split()[0], "runs": args.runs}, "results": results}, output,
+                      indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for row, metric, before, after in regressions:
+            print(f"REGRESSION {row['scenario']} {metric}: {before} -> {after}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modules", type=lambda value: value.split(","), default=list(MODULES))
+    parser.add_argument("--skip-requests", action="store_true", help="only time imports, without moto")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON file from a previous run")
+    # imports are timed in milliseconds, where the noise of a busy machine is relatively large
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    started = time.perf_counter()
+    exit_code = main(parser.parse_args())
+    print(f"finished in {time.perf_counter() - started:.1f}s")
+    sys.exit(exit_code)
@@ -0,0 +1,106 @@
+"""Compression ratio and throughput of the content codecs, and their effect on put/get.
+
+Uploads and downloads CSV-like data through SomeStuffRepository with each codec over a
+fake link throttled to --stream-mbps, and measures the worst event loop stall while doing
+so. zstd rows need the zstandard package. Run from the repository root::
+
+    python -m benchmarks.bench_compression --size-mb 64 --stream-mbps 100
+"""
+import argparse
+import asyncio
+import random
+import time
+from io import BytesIO
+
+from benchmarks.common import print_table
+from benchmarks.fake_s3 import FakeAioClient, FakeS3Backend
+from content_codecs import CompressionPolicy, GzipCodec, ZstdCodec, compress_parts
+from repo_s3 import SomeStuffRepository
+
+BUCKET = "bench"
+OBJECT_NAME = "export.csv"
+
+
+def csv_data(size):
+    rng = random.Random(0)
+    rows, total = [b"uid,name,mimetype,length,upload_date\n"], 0
+    while total < size:
+        row = (f"{rng.getrandbits(128):032x},photo_{rng.randrange(10 ** 6)}.jpeg,image/jpeg,"
+               f"{rng.randrange(10 ** 7)},2019-06-{rng.randrange(1, 29):02}T08:43:41.734+03:00\n").encode()
+        rows.append(row)
+        total += len(row)
+    return b"".join(rows)[:size]
+
+
+def codecs():
+    yield "none", None
+    for level in (1, 6):
+        yield f"gzip-{level}", GzipCodec(level)
+    try:
+        for level in (1, 3, 9):
+            yield f"zstd-{level}", ZstdCodec(level)
+    except ImportError:
+        pass
+
+
+class LoopLag:
+    """Worst delay of a 1 ms timer on the event loop, i.e. the longest stall."""
+
+    async def __aenter__(self):
+        self.max_lag_s = 0.0
+        self._task = asyncio.create_task(self._tick())
+        return self
+
+    async def _tick(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            self.max_lag_s = max(self.max_lag_s, time.perf_counter() - started - 0.001)
+
+    async def __aexit__(self, *exc_info):
+        self._task.cancel()
+
+
+async def measure(name, codec, data, args):
+    size_mb = len(data) / 1024 / 1024
+    compressed_size = len(data)
+    compress_mbps = None
+    if codec is not None:
+        started = time.perf_counter()
+        compressed_size = sum([len(part) async for part in compress_parts(BytesIO(data), codec, 8 * 1024 * 1024)])
+        compress_mbps = round(size_mb / (time.perf_counter() - started), 1)
+
+    backend = FakeS3Backend(latency_s=args.latency_ms / 1000, stream_bandwidth_bps=args.stream_mbps * 1024 * 1024)
+    compression = CompressionPolicy(codec) if codec is not None else None
+    repository = SomeStuffRepository(FakeAioClient(backend), bucket=BUCKET, compression=compression)
+    async with LoopLag() as lag:
+        started = time.perf_counter()
+        await repository.put_some_stuff(OBJECT_NAME, BytesIO(data), "text/csv")
+        put_s = time.perf_counter() - started
+        started = time.perf_counter()
+        async with await repository.get_some_stuff(OBJECT_NAME) as body:
+            received = await body.read()
+        get_s = time.perf_counter() - started
+    assert received == data, name
+    return {
+        "codec": name,
+        "ratio": round(len(data) / compressed_size, 2),
+        "compress_MB/s": compress_mbps,
+        "put_MB/s": round(size_mb / put_s, 1),
+        "get_MB/s": round(size_mb / get_s, 1),
+        "max_loop_lag_ms": round(lag.max_lag_s * 1000, 1),
+    }
+
+
+async def main(args):
+    data = csv_data(args.size_mb * 1024 * 1024)
+    rows = [await measure(name, codec, data, args) for name, codec in codecs()]
+    print_table(rows, ["codec", "ratio", "compress_MB/s", "put_MB/s", "get_MB/s", "max_loop_lag_ms"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--stream-mbps", type=float, default=100)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    asyncio.run(main(parser.parse_args()))
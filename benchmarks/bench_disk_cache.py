@@ -0,0 +1,75 @@
+"""get_some_stuff throughput from S3 vs from the disk cache tier.
+
+Reads a working set of objects through SomeStuffRepository against the in-memory fake, first
+without a cache and then with a DiskCache in a temporary directory: once cold (every read
+fetches and writes its file), then warm (fresh entries, read through mmap) and revalidating
+(every read a conditional GET answered 304). Run from the repository root::
+
+    python -m benchmarks.bench_disk_cache --objects 200 --size-kb 256 --latency-ms 5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from io import BytesIO
+
+from benchmarks.common import print_table
+from benchmarks.fake_s3 import FakeAioClient, FakeS3Backend
+from disk_cache import DiskCache
+from repo_s3 import SomeStuffRepository
+
+BUCKET = "bench"
+
+
+async def read_all(repository, keys, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def read(key):
+        async with semaphore:
+            async with await repository.get_some_stuff(key) as body:
+                return len(await body.read())
+
+    started = time.perf_counter()
+    total = sum(await asyncio.gather(*(read(key) for key in keys)))
+    return total, time.perf_counter() - started
+
+
+def row(name, total, elapsed_s, keys, stats=None):
+    return {
+        "tier": name,
+        "reads": len(keys),
+        "MB/s": round(total / 1024 / 1024 / elapsed_s, 1),
+        "reads/s": round(len(keys) / elapsed_s, 1),
+        "hits": stats.hits if stats else None,
+        "revalidations": stats.revalidations if stats else None,
+    }
+
+
+async def main(args):
+    backend = FakeS3Backend(latency_s=args.latency_ms / 1000)
+    keys = [f"object-{i}" for i in range(args.objects)]
+    uploader = SomeStuffRepository(FakeAioClient(backend), bucket=BUCKET)
+    for key in keys:
+        await uploader.put_some_stuff(key, BytesIO(os.urandom(args.size_kb * 1024)), "image/jpeg")
+
+    rows = [row("s3", *await read_all(uploader, keys, args.concurrency), keys)]
+    with tempfile.TemporaryDirectory() as directory:
+        disk_cache = DiskCache(directory, max_bytes=2 * args.objects * args.size_kb * 1024, ttl_s=3600)
+        repository = SomeStuffRepository(FakeAioClient(backend), bucket=BUCKET, disk_cache=disk_cache)
+        rows.append(row("disk cold", *await read_all(repository, keys, args.concurrency), keys))
+        rows.append(row("disk warm", *await read_all(repository, keys, args.concurrency), keys, disk_cache.stats))
+        disk_cache.ttl_s = 0
+        rows.append(row("disk revalidating", *await read_all(repository, keys, args.concurrency), keys,
+                        disk_cache.stats))
+        await disk_cache.close()
+    print_table(rows, ["tier", "reads", "MB/s", "reads/s", "hits", "revalidations"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--objects", type=int, default=200)
+    parser.add_argument("--size-kb", type=int, default=256)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=16)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,68 @@
+"""Single-stream get_some_stuff vs concurrent ranged GETs of one large object.
+
+Every fake response stream is throttled to --stream-mbps, so the single-stream path is
+bandwidth bound the way one TCP connection to MinIO is. Run from the repository root::
+
+    python -m benchmarks.bench_parallel_download --size-mb 64 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.common import print_table
+from benchmarks.fake_s3 import FakeAioClient, FakeS3Backend
+from repo_s3 import SomeStuffRepository
+
+OBJECT_NAME = "large.csv"
+
+
+async def single_stream(repository, size):
+    body = await repository.get_some_stuff(OBJECT_NAME)
+    received = 0
+    async for chunk in body.iter_chunks(1024 * 1024):
+        received += len(chunk)
+    return received
+
+
+async def parallel_buffer(repository, size, part_size, concurrency):
+    buffer = bytearray(size)
+    return await repository.download_some_stuff_parallel(OBJECT_NAME, buffer, part_size, concurrency)
+
+
+async def parallel_iterator(repository, size, part_size, concurrency):
+    received = 0
+    async for chunk in repository.iter_some_stuff_parallel(OBJECT_NAME, part_size, concurrency):
+        received += len(chunk)
+    return received
+
+
+async def main(args):
+    size = args.size_mb * 1024 * 1024
+    part_size = args.part_size_mb * 1024 * 1024
+    backend = FakeS3Backend(latency_s=args.latency_ms / 1000, stream_bandwidth_bps=args.stream_mbps * 1024 * 1024)
+    repository = SomeStuffRepository(FakeAioClient(backend), bucket="bench")
+    backend.store("bench", OBJECT_NAME, os.urandom(size), "text/csv")
+
+    rows = []
+    for name, download in (
+        ("get_some_stuff", lambda: single_stream(repository, size)),
+        ("download_some_stuff_parallel", lambda: parallel_buffer(repository, size, part_size, args.concurrency)),
+        ("iter_some_stuff_parallel", lambda: parallel_iterator(repository, size, part_size, args.concurrency)),
+    ):
+        started = time.perf_counter()
+        received = await download()
+        elapsed = time.perf_counter() - started
+        assert received == size, (name, received, size)
+        rows.append({"method": name, "elapsed_s": round(elapsed, 3), "MB/s": round(args.size_mb / elapsed, 1)})
+    print_table(rows, ["method", "elapsed_s", "MB/s"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=64)
+    parser.add_argument("--part-size-mb", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stream-mbps", type=float, default=100)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    asyncio.run(main(parser.parse_args()))
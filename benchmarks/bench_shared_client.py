@@ -0,0 +1,92 @@
+"""First-request latency and steady-state throughput: per-container client vs shared client.
+
+"per-container" opens a client through sessions.get_async_client for every unit of work,
+which is what providers.Resource did when each container was initialised on its own.
+"shared" starts sessions.SharedAsyncClient once, optionally prewarming its pool.
+Needs moto[server]. Run from the repository root::
+
+    python -m benchmarks.bench_shared_client --rounds 20 --requests 50 --concurrency 10
+"""
+import argparse
+import asyncio
+import time
+from unittest import mock
+
+import session
+from benchmarks.common import print_table, run_concurrently
+from benchmarks.fake_s3 import moto_server
+from repo_s3 import SomeStuffRepository
+
+BUCKET = "bench"
+OBJECT_NAME = "photo_index.jpeg"
+
+
+async def timed_first_request(repository):
+    started = time.perf_counter()
+    await repository.get_some_stuff_metadata(OBJECT_NAME)
+    return time.perf_counter() - started
+
+
+async def per_container(args):
+    first_requests, rows = [], []
+    for _ in range(args.rounds):
+        started = time.perf_counter()
+        clients = session.get_async_client()
+        client = await anext(clients)
+        repository = SomeStuffRepository(client, bucket=BUCKET)
+        first_requests.append(time.perf_counter() - started + await timed_first_request(repository))
+        rows.append(await run_concurrently(
+            lambda i: repository.get_some_stuff_metadata(OBJECT_NAME), args.requests, args.concurrency
+        ))
+        await clients.aclose()
+    return first_requests, rows
+
+
+async def shared(args, prewarm):
+    shared_client = session.SharedAsyncClient()
+    started = time.perf_counter()
+    await shared_client.start(prewarm=prewarm)
+    startup_s = time.perf_counter() - started
+    first_requests, rows = [], []
+    try:
+        for _ in range(args.rounds):
+            repository = SomeStuffRepository(shared_client.client, bucket=BUCKET)
+            first_requests.append(await timed_first_request(repository))
+            rows.append(await run_concurrently(
+                lambda i: repository.get_some_stuff_metadata(OBJECT_NAME), args.requests, args.concurrency
+            ))
+    finally:
+        await shared_client.stop()
+    return startup_s, first_requests, rows
+
+
+def summary(name, first_requests, rows, startup_s=0.0):
+    return {
+        "client": name,
+        "startup_ms": round(startup_s * 1000, 2),
+        "first_request_ms": round(first_requests[0] * 1000, 2),
+        "mean_first_request_ms": round(sum(first_requests) / len(first_requests) * 1000, 2),
+        "throughput_rps": round(sum(row["throughput_rps"] for row in rows) / len(rows), 1),
+        "p99_ms": max(row["p99_ms"] for row in rows),
+    }
+
+
+async def main(args):
+    with moto_server(BUCKET) as endpoint, \
+            mock.patch.multiple(session.settings, S3_ENDPOINT=endpoint, S3_BUCKET=BUCKET,
+                                S3_ACCESS_KEY="bench", S3_SECRET_KEY="bench"):
+        async with session._create_client() as client:
+            await client.put_object(Bucket=BUCKET, Key=OBJECT_NAME, Body=b"\xff" * 1024)
+        rows = [summary("per-container", *await per_container(args))]
+        for prewarm in (False, True):
+            startup_s, first_requests, throughput_rows = await shared(args, prewarm)
+            rows.append(summary(f"shared prewarm={prewarm}", first_requests, throughput_rows, startup_s))
+    print_table(rows, ["client", "startup_ms", "first_request_ms", "mean_first_request_ms", "throughput_rps", "p99_ms"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed_s):
+    return {
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed_s, 4),
+        "throughput_rps": round(len(latencies) / elapsed_s, 2) if elapsed_s else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+async def run_concurrently(make_request, requests, concurrency):
+    """Run ``requests`` calls of ``make_request(i)`` with at most ``concurrency`` in flight.
+
+    Latency is measured from the moment a request is submitted, so time spent queued behind
+    the semaphore or behind a blocked event loop counts against it.
+    """
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(i, started):
+        async with semaphore:
+            await make_request(i)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(i, time.perf_counter()) for i in range(requests)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def print_table(rows, columns):
+    widths = {column: max(len(column), *(len(str(row.get(column, ""))) for row in rows)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row.get(column, "")).ljust(widths[column]) for column in columns))
@@ -0,0 +1,291 @@
+"""In-process S3 stand-in for benchmarks.
+
+``FakeBotoClient`` mimics the blocking boto3 client used by ``client.S3Client``: every call
+sleeps for ``latency_s`` the way a real round-trip to MinIO blocks the calling thread.
+``FakeAioClient`` mimics the aiobotocore client used by ``repo_s3.SomeStuffRepository`` and
+also limits every response stream to ``stream_bandwidth_bps``, like a single TCP connection.
+``moto_server`` runs moto's S3 over real HTTP for benchmarks that need connections and a
+real botocore client.
+"""
+import asyncio
+import logging
+import re
+import socket
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from hashlib import md5
+
+from botocore.exceptions import ClientError
+
+STORED_HEADERS = ("Metadata", "ContentEncoding", "ChecksumCRC32", "ChecksumCRC32C", "ChecksumSHA256", "ChecksumType")
+
+
+def _returned_headers(stored, checksum_mode):
+    """Stored headers as S3 returns them: checksums only when asked for with ChecksumMode."""
+    if checksum_mode == "ENABLED":
+        return stored["headers"]
+    return {name: value for name, value in stored["headers"].items() if not name.startswith("Checksum")}
+
+
+class FakeS3Backend:
+    def __init__(self, latency_s=0.0, stream_bandwidth_bps=None):
+        self.latency_s = latency_s
+        self.stream_bandwidth_bps = stream_bandwidth_bps
+        self.objects = {}
+
+    def wait(self):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+    def store(self, bucket, key, data, content_type="binary/octet-stream", headers=None):
+        self.objects[bucket, key] = {
+            "data": bytes(data),
+            "ETag": f'"{md5(data).hexdigest()}"',
+            "ContentType": content_type,
+            "LastModified": datetime.now(timezone.utc),
+            # stored object headers returned by get/head, e.g. Metadata and ContentEncoding
+            "headers": {name: value for name, value in (headers or {}).items() if name in STORED_HEADERS},
+        }
+        return self.objects[bucket, key]
+
+    async def send(self, data):
+        """Wait as long as uploading ``data`` takes at ``stream_bandwidth_bps``."""
+        if self.stream_bandwidth_bps and data:
+            await asyncio.sleep(len(data) / self.stream_bandwidth_bps)
+
+    def check_conditions(self, stored, operation, if_match=None, if_none_match=None):
+        if if_match is not None and if_match != stored["ETag"]:
+            raise ClientError(
+                {"Error": {"Code": "PreconditionFailed"}, "ResponseMetadata": {"HTTPStatusCode": 412}}, operation
+            )
+        if if_none_match is not None and if_none_match == stored["ETag"]:
+            raise ClientError(
+                {"Error": {"Code": "304", "Message": "Not Modified"}, "ResponseMetadata": {"HTTPStatusCode": 304}},
+                operation,
+            )
+
+    def delete_many(self, bucket, delete):
+        deleted = []
+        for obj in delete["Objects"]:
+            self.objects.pop((bucket, obj["Key"]), None)
+            deleted.append({"Key": obj["Key"]})
+        return {**({} if delete.get("Quiet") else {"Deleted": deleted}), **_metadata()}
+
+    def lookup(self, bucket, key, operation):
+        try:
+            return self.objects[bucket, key]
+        except KeyError:
+            raise ClientError(
+                {
+                    "Error": {"Code": "NoSuchKey", "Message": "The specified key does not exist."},
+                    "ResponseMetadata": {"HTTPStatusCode": 404},
+                },
+                operation,
+            ) from None
+
+
+@contextmanager
+def moto_server(bucket):
+    """Yield the endpoint URL of a local moto S3 server with ``bucket`` created."""
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    endpoint = f"http://127.0.0.1:{port}"
+    try:
+        boto3.client(
+            "s3", endpoint_url=endpoint, aws_access_key_id="bench", aws_secret_access_key="bench", region_name="us-east-1"
+        ).create_bucket(Bucket=bucket)
+        yield endpoint
+    finally:
+        server.stop()
+
+
+def _metadata(status_code=200):
+    return {"ResponseMetadata": {"HTTPStatusCode": status_code}}
+
+
+class FakeBotoClient:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def put_object(self, Bucket, Key, Body, ContentType="binary/octet-stream", **kwargs):
+        self.backend.wait()
+        data = Body.read() if hasattr(Body, "read") else Body
+        stored = self.backend.store(Bucket, Key, data, ContentType)
+        return {"ETag": stored["ETag"], **_metadata()}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, IfNoneMatch=None, **kwargs):
+        self.backend.wait()
+        stored = self.backend.lookup(Bucket, Key, "GetObject")
+        self.backend.check_conditions(stored, "GetObject", IfMatch, IfNoneMatch)
+        from io import BytesIO
+
+        from botocore.response import StreamingBody
+
+        data, status_code, extra = stored["data"], 200, {}
+        if Range is not None:
+            start, end = re.fullmatch(r"bytes=(\d+)-(\d*)", Range).groups()
+            start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+            extra["ContentRange"] = f"bytes {start}-{end}/{len(data)}"
+            data, status_code = data[start:end + 1], 206
+        return {
+            "Body": StreamingBody(BytesIO(data), len(data)),
+            "ContentLength": len(data),
+            "ContentType": stored["ContentType"],
+            "ETag": stored["ETag"],
+            **extra,
+            **_metadata(status_code),
+        }
+
+    def download_fileobj(self, Bucket, Key, Fileobj, **kwargs):
+        self.backend.wait()
+        Fileobj.write(self.backend.lookup(Bucket, Key, "HeadObject")["data"])
+
+    def head_object(self, Bucket, Key, ChecksumMode=None, **kwargs):
+        self.backend.wait()
+        stored = self.backend.lookup(Bucket, Key, "HeadObject")
+        return {
+            "ContentLength": len(stored["data"]),
+            "ContentType": stored["ContentType"],
+            "ETag": stored["ETag"],
+            "LastModified": stored["LastModified"],
+            **_returned_headers(stored, ChecksumMode),
+            **_metadata(),
+        }
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.backend.wait()
+        self.backend.objects.pop((Bucket, Key), None)
+        return _metadata(204)
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self.backend.wait()
+        return self.backend.delete_many(Bucket, Delete)
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        self.backend.wait()
+        source = self.backend.lookup(CopySource["Bucket"], CopySource["Key"], "CopyObject")
+        stored = self.backend.store(Bucket, Key, source["data"], source["ContentType"], source["headers"])
+        return {"CopyObjectResult": {"ETag": stored["ETag"]}, **_metadata()}
+
+
+class FakeStreamingBody:
+    def __init__(self, data, bandwidth_bps=None):
+        self._data = memoryview(data)
+        self._position = 0
+        self._bandwidth_bps = bandwidth_bps
+
+    async def read(self, amt=None):
+        end = len(self._data) if amt is None else min(len(self._data), self._position + amt)
+        chunk = bytes(self._data[self._position:end])
+        self._position = end
+        if self._bandwidth_bps and chunk:
+            await asyncio.sleep(len(chunk) / self._bandwidth_bps)
+        return chunk
+
+    async def iter_chunks(self, chunk_size=1024):
+        while chunk := await self.read(chunk_size):
+            yield chunk
+
+    def iter_any(self):
+        return self.iter_chunks(64 * 1024)
+
+    def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class FakeAioClient:
+    def __init__(self, backend):
+        self.backend = backend
+        self.uploads = {}
+
+    async def wait(self):
+        if self.backend.latency_s:
+            await asyncio.sleep(self.backend.latency_s)
+
+    async def put_object(self, Bucket, Key, Body, ContentType="binary/octet-stream", **kwargs):
+        await self.wait()
+        data = Body.read() if hasattr(Body, "read") else Body
+        await self.backend.send(data)
+        stored = self.backend.store(Bucket, Key, data, ContentType, kwargs)
+        return {"ETag": stored["ETag"], **_metadata()}
+
+    async def get_object(self, Bucket, Key, Range=None, IfMatch=None, IfNoneMatch=None, ChecksumMode=None, **kwargs):
+        await self.wait()
+        stored = self.backend.lookup(Bucket, Key, "GetObject")
+        self.backend.check_conditions(stored, "GetObject", IfMatch, IfNoneMatch)
+        data, status_code, extra = stored["data"], 200, {}
+        if Range is not None:
+            start, end = re.fullmatch(r"bytes=(\d+)-(\d*)", Range).groups()
+            start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+            extra["ContentRange"] = f"bytes {start}-{end}/{len(data)}"
+            data, status_code = data[start:end + 1], 206
+        return {
+            "Body": FakeStreamingBody(data, self.backend.stream_bandwidth_bps),
+            "ContentLength": len(data),
+            "ContentType": stored["ContentType"],
+            "ETag": stored["ETag"],
+            **_returned_headers(stored, ChecksumMode if Range is None else None),
+            **extra,
+            **_metadata(status_code),
+        }
+
+    async def head_object(self, Bucket, Key, ChecksumMode=None, **kwargs):
+        await self.wait()
+        stored = self.backend.lookup(Bucket, Key, "HeadObject")
+        return {
+            "ContentLength": len(stored["data"]),
+            "ContentType": stored["ContentType"],
+            "ETag": stored["ETag"],
+            "LastModified": stored["LastModified"],
+            **_returned_headers(stored, ChecksumMode),
+            **_metadata(),
+        }
+
+    async def delete_object(self, Bucket, Key, **kwargs):
+        await self.wait()
+        self.backend.objects.pop((Bucket, Key), None)
+        return _metadata(204)
+
+    async def delete_objects(self, Bucket, Delete, **kwargs):
+        await self.wait()
+        return self.backend.delete_many(Bucket, Delete)
+
+    async def create_multipart_upload(self, Bucket, Key, ContentType="binary/octet-stream", **kwargs):
+        await self.wait()
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = {"Bucket": Bucket, "Key": Key, "ContentType": ContentType, "headers": kwargs,
+                                   "parts": {}}
+        return {"UploadId": upload_id, **_metadata()}
+
+    async def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        await self.wait()
+        await self.backend.send(Body)
+        self.uploads[UploadId]["parts"][PartNumber] = bytes(Body)
+        return {"ETag": f'"{md5(Body).hexdigest()}"', **_metadata()}
+
+    async def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        await self.wait()
+        upload = self.uploads.pop(UploadId)
+        data = b"".join(upload["parts"][part["PartNumber"]] for part in MultipartUpload["Parts"])
+        # a FULL_OBJECT checksum comes with the completion
+        stored = self.backend.store(Bucket, Key, data, upload["ContentType"], {**upload["headers"], **kwargs})
+        return {"ETag": stored["ETag"], **_metadata()}
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        await self.wait()
+        self.uploads.pop(UploadId, None)
+        return _metadata(204)
@@ -0,0 +1,264 @@
+"""Reproducible put/get/head/delete benchmark of SomeStuffRepository and S3Client.
+
+Runs every adapter x operation x object size x concurrency combination against a local S3
+stand-in (the in-process fake, or moto's server with --backend moto), prints a table and
+writes machine-readable results. Run from the repository root::
+
+    python -m benchmarks.suite --sizes 1KB,1MB,64MB --concurrency 1,16 --output bench.json
+    python -m benchmarks.suite --output new.json --compare bench.json
+
+With --compare the run fails when throughput drops or p99 latency grows by more than
+--tolerance against the baseline file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from io import BytesIO
+from unittest import mock
+
+from benchmarks.common import print_table, run_concurrently
+from benchmarks.fake_s3 import FakeAioClient, FakeBotoClient, FakeS3Backend, moto_server
+
+BUCKET = "bench"
+OPERATIONS = ("put", "get", "head", "delete")
+ADAPTERS = ("repository", "client")
+UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+COLUMNS = ["adapter", "operation", "size", "concurrency", "requests", "throughput_rps", "throughput_mbps",
+           "p50_ms", "p99_ms", "peak_rss_mb"]
+
+
+def parse_size(value):
+    number = value.rstrip("BKMG")
+    unit = value[len(number):] or "B"
+    return int(float(number) * UNITS[unit])
+
+
+def format_size(size):
+    for unit in ("GB", "MB", "KB"):
+        if size >= UNITS[unit] and size % UNITS[unit] == 0:
+            return f"{size // UNITS[unit]}{unit}"
+    return f"{size}B"
+
+
+class RssSampler:
+    """Peak resident set size while the block runs, sampled from /proc where available."""
+
+    def __init__(self, interval_s=0.005):
+        self.interval_s = interval_s
+        self.peak = 0
+        self._stop = threading.Event()
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def current(self):
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * self._page_size
+        except OSError:
+            # ru_maxrss is the lifetime peak: KiB on Linux, bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    def _sample(self):
+        while not self._stop.wait(self.interval_s):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+class RepositoryTarget:
+    name = "repository"
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    async def put(self, key, payload):
+        await self.repository.put_some_stuff(key, BytesIO(payload), "binary/octet-stream")
+
+    async def get(self, key):
+        async with await self.repository.get_some_stuff(key) as body:
+            await body.read()
+
+    async def head(self, key):
+        await self.repository.get_some_stuff_metadata(key)
+
+    async def delete(self, key):
+        await self.repository.remove_some_stuff(key)
+
+
+class ClientTarget:
+    name = "client"
+
+    def __init__(self, s3_client):
+        self.s3_client = s3_client
+
+    async def put(self, key, payload):
+        await self.s3_client.put_binary_file(key, payload, "binary/octet-stream")
+
+    async def get(self, key):
+        await self.s3_client.get_binary_file(key)
+
+    async def head(self, key):
+        await self.s3_client.get_file_metadata(key)
+
+    async def delete(self, key):
+        await self.s3_client.remove_file(key)
+
+
+async def open_targets(args, stack):
+    import client
+    from repo_s3 import SomeStuffRepository
+
+    targets = {}
+    if args.backend == "fake":
+        backend = FakeS3Backend(latency_s=args.latency_ms / 1000)
+        if "repository" in args.adapters:
+            targets["repository"] = RepositoryTarget(SomeStuffRepository(FakeAioClient(backend), bucket=BUCKET))
+        if "client" in args.adapters:
+            with mock.patch("boto3.client", return_value=FakeBotoClient(backend)), \
+                    mock.patch.object(client.get_settings(), "s3_bucket", BUCKET):
+                s3_client = client.S3Client()
+            stack.callback(s3_client.close)
+            targets["client"] = ClientTarget(s3_client)
+        return targets
+
+    import session
+
+    endpoint = stack.enter_context(moto_server(BUCKET))
+    credentials = {"S3_ENDPOINT": endpoint, "S3_BUCKET": BUCKET, "S3_ACCESS_KEY": "bench", "S3_SECRET_KEY": "bench"}
+    stack.enter_context(mock.patch.multiple(session.settings, **credentials))
+    if "repository" in args.adapters:
+        aio_client = await stack.enter_async_context(session._create_client())
+        targets["repository"] = RepositoryTarget(SomeStuffRepository(aio_client, bucket=BUCKET))
+    if "client" in args.adapters:
+        client_settings = {name.lower(): value for name, value in credentials.items()}
+        with mock.patch.multiple(client.get_settings(), **client_settings):
+            s3_client = client.S3Client()
+        stack.callback(s3_client.close)
+        targets["client"] = ClientTarget(s3_client)
+    return targets
+
+
+async def run_scenario(target, operation, size, concurrency, requests, payload):
+    keys = [f"{target.name}/{format_size(size)}/{concurrency}/{i}" for i in range(requests)]
+    if operation != "put":
+        # the objects must exist before they can be read or deleted
+        await run_concurrently(lambda i: target.put(keys[i], payload), requests, concurrency)
+    call = getattr(target, operation)
+    make_request = (lambda i: call(keys[i], payload)) if operation == "put" else (lambda i: call(keys[i]))
+    with RssSampler() as rss:
+        result = await run_concurrently(make_request, requests, concurrency)
+    if operation in ("put", "get"):
+        result["throughput_mbps"] = round(result["throughput_rps"] * size / UNITS["MB"], 2)
+    if operation != "delete":
+        await run_concurrently(lambda i: target.delete(keys[i]), requests, concurrency)
+    return {
+        "adapter": target.name,
+        "operation": operation,
+        "size": format_size(size),
+        "concurrency": concurrency,
+        **result,
+        "peak_rss_mb": round(rss.peak / UNITS["MB"], 1),
+    }
+
+
+def scenario_key(row):
+    return row["adapter"], row["operation"], row["size"], row["concurrency"]
+
+
+def compare(results, baseline, tolerance):
+    """Return the scenarios that regressed against ``baseline`` by more than ``tolerance``."""
+    previous = {scenario_key(row): row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        before = previous.get(scenario_key(row))
+        if before is None:
+            continue
+        if row["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append((row, "throughput_rps", before["throughput_rps"], row["throughput_rps"]))
+        if row["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            regressions.append((row, "p99_ms", before["p99_ms"], row["p99_ms"]))
+    return regressions
+
+
+async def main(args):
+    results = []
+    async with AsyncExitStack() as stack:
+        targets = await open_targets(args, stack)
+        for size in args.sizes:
+            payload = bytes(size)
+            # fewer requests for large objects, so every scenario moves a comparable amount of data
+            requests = max(1, min(args.requests, args.max_bytes_per_scenario // size))
+            # more workers than requests would idle; levels above the request count collapse into one
+            concurrency_levels = list(dict.fromkeys(min(concurrency, requests) for concurrency in args.concurrency))
+            for target in targets.values():
+                for operation in args.operations:
+                    for concurrency in concurrency_levels:
+                        results.append(await run_scenario(target, operation, size, concurrency, requests, payload))
+            del payload
+
+    print_table(results, COLUMNS)
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "backend": args.backend,
+            "latency_ms": args.latency_ms if args.backend == "fake" else None,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for row, metric, before, after in regressions:
+            print(f"REGRESSION {'/'.join(map(str, scenario_key(row)))} {metric}: {before} -> {after}")
+        if regressions:
+            return 1
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("fake", "moto"), default="fake")
+    parser.add_argument("--latency-ms", type=float, default=1, help="simulated round-trip of the fake backend")
+    parser.add_argument("--adapters", type=lambda value: value.split(","), default=list(ADAPTERS))
+    parser.add_argument("--operations", type=lambda value: value.split(","), default=list(OPERATIONS))
+    parser.add_argument("--sizes", type=lambda value: [parse_size(size) for size in value.split(",")],
+                        default=[parse_size(size) for size in ("1KB", "64KB", "1MB", "16MB")],
+                        help="comma separated object sizes, 1KB up to 1GB")
+    parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")],
+                        default=[1, 16])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--max-bytes-per-scenario", type=parse_size, default=parse_size("256MB"))
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON file from a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    exit_code = asyncio.run(main(parse_args()))
+    print(f"finished in {time.perf_counter() - started:.1f}s")
+    sys.exit(exit_code)
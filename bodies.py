@@ -0,0 +1,249 @@
+import asyncio
+import mmap
+import os
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, Callable
+
+from botocore.exceptions import FlexibleChecksumError
+
+DEFAULT_CHUNK_SIZE = 1024
+# compressed bytes handed to the decompressor at a time
+DECOMPRESS_READ_SIZE = 64 * 1024
+# what iter_any of a wrapping body asks the wrapped one for at a time
+ANY_READ_SIZE = 64 * 1024
+
+
+class BytesBody:
+    """In-memory stand-in for aiobotocore's ``StreamingBody``.
+
+    Returned for bodies that are already in memory (e.g. served from a cache), so callers
+    can keep using ``read``/``iter_chunks``/``iter_any`` and ``async with``.
+    """
+
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+        self._position = 0
+
+    async def read(self, amt: int | None = None) -> bytes:
+        if self._position == 0 and (amt is None or amt >= len(self._data)):
+            self._position = len(self._data)
+            return self._data
+        end = len(self._data) if amt is None else min(len(self._data), self._position + amt)
+        chunk = self._data[self._position:end]
+        self._position = end
+        return chunk
+
+    async def iter_chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        while chunk := await self.read(chunk_size):
+            yield chunk
+
+    async def iter_any(self) -> AsyncIterator[bytes]:
+        if chunk := await self.read():
+            yield chunk
+
+    def close(self) -> None:
+        self._position = len(self._data)
+
+    async def __aenter__(self) -> 'BytesBody':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+
+class MappedBody:
+    """Body reading a file through ``mmap``, e.g. an object served from the disk cache.
+
+    ``buffer`` is a zero-copy view of the whole file for readers that accept one; ``read``
+    returns copies like every other body. The mapping outlives the file being replaced or
+    unlinked, so an eviction doesn't cut a read short.
+    """
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        with open(path, 'rb') as file:
+            self._size = os.fstat(file.fileno()).st_size
+            # empty files can't be mapped
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self._size else None
+        self._position = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def buffer(self) -> memoryview:
+        return memoryview(self._mmap if self._mmap is not None else b'')
+
+    async def read(self, amt: int | None = None) -> bytes:
+        if self._mmap is None:
+            return b''
+        end = self._size if amt is None else min(self._size, self._position + amt)
+        chunk = self._mmap[self._position:end]
+        self._position = end
+        return chunk
+
+    async def iter_chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        while chunk := await self.read(chunk_size):
+            yield chunk
+
+    async def iter_any(self) -> AsyncIterator[bytes]:
+        if chunk := await self.read():
+            yield chunk
+
+    def close(self) -> None:
+        self._position = self._size
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # views of buffer are still alive; the mapping goes with the last of them
+                pass
+            self._mmap = None
+
+    async def __aenter__(self) -> 'MappedBody':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+
+class ChainedBody:
+    """Bodies read one after the other as one, e.g. the part of a body already read and the rest of it."""
+
+    def __init__(self, *bodies: Any) -> None:
+        self._bodies = list(bodies)
+
+    async def read(self, amt: int | None = None) -> bytes:
+        if amt is None:
+            chunks = [await body.read() for body in self._bodies]
+            self.close()
+            return b''.join(chunks)
+        while self._bodies:
+            if chunk := await self._bodies[0].read(amt):
+                return chunk
+            self._bodies.pop(0).close()
+        return b''
+
+    async def iter_chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        while chunk := await self.read(chunk_size):
+            yield chunk
+
+    async def iter_any(self) -> AsyncIterator[bytes]:
+        while chunk := await self.read(ANY_READ_SIZE):
+            yield chunk
+
+    def close(self) -> None:
+        while self._bodies:
+            self._bodies.pop(0).close()
+
+    async def __aenter__(self) -> 'ChainedBody':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+
+class DecompressingBody:
+    """Decode a compressed ``StreamingBody`` as it is read, with the same reading interface.
+
+    Compressed data is read ``read_size`` bytes at a time and decompressed in ``executor``
+    (the loop's default one when None), off the event loop.
+    """
+
+    def __init__(self, body: Any, decompressor: Any, executor: Executor | None = None,
+                 read_size: int = DECOMPRESS_READ_SIZE) -> None:
+        self._body = body
+        self._decompressor = decompressor
+        self._executor = executor
+        self._read_size = read_size
+        self._buffer = bytearray()
+        self._eof = False
+
+    async def _fill(self) -> None:
+        data = await self._body.read(self._read_size)
+        loop = asyncio.get_running_loop()
+        if data:
+            self._buffer += await loop.run_in_executor(self._executor, self._decompressor.decompress, data)
+        else:
+            self._buffer += self._decompressor.flush()
+            self._eof = True
+
+    async def read(self, amt: int | None = None) -> bytes:
+        while not self._eof and (amt is None or len(self._buffer) < amt):
+            await self._fill()
+        end = len(self._buffer) if amt is None else min(amt, len(self._buffer))
+        chunk = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        return chunk
+
+    async def iter_chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        while chunk := await self.read(chunk_size):
+            yield chunk
+
+    async def iter_any(self) -> AsyncIterator[bytes]:
+        while not self._eof or self._buffer:
+            if not self._buffer:
+                await self._fill()
+                continue
+            chunk = bytes(self._buffer)
+            self._buffer.clear()
+            yield chunk
+
+    def close(self) -> None:
+        self._body.close()
+
+    async def __aenter__(self) -> 'DecompressingBody':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+
+class ChecksumVerifyingBody:
+    """Check a ``StreamingBody`` against its stored checksum as it is read, raising ``error`` at the end on mismatch.
+
+    Chunks are hashed as they pass through, without being copied. ``checksum`` is None when the
+    body verifies itself (botocore does when asked for the checksum with ``ChecksumMode``); its
+    ``FlexibleChecksumError`` is then raised as ``error`` as well.
+    """
+
+    def __init__(self, body: Any, checksum: Any, expected: str, error: Callable[[str], Exception]) -> None:
+        self._body = body
+        self._checksum = checksum
+        self._expected = expected
+        self._error = error
+        self._verified = False
+
+    async def read(self, amt: int | None = None) -> bytes:
+        try:
+            chunk = await self._body.read(amt)
+        except FlexibleChecksumError as e:
+            raise self._error(str(e)) from e
+        if self._checksum is not None:
+            if chunk:
+                self._checksum.update(chunk)
+            if (not chunk or amt is None) and not self._verified:
+                self._verify()
+        return chunk
+
+    def _verify(self) -> None:
+        self._verified = True
+        actual = self._checksum.b64digest()
+        if actual != self._expected:
+            raise self._error(f'{self._checksum.algorithm} checksum mismatch: expected {self._expected}, got {actual}')
+
+    async def iter_chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        while chunk := await self.read(chunk_size):
+            yield chunk
+
+    async def iter_any(self) -> AsyncIterator[bytes]:
+        while chunk := await self.read(ANY_READ_SIZE):
+            yield chunk
+
+    def close(self) -> None:
+        self._body.close()
+
+    async def __aenter__(self) -> 'ChecksumVerifyingBody':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,225 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Hashable
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    negative_hits: int = 0
+    revalidations: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+@dataclass
+class CachedObject:
+    data: bytes
+    etag: str
+    content_type: str | None
+    validated_at: float
+
+
+@dataclass
+class CachedMetadata:
+    metadata: dict | None
+    error: Exception | None
+    expires_at: float
+
+
+class ObjectCache:
+    """Byte-bounded LRU of object bodies keyed by ``(bucket, key)``.
+
+    Entries younger than ``ttl_s`` are served without asking S3. Older entries are kept and
+    handed back for revalidation: the caller sends a conditional GET with ``IfNoneMatch`` on
+    the stored ETag and calls ``revalidated`` on a 304, or ``store`` with the new body.
+
+    ``stats`` counts hits (no request), revalidations (304) and misses (full transfer).
+    """
+
+    def __init__(self,
+                 max_bytes: int,
+                 ttl_s: float = 30.0,
+                 max_item_bytes: int | None = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.max_item_bytes = max_bytes if max_item_bytes is None else min(max_item_bytes, max_bytes)
+        self.stats = CacheStats()
+        self._clock = clock
+        self._entries: OrderedDict[tuple[str, str], CachedObject] = OrderedDict()
+        self._size = 0
+        # bumped by every invalidation, so a fetch that raced a write doesn't store the old body
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def lookup(self, bucket: str, key: str) -> CachedObject | None:
+        """Return the entry for ``key``, fresh or due for revalidation, and count a hit if it's fresh."""
+        entry = self._entries.get((bucket, key))
+        if entry is None:
+            return None
+        self._entries.move_to_end((bucket, key))
+        if self.is_fresh(entry):
+            self.stats.hits += 1
+        return entry
+
+    def is_fresh(self, entry: CachedObject) -> bool:
+        return self._clock() - entry.validated_at < self.ttl_s
+
+    def accepts(self, size: int | None) -> bool:
+        return size is not None and size <= self.max_item_bytes
+
+    def revalidated(self, entry: CachedObject) -> None:
+        self.stats.revalidations += 1
+        entry.validated_at = self._clock()
+
+    def record_miss(self) -> None:
+        self.stats.misses += 1
+
+    def store(self,
+              bucket: str,
+              key: str,
+              data: bytes,
+              etag: str,
+              content_type: str | None,
+              generation: int) -> None:
+        """Count a miss and cache ``data`` unless it's too large or ``key`` was invalidated since ``generation``."""
+        self.record_miss()
+        if generation != self.generation or not self.accepts(len(data)):
+            return
+        self._discard((bucket, key))
+        self._entries[(bucket, key)] = CachedObject(data, etag, content_type, self._clock())
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.data)
+            self.stats.evictions += 1
+
+    def invalidate(self, bucket: str, key: str) -> None:
+        self.generation += 1
+        self._discard((bucket, key))
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+        self._size = 0
+
+    def _discard(self, cache_key: tuple[str, str]) -> None:
+        entry = self._entries.pop(cache_key, None)
+        if entry is not None:
+            self._size -= len(entry.data)
+
+
+class MetadataCache:
+    """TTL cache of ``head_object`` responses keyed by ``(bucket, key)``, bounded to ``max_entries``.
+
+    Misses (404) are cached as well, for ``negative_ttl_s``, so repeated probes for a missing
+    key don't reach S3. The cache is only touched from the event loop thread and never awaits,
+    so concurrent coroutines can't interleave inside it; ``generation`` keeps a lookup that
+    raced a write or a delete from caching what it saw before.
+    """
+
+    def __init__(self,
+                 ttl_s: float = 5.0,
+                 negative_ttl_s: float = 1.0,
+                 max_entries: int = 10_000,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.ttl_s = ttl_s
+        self.negative_ttl_s = negative_ttl_s
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._clock = clock
+        self._entries: OrderedDict[tuple[str, str], CachedMetadata] = OrderedDict()
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, bucket: str, key: str) -> CachedMetadata | None:
+        entry = self._entries.get((bucket, key))
+        if entry is None or entry.expires_at <= self._clock():
+            if entry is not None:
+                del self._entries[(bucket, key)]
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end((bucket, key))
+        if entry.error is None:
+            self.stats.hits += 1
+        else:
+            self.stats.negative_hits += 1
+        return entry
+
+    def store(self, bucket: str, key: str, metadata: dict, generation: int) -> None:
+        self._store(bucket, key, CachedMetadata(metadata, None, self._clock() + self.ttl_s), generation)
+
+    def store_missing(self, bucket: str, key: str, error: Exception, generation: int) -> None:
+        self._store(bucket, key, CachedMetadata(None, error, self._clock() + self.negative_ttl_s), generation)
+
+    def invalidate(self, bucket: str, key: str) -> None:
+        self.generation += 1
+        self._entries.pop((bucket, key), None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+
+    def _store(self, bucket: str, key: str, entry: CachedMetadata, generation: int) -> None:
+        if generation != self.generation:
+            return
+        self._entries[(bucket, key)] = entry
+        self._entries.move_to_end((bucket, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+
+class PresignedUrlCache:
+    """LRU of presigned URLs, each handed out until ``refresh_margin_s`` before it expires.
+
+    Keys are whatever identifies a signature, e.g. ``(command, params, expires_in)``; the
+    margin leaves a client that gets a cached URL time to use it.
+    """
+
+    def __init__(self,
+                 max_entries: int = 10_000,
+                 refresh_margin_s: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_entries = max_entries
+        self.refresh_margin_s = refresh_margin_s
+        self.stats = CacheStats()
+        self._clock = clock
+        self._entries: OrderedDict[Hashable, tuple[str, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def now(self) -> float:
+        return self._clock()
+
+    def lookup(self, cache_key: Hashable) -> str | None:
+        entry = self._entries.get(cache_key)
+        if entry is None or entry[1] - self.refresh_margin_s <= self._clock():
+            if entry is not None:
+                del self._entries[cache_key]
+            self.stats.misses += 1
+            return None
+        self._entries.move_to_end(cache_key)
+        self.stats.hits += 1
+        return entry[0]
+
+    def store(self, cache_key: Hashable, url: str, expires_at: float) -> None:
+        """Cache ``url`` valid until ``expires_at``, on the clock read before it was signed."""
+        if expires_at - self.refresh_margin_s <= self._clock():
+            return
+        self._entries[cache_key] = (url, expires_at)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
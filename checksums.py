@@ -0,0 +1,165 @@
+import base64
+import hashlib
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, BinaryIO
+
+try:
+    import crc32c
+except ImportError:  # optional, only needed for CRC32C
+    crc32c = None
+
+# ChecksumType of a multipart object whose checksum covers the whole object, not the parts
+FULL_OBJECT = 'FULL_OBJECT'
+COMPOSITE = 'COMPOSITE'
+# bytes read from a stream per checksum update
+CHECKSUM_READ_SIZE = 1024 * 1024
+
+
+class Checksum(ABC):
+    """Running checksum with S3's flexible checksum encoding (base64 of the big-endian digest)."""
+    # ChecksumAlgorithm value; the checksum itself goes in ``Checksum<algorithm>``
+    algorithm: str
+    # S3 can only checksum the whole of a multipart object for CRCs, SHA-256 parts are COMPOSITE
+    checksum_type: str = COMPOSITE
+
+    @abstractmethod
+    def update(self, data: bytes) -> None: ...
+
+    @abstractmethod
+    def digest(self) -> bytes: ...
+
+    def b64digest(self) -> str:
+        return base64.b64encode(self.digest()).decode()
+
+
+class _Crc(Checksum):
+    checksum_type = FULL_OBJECT
+    # reflected polynomial, for combine
+    polynomial: int
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def digest(self) -> bytes:
+        return self.value.to_bytes(4, 'big')
+
+    def combine(self, value: int, length: int) -> None:
+        """Extend the checksum with that of ``length`` more bytes, without reading them again."""
+        self.value = _multmodp(_x2nmodp(length, 3, self.polynomial), self.value, self.polynomial) ^ value
+
+
+class Crc32Checksum(_Crc):
+    algorithm = 'CRC32'
+    polynomial = 0xEDB88320
+
+    def update(self, data: bytes) -> None:
+        self.value = zlib.crc32(data, self.value)
+
+
+class Crc32cChecksum(_Crc):
+    algorithm = 'CRC32C'
+    polynomial = 0x82F63B78
+
+    def __init__(self) -> None:
+        if crc32c is None:
+            raise ImportError('The CRC32C checksum needs the crc32c package')
+        super().__init__()
+
+    def update(self, data: bytes) -> None:
+        self.value = crc32c.crc32c(data, self.value)
+
+
+class Sha256Checksum(Checksum):
+    algorithm = 'SHA256'
+
+    def __init__(self) -> None:
+        self._hash = hashlib.sha256()
+
+    def update(self, data: bytes) -> None:
+        self._hash.update(data)
+
+    def digest(self) -> bytes:
+        return self._hash.digest()
+
+
+CHECKSUMS: dict[str, type[Checksum]] = {
+    Crc32Checksum.algorithm: Crc32Checksum,
+    Crc32cChecksum.algorithm: Crc32cChecksum,
+    Sha256Checksum.algorithm: Sha256Checksum,
+}
+
+
+def new_checksum(algorithm: str) -> Checksum:
+    try:
+        return CHECKSUMS[algorithm]()
+    except KeyError:
+        raise ValueError(f'Unknown checksum algorithm {algorithm!r}, expected one of {sorted(CHECKSUMS)}') from None
+
+
+def checksum_of(algorithm: str, data: bytes) -> Checksum:
+    checksum = new_checksum(algorithm)
+    checksum.update(data)
+    return checksum
+
+
+def read_checksummed(algorithm: str, data: BinaryIO, read_size: int = CHECKSUM_READ_SIZE) -> tuple[bytes, Checksum]:
+    """Read ``data`` to the end, checksumming it a chunk at a time; blocking, run it in an executor."""
+    checksum = new_checksum(algorithm)
+    chunks = []
+    while chunk := data.read(read_size):
+        checksum.update(chunk)
+        chunks.append(chunk)
+    return b''.join(chunks), checksum
+
+
+def checksum_kwargs(checksum: Checksum) -> dict[str, str]:
+    """Request kwargs sending ``checksum`` for S3 to check the upload against."""
+    return {'ChecksumAlgorithm': checksum.algorithm, f'Checksum{checksum.algorithm}': checksum.b64digest()}
+
+
+def stored_checksum(response: dict[str, Any]) -> tuple[str, str] | None:
+    """``(algorithm, value)`` of the whole-object checksum in a ``ChecksumMode='ENABLED'`` response.
+
+    None when there is none: the object was stored without one, or it is a multipart object
+    with a COMPOSITE checksum (``<checksum of part checksums>-<parts>``), which can't be checked
+    without the part boundaries.
+    """
+    if response.get('ChecksumType') == COMPOSITE:
+        return None
+    for algorithm in CHECKSUMS:
+        value = response.get(f'Checksum{algorithm}')
+        if value and '-' not in value:
+            return algorithm, value
+    return None
+
+
+# CRC combination as in zlib's crc32_combine: the CRC of A + B is CRC(A) * x^(8 * len(B)) + CRC(B)
+# modulo the polynomial, so parts checksummed separately give the whole object's checksum
+
+def _multmodp(a: int, b: int, polynomial: int) -> int:
+    """``a * b`` modulo the reflected ``polynomial``."""
+    m = 1 << 31
+    product = 0
+    while True:
+        if a & m:
+            product ^= b
+            if a & (m - 1) == 0:
+                return product
+        m >>= 1
+        b = (b >> 1) ^ polynomial if b & 1 else b >> 1
+
+
+def _x2nmodp(n: int, k: int, polynomial: int) -> int:
+    """``x^(n * 2^k)`` modulo the reflected ``polynomial``."""
+    power = 1 << 31
+    # x^(2^k)
+    square = 1 << 30
+    for _ in range(k):
+        square = _multmodp(square, square, polynomial)
+    while n:
+        if n & 1:
+            power = _multmodp(square, power, polynomial)
+        n >>= 1
+        square = _multmodp(square, square, polynomial)
+    return power
@@ -1,22 +1,66 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from functools import cache, partial
 from io import BytesIO
-from logging import exception
+from logging import DEBUG
 
-import boto3
-from botocore.client import Config
-from botocore.exceptions import ClientError
-from config import getLogger, settings
+from botocore.exceptions import ClientError, IncompleteReadError
 from fastapi import HTTPException, status
 
+from aio_utils import batched, bounded_as_completed, ordered_prefetch
+from caches import MetadataCache, ObjectCache, PresignedUrlCache
+from config import getLogger, get_settings
+from copies import COPY_MAX_CONCURRENCY, COPY_MAX_SIZE, COPY_PART_SIZE, copied_headers, copy_source_ranges
+from metrics import RequestMetrics, default_sink, loggable_kwargs
+from overload import BreakerPolicy, LimitPolicy, Overloaded, endpoint_guard
+from presigned import PresignedMultipartUpload, check_part_count, presign_cache_key
+from ranges import RangeResponse, parse_content_range
+from resilience import (
+    HEDGEABLE_COMMANDS,
+    RETRYABLE_COMMANDS,
+    DeadlineExceeded,
+    HedgePolicy,
+    Resilience,
+    RetryPolicy,
+    stream_position,
+)
+
 logger = getLogger("status_logger")
 
 
-class S3Client:
-    config = Config(
-        read_timeout=settings.s3_client_read_timeout_s, connect_timeout=settings.s3_client_connect_timeout_s
+EXECUTION_MODES = ("executor", "inline")
+STREAM_CHUNK_SIZE = 64 * 1024
+# DeleteObjects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+DELETE_MAX_CONCURRENCY = 4
+RANGE_MAX_CONCURRENCY = 4
+
+
+@cache
+def _boto_config():
+    from botocore.client import Config
+
+    settings = get_settings()
+    return Config(
+        read_timeout=settings.s3_client_read_timeout_s,
+        connect_timeout=settings.s3_client_connect_timeout_s,
+        max_pool_connections=settings.s3_http_pool_max_size,
     )
 
-    def __init__(self):
+
+class S3Client:
+    def __init__(self, execution_mode=None):
+        # boto3 takes a few hundred milliseconds to import, so it waits for the first client;
+        # boto3.client reuses the default session, which loads the S3 service model only once
+        import boto3
+
+        settings = get_settings()
+        execution_mode = execution_mode or settings.s3_client_execution_mode
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown S3 client execution mode {execution_mode!r}, expected one of {EXECUTION_MODES}")
         logger.debug("Creating minio client")
+        self.config = _boto_config()
         self.client = boto3.client(
             "s3",
             endpoint_url=settings.s3_endpoint,
@@ -26,8 +70,101 @@ class S3Client:
             region_name=settings.s3_region,
         )
         self.bucket = settings.s3_bucket
+        self.presign_expires_s = settings.s3_client_presign_expires_s
+        # boto3 is blocking: in "executor" mode every call goes to a pool no larger than
+        # the HTTP connection pool, so threads never wait on each other for a connection
+        self._executor = None
+        if execution_mode == "executor":
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.s3_http_pool_max_size,
+                thread_name_prefix="s3-client",
+            )
+        self.object_cache = None
+        if settings.s3_client_cache_max_bytes:
+            self.object_cache = ObjectCache(
+                max_bytes=settings.s3_client_cache_max_bytes,
+                ttl_s=settings.s3_client_cache_ttl_s,
+                max_item_bytes=settings.s3_client_cache_max_item_bytes,
+            )
+        self.request_metrics = None
+        if settings.s3_client_metrics_enabled:
+            self.request_metrics = RequestMetrics(
+                sink=default_sink,
+                adapter="s3_client",
+                pool_size=settings.s3_http_pool_max_size,
+                slow_request_threshold_s=settings.s3_client_slow_request_threshold_s or None,
+            )
+        self.resilience = None
+        retries_enabled = settings.s3_client_retry_max_attempts > 1 or settings.s3_client_request_deadline_s
+        if retries_enabled or settings.s3_client_hedge_reads:
+            hedge = HedgePolicy(percentile=settings.s3_client_hedge_percentile) if settings.s3_client_hedge_reads else None
+            self.resilience = Resilience(
+                retry=RetryPolicy(
+                    max_attempts=settings.s3_client_retry_max_attempts,
+                    base_delay_s=settings.s3_client_retry_base_delay_s,
+                    deadline_s=settings.s3_client_request_deadline_s or None,
+                ),
+                hedge=hedge,
+                max_in_flight=settings.s3_http_pool_max_size,
+            )
+        self.metadata_cache = None
+        if settings.s3_client_metadata_cache_ttl_s:
+            self.metadata_cache = MetadataCache(
+                ttl_s=settings.s3_client_metadata_cache_ttl_s,
+                negative_ttl_s=settings.s3_client_metadata_cache_negative_ttl_s,
+                max_entries=settings.s3_client_metadata_cache_max_entries,
+            )
+        self.presigned_url_cache = None
+        if settings.s3_client_presign_cache_max_entries:
+            self.presigned_url_cache = PresignedUrlCache(
+                max_entries=settings.s3_client_presign_cache_max_entries,
+                refresh_margin_s=settings.s3_client_presign_refresh_margin_s,
+            )
+        self.guard = None
+        if settings.s3_client_circuit_breaker_enabled or settings.s3_client_adaptive_concurrency:
+            breaker = None
+            if settings.s3_client_circuit_breaker_enabled:
+                breaker = BreakerPolicy(
+                    failure_rate=settings.s3_client_breaker_failure_rate,
+                    open_s=settings.s3_client_breaker_open_s,
+                    slow_call_s=settings.s3_client_breaker_slow_call_s or None,
+                )
+            # one guard per endpoint, shared by every S3Client of the process
+            self.guard = endpoint_guard(
+                str(settings.s3_endpoint),
+                settings.s3_http_pool_max_size,
+                breaker=breaker,
+                limit=LimitPolicy() if settings.s3_client_adaptive_concurrency else None,
+            )
+
+    async def _run(self, func, *args, **kwargs):
+        if self._executor is None:
+            return func(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
 
     async def _send_request(self, command, request_kwargs):
+        if self.request_metrics is None:
+            return await self._dispatch_request(command, request_kwargs)
+
+        token = self.request_metrics.started(request_kwargs)
+        response, code = None, 0
+        try:
+            response = await self._dispatch_request(command, request_kwargs)
+            code = response["ResponseMetadata"]["HTTPStatusCode"] if isinstance(response, dict) else status.HTTP_200_OK
+            return response
+        except HTTPException as e:
+            code = e.status_code
+            raise
+        finally:
+            self.request_metrics.finished(command, token, code, request_kwargs, response)
+
+    async def _dispatch_request(self, command, request_kwargs):
         try:
             request_command = getattr(self.client, command)
         except AttributeError:
@@ -36,12 +173,15 @@ class S3Client:
                 status_code=status.HTTP_501_NOT_IMPLEMENTED,
                 detail="Unexpected behavior",
             )
-        logger.debug(f"Sending request {command} with kwargs {request_kwargs}")
+        # the f-string would render the whole request Body even with debug logging off
+        if logger.isEnabledFor(DEBUG):
+            logger.debug(f"Sending request {command} with kwargs {loggable_kwargs(request_kwargs)}")
         try:
-            response = request_command(
-                Bucket=self.bucket,
-                **request_kwargs,
-            )
+            response = await self._call_client(command, request_command, request_kwargs)
+        except Overloaded as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+        except DeadlineExceeded as e:
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
         except ClientError as e:
             error = e.response.get("Error", {})
             try:
@@ -52,19 +192,62 @@ class S3Client:
                 status_code=code,
                 detail=error.get("Message", "Images storage communication problem"),
             )
-        logger.debug(f"S3 Client returning response {request_kwargs=}")
+        if logger.isEnabledFor(DEBUG):
+            logger.debug(f"S3 Client returning response request_kwargs={loggable_kwargs(request_kwargs)}")
         return response
 
+    async def _call_client(self, command, request_command, request_kwargs):
+        if self.resilience is None:
+            return await self._send_attempt(command, request_command, request_kwargs)
+        return await self._send_resilient_request(command, request_command, request_kwargs)
+
+    async def _send_attempt(self, command, request_command, request_kwargs):
+        """Send the request once; the guard counts every retry and hedge as a request of its own."""
+        # copies may target another bucket
+        send = partial(self._run, request_command, **{"Bucket": self.bucket, **request_kwargs})
+        if self.guard is None:
+            return await send()
+        return await self.guard.call(command, send)
+
+    async def _send_resilient_request(self, command, request_command, request_kwargs):
+        body = request_kwargs.get("Body")
+        position = stream_position(body)
+
+        async def attempt():
+            if position is not None:
+                body.seek(position)
+            return await self._send_attempt(command, request_command, request_kwargs)
+
+        # a partly consumed stream can only be sent again if it can be rewound
+        rewindable = body is None or isinstance(body, (bytes, bytearray, memoryview)) or position is not None
+        return await self.resilience.call(
+            command,
+            attempt,
+            retryable=command in RETRYABLE_COMMANDS and rewindable,
+            hedgeable=command in HEDGEABLE_COMMANDS,
+        )
+
+    def _invalidate(self, object_name):
+        if self.object_cache is not None:
+            self.object_cache.invalidate(self.bucket, object_name)
+        if self.metadata_cache is not None:
+            self.metadata_cache.invalidate(self.bucket, object_name)
+
     async def put_binary_file(self, object_name, data, content_type):
         request_kwargs = {
             "Key": object_name,
             "Body": data,
             "ContentType": content_type,
         }
-        result = await self._send_request("put_object", request_kwargs)
+        try:
+            result = await self._send_request("put_object", request_kwargs)
+        finally:
+            self._invalidate(object_name)
         return result
 
     async def get_binary_file(self, object_name):
+        if self.object_cache is not None:
+            return await self._get_binary_file_cached(object_name)
         buf = BytesIO()
         request_kwargs = {"Key": object_name, "Fileobj": buf}
         response = await self._send_request("download_fileobj", request_kwargs)
@@ -75,16 +258,356 @@ class S3Client:
             raise HTTPException(status_code=response.status, detail=message)
         return data
 
+    async def _get_binary_file_cached(self, object_name):
+        cache = self.object_cache
+        entry = cache.lookup(self.bucket, object_name)
+        if entry is not None and cache.is_fresh(entry):
+            return entry.data
+
+        request_kwargs = {"Key": object_name}
+        if entry is not None:
+            request_kwargs["IfNoneMatch"] = entry.etag
+        generation = cache.generation
+        try:
+            response = await self._send_request("get_object", request_kwargs)
+        except HTTPException as e:
+            if entry is not None and e.status_code == status.HTTP_304_NOT_MODIFIED:
+                cache.revalidated(entry)
+                return entry.data
+            raise
+
+        data = await self._run(response["Body"].read)
+        if not data:
+            message = f"Unexpected data content or empty {object_name=}"
+            logger.error(message)
+            raise HTTPException(status_code=response["ResponseMetadata"]["HTTPStatusCode"], detail=message)
+        cache.store(self.bucket, object_name, data, response["ETag"], response.get("ContentType"), generation)
+        return data
+
+    async def get_binary_file_stream(self, object_name, chunk_size=STREAM_CHUNK_SIZE):
+        """Return an async iterator over the object's chunks, e.g. for a FastAPI StreamingResponse.
+
+        The request is sent before returning, so a missing object raises HTTPException
+        before any response is started.
+        """
+        response = await self._send_request("get_object", {"Key": object_name})
+        return self._iter_body(response["Body"], chunk_size)
+
+    async def _iter_body(self, body, chunk_size):
+        try:
+            while chunk := await self._run(body.read, chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    async def get_binary_file_range(self, object_name, start, end=None, etag=None, chunk_size=STREAM_CHUNK_SIZE):
+        """Return a RangeResponse streaming bytes ``start`` to ``end`` inclusive (to the end when None).
+
+        A ``start`` past the object raises HTTPException 416; with ``etag`` a changed object raises 412.
+        """
+        request_kwargs = {"Key": object_name, "Range": f"bytes={start}-{'' if end is None else end}"}
+        if etag is not None:
+            request_kwargs["IfMatch"] = etag
+        response = await self._send_request("get_object", request_kwargs)
+        if "ContentRange" not in response:
+            response["Body"].close()
+            message = f"Range {request_kwargs['Range']} of {object_name=} was not honoured"
+            logger.error(message)
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=message)
+        byte_range, size = parse_content_range(response["ContentRange"])
+        return RangeResponse(
+            self._iter_body(response["Body"], chunk_size),
+            byte_range,
+            size,
+            response.get("ContentType"),
+            response.get("ETag"),
+            raw_body=response["Body"],
+        )
+
+    async def get_binary_file_ranges(self, object_name, ranges, max_concurrency=RANGE_MAX_CONCURRENCY):
+        """Yield a RangeResponse per range in order, requesting up to ``max_concurrency`` ahead.
+
+        Every range is pinned to the ETag of the first one.
+        """
+        ranges = iter(ranges)
+        first = next(ranges, None)
+        if first is None:
+            return
+        response = await self.get_binary_file_range(object_name, *first)
+        etag = response.etag
+        yield response
+        # closed with this generator, so ranges fetched ahead are discarded right away
+        async with aclosing(ordered_prefetch(
+            lambda byte_range: self.get_binary_file_range(object_name, *byte_range, etag=etag),
+            ranges,
+            max_concurrency,
+            discard=RangeResponse.aclose,
+        )) as responses:
+            async for response in responses:
+                yield response
+
+    async def read_binary_file_into(self, object_name, buffer):
+        """Read the object straight into a caller-supplied writable buffer and return its length."""
+        response = await self._send_request("get_object", {"Key": object_name})
+        body = response["Body"]
+        view = memoryview(buffer).cast("B")
+        size = response["ContentLength"]
+        if size > len(view):
+            body.close()
+            message = f"Buffer of {len(view)} bytes is too small for {object_name=} of {size} bytes"
+            logger.error(message)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=message)
+        try:
+            return await self._run(self._read_body_into, body, view[:size])
+        except IncompleteReadError as e:
+            message = f"Body of {object_name=} ended after {e.kwargs['actual_bytes']} of {size} bytes"
+            logger.error(message)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=message)
+
+    @staticmethod
+    def _read_body_into(body, view):
+        """Fill ``view`` from ``body`` without intermediate copies; raise IncompleteReadError if it ends first."""
+        position = 0
+        try:
+            while position < len(view):
+                read = body.readinto(view[position:position + STREAM_CHUNK_SIZE])
+                if not read:
+                    raise IncompleteReadError(actual_bytes=position, expected_bytes=len(view))
+                position += read
+        finally:
+            body.close()
+        return position
+
     async def get_file_metadata(self, object_name):
+        if self.metadata_cache is not None:
+            return await self._get_file_metadata_cached(object_name)
         request_kwargs = {"Key": object_name}
         response = await self._send_request("head_object", request_kwargs)
         return response
 
+    async def _get_file_metadata_cached(self, object_name):
+        cache = self.metadata_cache
+        entry = cache.lookup(self.bucket, object_name)
+        if entry is not None:
+            if entry.error is not None:
+                raise HTTPException(status_code=entry.error.status_code, detail=entry.error.detail)
+            return dict(entry.metadata)
+
+        generation = cache.generation
+        try:
+            response = await self._send_request("head_object", {"Key": object_name})
+        except HTTPException as e:
+            if e.status_code == status.HTTP_404_NOT_FOUND:
+                cache.store_missing(self.bucket, object_name, e, generation)
+            raise
+        cache.store(self.bucket, object_name, response, generation)
+        return dict(response)
+
     async def remove_file(self, object_name):
         request_kwargs = {"Key": object_name}
-        response = await self._send_request("delete_object", request_kwargs)
+        try:
+            response = await self._send_request("delete_object", request_kwargs)
+        finally:
+            self._invalidate(object_name)
         return response
 
+    async def remove_many_files(self, object_names, batch_size=DELETE_BATCH_SIZE, max_concurrency=DELETE_MAX_CONCURRENCY):
+        """Delete keys from an iterable or async iterable with batched DeleteObjects requests.
+
+        Returns {key: None} for deleted keys and {key: HTTPException} for failed ones.
+        """
+        results = {}
+        batches = batched(object_names, batch_size)
+        async for batch_results in bounded_as_completed(self._remove_files_batch, batches, max_concurrency):
+            results.update(batch_results)
+        return results
+
+    async def _remove_files_batch(self, object_names):
+        request_kwargs = {"Delete": {"Objects": [{"Key": object_name} for object_name in object_names], "Quiet": True}}
+        try:
+            response = await self._send_request("delete_objects", request_kwargs)
+        except HTTPException as e:
+            return dict.fromkeys(object_names, e)
+        finally:
+            for object_name in object_names:
+                self._invalidate(object_name)
+
+        results = dict.fromkeys(object_names)
+        for error in response.get("Errors", []):
+            results[error["Key"]] = HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=error.get("Message", "Images storage communication problem"),
+            )
+        return results
+
+    async def copy_file(self, source_name, target_name, target_bucket=None, part_size=COPY_PART_SIZE):
+        """Copy an object inside storage, without downloading it.
+
+        Objects over COPY_MAX_SIZE are copied as parallel upload_part_copy ranges pinned to the
+        source's ETag.
+        """
+        target_bucket = target_bucket or self.bucket
+        try:
+            metadata = await self._send_request("head_object", {"Key": source_name})
+            if metadata["ContentLength"] > COPY_MAX_SIZE:
+                return await self._copy_file_multipart(source_name, target_name, target_bucket, metadata, part_size)
+            request_kwargs = {
+                "Bucket": target_bucket,
+                "Key": target_name,
+                "CopySource": {"Bucket": self.bucket, "Key": source_name},
+                "MetadataDirective": "COPY",
+            }
+            return await self._send_request("copy_object", request_kwargs)
+        finally:
+            if target_bucket == self.bucket:
+                self._invalidate(target_name)
+
+    async def _copy_file_multipart(self, source_name, target_name, target_bucket, metadata, part_size):
+        response = await self._send_request(
+            "create_multipart_upload", {"Bucket": target_bucket, "Key": target_name, **copied_headers(metadata)}
+        )
+        upload_id = response["UploadId"]
+
+        async def copy_part(part):
+            part_number, source_range = part
+            part_kwargs = {
+                "Bucket": target_bucket,
+                "Key": target_name,
+                "UploadId": upload_id,
+                "PartNumber": part_number,
+                "CopySource": {"Bucket": self.bucket, "Key": source_name},
+                "CopySourceRange": source_range,
+                "CopySourceIfMatch": metadata["ETag"],
+            }
+            part_response = await self._send_request("upload_part_copy", part_kwargs)
+            return {"ETag": part_response["CopyPartResult"]["ETag"], "PartNumber": part_number}
+
+        try:
+            parts = enumerate(copy_source_ranges(metadata["ContentLength"], part_size), start=1)
+            copied_parts = [part async for part in bounded_as_completed(copy_part, parts, COPY_MAX_CONCURRENCY)]
+            request_kwargs = {
+                "Bucket": target_bucket,
+                "Key": target_name,
+                "UploadId": upload_id,
+                "MultipartUpload": {"Parts": sorted(copied_parts, key=lambda part: part["PartNumber"])},
+            }
+            return await self._send_request("complete_multipart_upload", request_kwargs)
+        except BaseException:
+            try:
+                await self._send_request(
+                    "abort_multipart_upload", {"Bucket": target_bucket, "Key": target_name, "UploadId": upload_id}
+                )
+            except HTTPException:
+                logger.exception(f"Abort of multipart copy {upload_id} to {target_name} failed")
+            raise
+
+    def _is_same_object(self, source_name, target_name, target_bucket):
+        return source_name == target_name and (target_bucket or self.bucket) == self.bucket
+
+    async def move_file(self, source_name, target_name, target_bucket=None):
+        """Copy the object, then delete the source; a failed copy leaves the source as is."""
+        if self._is_same_object(source_name, target_name, target_bucket):
+            return None
+        await self.copy_file(source_name, target_name, target_bucket)
+        return await self.remove_file(source_name)
+
+    async def move_many_files(self, pairs, target_bucket=None, max_concurrency=COPY_MAX_CONCURRENCY):
+        """Move (source, target) pairs, copying up to max_concurrency at a time.
+
+        Copied sources are deleted with batched DeleteObjects while the remaining copies run.
+        Returns {source: None} for moved keys and {source: HTTPException} for failed ones.
+        """
+        results = {}
+
+        async def copy(pair):
+            source_name, target_name = pair
+            if self._is_same_object(source_name, target_name, target_bucket):
+                return source_name, False
+            try:
+                await self.copy_file(source_name, target_name, target_bucket)
+            except HTTPException as e:
+                return source_name, e
+            return source_name, True
+
+        async def copied_sources():
+            async for source_name, result in bounded_as_completed(copy, pairs, max_concurrency):
+                if result is True:
+                    yield source_name
+                else:
+                    results[source_name] = None if result is False else result
+
+        results.update(await self.remove_many_files(copied_sources()))
+        return results
+
+    def presign_get_file(self, object_name, expires_in=None, response_headers=None):
+        """URL to download the object straight from storage, e.g. for a RedirectResponse.
+
+        Signing is local and takes no request, so this is a plain method.
+        """
+        return self._presign("get_object", {"Key": object_name, **(response_headers or {})}, expires_in)
+
+    def presign_put_file(self, object_name, content_type, expires_in=None):
+        """URL to upload the object straight to storage; the client must send the same Content-Type."""
+        return self._presign("put_object", {"Key": object_name, "ContentType": content_type}, expires_in)
+
+    def _presign(self, command, params, expires_in, cacheable=True):
+        expires_in = expires_in or self.presign_expires_s
+        params = {"Bucket": self.bucket, **params}
+        cache = self.presigned_url_cache if cacheable else None
+        if cache is not None:
+            cache_key = presign_cache_key(command, params, expires_in)
+            url = cache.lookup(cache_key)
+            if url is not None:
+                return url
+            signed_at = cache.now()
+        url = self.client.generate_presigned_url(command, Params=params, ExpiresIn=expires_in)
+        if cache is not None:
+            cache.store(cache_key, url, signed_at + expires_in)
+        return url
+
+    async def create_presigned_multipart_upload(
+        self, object_name, content_type, part_count, expires_in=None
+    ):
+        """Start a multipart upload and presign a PUT URL for each part, see PresignedMultipartUpload."""
+        try:
+            check_part_count(part_count)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        response = await self._send_request("create_multipart_upload", {"Key": object_name, "ContentType": content_type})
+        upload_id = response["UploadId"]
+        try:
+            part_urls = [
+                self._presign(
+                    "upload_part",
+                    {"Key": object_name, "UploadId": upload_id, "PartNumber": part_number},
+                    expires_in,
+                    cacheable=False,
+                )
+                for part_number in range(1, part_count + 1)
+            ]
+        except BaseException:
+            # nobody gets the upload id, so nobody else could abort it
+            try:
+                await self.abort_presigned_multipart_upload(object_name, upload_id)
+            except HTTPException:
+                logger.exception(f"Abort of multipart upload {upload_id} for {object_name} failed")
+            raise
+        return PresignedMultipartUpload(object_name, upload_id, part_urls)
+
+    async def complete_presigned_multipart_upload(self, object_name, upload_id, parts):
+        request_kwargs = {
+            "Key": object_name,
+            "UploadId": upload_id,
+            "MultipartUpload": {"Parts": sorted(parts, key=lambda part: part["PartNumber"])},
+        }
+        try:
+            return await self._send_request("complete_multipart_upload", request_kwargs)
+        finally:
+            self._invalidate(object_name)
+
+    async def abort_presigned_multipart_upload(self, object_name, upload_id):
+        return await self._send_request("abort_multipart_upload", {"Key": object_name, "UploadId": upload_id})
+
 
 class S3ClientHolder:
     def __init__(self):
@@ -96,6 +619,11 @@ class S3ClientHolder:
             self._client = S3Client()
         return self._client
 
+    def close(self):
+        if self._client:
+            self._client.close()
+            self._client = None
+
 
 client_holder = S3ClientHolder()
 
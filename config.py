@@ -1,3 +1,6 @@
+from functools import cache
+
+
 class Settings(BaseSettings):
 
     s3_endpoint: AnyHttpUrl = "http://127.0.0.1:9000"
@@ -9,10 +12,53 @@ class Settings(BaseSettings):
     s3_client_connect_timeout_s: int = 5
     s3_client_read_timeout_s: int = 20
     s3_http_pool_max_size: int = 10
+    # "executor" runs boto3 calls on a thread pool of s3_http_pool_max_size workers,
+    # "inline" calls boto3 directly on the event loop
+    s3_client_execution_mode: str = "executor"
+    # in-process cache of object bodies, disabled while s3_client_cache_max_bytes is 0
+    s3_client_cache_max_bytes: int = 0
+    s3_client_cache_max_item_bytes: int = 8 * 1024 * 1024
+    s3_client_cache_ttl_s: float = 30
+    # head_object cache, disabled while s3_client_metadata_cache_ttl_s is 0
+    s3_client_metadata_cache_ttl_s: float = 0
+    s3_client_metadata_cache_negative_ttl_s: float = 1
+    s3_client_metadata_cache_max_entries: int = 10_000
+    # retries on throttling and 5xx with jittered exponential backoff, 1 disables them
+    s3_client_retry_max_attempts: int = 1
+    s3_client_retry_base_delay_s: float = 0.05
+    # budget for all attempts of one call, 0 for no limit
+    s3_client_request_deadline_s: float = 0
+    # send a second get/head once the first is slower than this percentile of recent latencies
+    s3_client_hedge_reads: bool = False
+    s3_client_hedge_percentile: float = 95
+    s3_client_metrics_enabled: bool = True
+    # log requests slower than this as warnings, 0 disables the slow request log
+    s3_client_slow_request_threshold_s: float = 0
+    # presigned URLs are reused until s3_client_presign_refresh_margin_s before they expire
+    s3_client_presign_expires_s: int = 3600
+    s3_client_presign_cache_max_entries: int = 10_000
+    s3_client_presign_refresh_margin_s: float = 60
+    # fail fast with 503 once s3_client_breaker_failure_rate of recent requests failed or timed out,
+    # for s3_client_breaker_open_s; requests slower than s3_client_breaker_slow_call_s count as failed, 0 ignores latency
+    s3_client_circuit_breaker_enabled: bool = False
+    s3_client_breaker_failure_rate: float = 0.5
+    s3_client_breaker_open_s: float = 5
+    s3_client_breaker_slow_call_s: float = 0
+    # shed requests with 503 above a concurrency limit that backs off when latency rises or requests fail
+    s3_client_adaptive_concurrency: bool = False
 
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
 
 
-settings = Settings()
+@cache
+def get_settings() -> Settings:
+    return Settings()
+
+
+def __getattr__(name):
+    # settings used to be built on import, which reads the environment and the .env file
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
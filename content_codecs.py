@@ -0,0 +1,133 @@
+import asyncio
+import zlib
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from typing import AsyncIterator, BinaryIO, Protocol
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for the zstd codec
+    zstandard = None
+
+# user metadata key (x-amz-meta-codec) marking objects compressed by this layer
+CODEC_METADATA_KEY = 'codec'
+COMPRESSIBLE_CONTENT_TYPES = frozenset({
+    'application/json', 'application/x-ndjson', 'application/xml', 'application/javascript', 'image/svg+xml',
+})
+# compressed streams smaller than this aren't worth the CPU and the extra header
+DEFAULT_MIN_SIZE = 1024
+READ_SIZE = 1024 * 1024
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+class Decompressor(Protocol):
+    def decompress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+class Codec(ABC):
+    # Content-Encoding token, also stored under CODEC_METADATA_KEY
+    name: str
+
+    @abstractmethod
+    def compressor(self) -> Compressor: ...
+
+    @abstractmethod
+    def decompressor(self) -> Decompressor: ...
+
+
+class GzipCodec(Codec):
+    name = 'gzip'
+
+    def __init__(self, level: int = 6) -> None:
+        self.level = level
+
+    def compressor(self) -> Compressor:
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def decompressor(self) -> Decompressor:
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+class ZstdCodec(Codec):
+    name = 'zstd'
+
+    def __init__(self, level: int = 3) -> None:
+        if zstandard is None:
+            raise ImportError('The zstd codec needs the zstandard package')
+        self.level = level
+
+    def compressor(self) -> Compressor:
+        return zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def decompressor(self) -> Decompressor:
+        return zstandard.ZstdDecompressor().decompressobj()
+
+
+CODECS: dict[str, type[Codec]] = {GzipCodec.name: GzipCodec, ZstdCodec.name: ZstdCodec}
+
+
+def get_codec(name: str) -> Codec:
+    try:
+        return CODECS[name]()
+    except KeyError:
+        raise ValueError(f'Unknown codec {name!r}, expected one of {sorted(CODECS)}') from None
+
+
+class CompressionPolicy:
+    """Which uploads to compress: text and the other ``content_types``, unless known to be tiny."""
+
+    def __init__(self,
+                 codec: Codec,
+                 content_types: frozenset[str] = COMPRESSIBLE_CONTENT_TYPES,
+                 min_size: int = DEFAULT_MIN_SIZE) -> None:
+        self.codec = codec
+        self.content_types = content_types
+        self.min_size = min_size
+
+    def codec_for(self, content_type: str, size: int | None) -> Codec | None:
+        if size is not None and size < self.min_size:
+            return None
+        media_type = content_type.split(';', 1)[0].strip().lower()
+        if media_type.startswith('text/') or media_type in self.content_types:
+            return self.codec
+        return None
+
+
+def _read_compressed(data: BinaryIO, compressor: Compressor, read_size: int) -> bytes | None:
+    """Compress the next ``read_size`` bytes of ``data``, None at its end; blocking, run it in an executor."""
+    chunk = data.read(read_size)
+    return compressor.compress(chunk) if chunk else None
+
+
+async def compress_parts(data: BinaryIO,
+                         codec: Codec,
+                         part_size: int,
+                         executor: Executor | None = None,
+                         read_size: int = READ_SIZE) -> AsyncIterator[bytes]:
+    """Compress ``data`` into parts of ``part_size`` bytes (the last one shorter).
+
+    Reads and compression run in ``executor`` (the loop's default one when None), so the event
+    loop keeps serving other requests; zlib and zstandard release the GIL while they work.
+    """
+    loop = asyncio.get_running_loop()
+    compressor = codec.compressor()
+    pending = bytearray()
+    while True:
+        compressed = await loop.run_in_executor(executor, _read_compressed, data, compressor, read_size)
+        if compressed is None:
+            break
+        pending += compressed
+        while len(pending) >= part_size:
+            yield bytes(pending[:part_size])
+            del pending[:part_size]
+    pending += await loop.run_in_executor(executor, compressor.flush)
+    while pending:
+        yield bytes(pending[:part_size])
+        del pending[:part_size]
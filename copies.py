@@ -0,0 +1,22 @@
+from typing import Any
+
+from presigned import MAX_PARTS
+
+# CopyObject copies at most 5 GiB in one request; larger objects are copied part by part
+COPY_MAX_SIZE = 5 * 1024 * 1024 * 1024
+# parts are copied inside storage, so big ones just mean fewer requests (S3 allows up to 5 GiB)
+COPY_PART_SIZE = 512 * 1024 * 1024
+COPY_MAX_CONCURRENCY = 8
+# headers CopyObject carries over with MetadataDirective COPY, which a multipart copy has to set itself
+COPIED_HEADERS = ('ContentType', 'ContentEncoding', 'ContentDisposition', 'ContentLanguage', 'CacheControl', 'Metadata')
+
+
+def copy_source_ranges(size: int, part_size: int = COPY_PART_SIZE) -> list[str]:
+    """``CopySourceRange`` values covering ``size`` bytes; parts grow to stay within ``MAX_PARTS``."""
+    part_size = max(part_size, -(-size // MAX_PARTS))
+    return [f'bytes={start}-{min(start + part_size, size) - 1}' for start in range(0, size, part_size)]
+
+
+def copied_headers(metadata: dict[str, Any]) -> dict[str, Any]:
+    """The ``COPIED_HEADERS`` of a ``head_object`` response, as ``create_multipart_upload`` kwargs."""
+    return {name: metadata[name] for name in COPIED_HEADERS if metadata.get(name)}
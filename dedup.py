@@ -0,0 +1,108 @@
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncContextManager, BinaryIO, Iterable, Protocol
+
+from aio_utils import KeyedLock
+
+DIGEST_READ_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class IndexedObject:
+    key: str
+    # ETag the key had when it was indexed; copies are conditional on it
+    etag: str
+
+
+class DigestIndex(Protocol):
+    """Maps content digests to an object already holding that content.
+
+    Entries may be stale: the repository copies with ``CopySourceIfMatch`` and calls
+    ``discard`` when the source is gone or was overwritten, so an index shared between
+    processes (e.g. in Redis) only needs ``lock`` to serialise uploads of one digest.
+    """
+
+    async def get(self, digest: str) -> IndexedObject | None: ...
+
+    async def add(self, digest: str, key: str, etag: str) -> None: ...
+
+    async def discard(self, digest: str, key: str) -> None: ...
+
+    async def discard_keys(self, keys: Iterable[str]) -> None: ...
+
+    def lock(self, digest: str) -> AsyncContextManager[None]: ...
+
+
+class InMemoryDigestIndex:
+    """Process-local LRU ``DigestIndex`` of at most ``max_entries`` digests."""
+
+    def __init__(self, max_entries: int = 100_000) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, IndexedObject] = OrderedDict()
+        self._digests: dict[str, str] = {}
+        self._locks = KeyedLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, digest: str) -> IndexedObject | None:
+        entry = self._entries.get(digest)
+        if entry is not None:
+            self._entries.move_to_end(digest)
+        return entry
+
+    async def add(self, digest: str, key: str, etag: str) -> None:
+        self._drop_key(key)
+        previous = self._entries.pop(digest, None)
+        if previous is not None:
+            del self._digests[previous.key]
+        self._entries[digest] = IndexedObject(key, etag)
+        self._digests[key] = digest
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            del self._digests[evicted.key]
+
+    async def discard(self, digest: str, key: str) -> None:
+        entry = self._entries.get(digest)
+        if entry is not None and entry.key == key:
+            del self._entries[digest]
+            del self._digests[key]
+
+    async def discard_keys(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self._drop_key(key)
+
+    def _drop_key(self, key: str) -> None:
+        digest = self._digests.pop(key, None)
+        if digest is not None:
+            del self._entries[digest]
+
+    def lock(self, digest: str) -> AsyncContextManager[None]:
+        return self._locks(digest)
+
+
+class HashingReader:
+    """Wrap a stream that can't be rewound, computing its sha256 as it is read for the upload."""
+
+    def __init__(self, data: BinaryIO) -> None:
+        self._data = data
+        self._hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._data.read(size)
+        self._hash.update(chunk)
+        return chunk
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def stream_sha256(data: BinaryIO, read_size: int = DIGEST_READ_SIZE) -> str:
+    """Hash ``data`` from its current position and rewind it; blocking, run it in an executor."""
+    position = data.tell()
+    digest = hashlib.sha256()
+    while chunk := data.read(read_size):
+        digest.update(chunk)
+    data.seek(position)
+    return digest.hexdigest()
@@ -1,12 +1,23 @@
 from dependency_injector import containers, providers
 
+from metrics import RequestMetrics, default_sink
 from some_stuff.adapters.s3.repositories.SomeStuff_repository import SomeStuffRepository
-from some_stuff.adapters.s3.storage.sessions import get_async_client
+from some_stuff.adapters.s3.storage.sessions import get_config, get_shared_client
 
 
 class ColorSchemeApiContainer(containers.DeclarativeContainer):
-    s3_client = providers.Resource(get_async_client)
+    # started once per process by sessions.on_startup, shared by every repository
+    s3_client = providers.Callable(get_shared_client)
+    # one instance for all repositories, which share the client's connection pool
+    s3_request_metrics = providers.Singleton(
+        RequestMetrics,
+        sink=default_sink,
+        adapter='SomeStuffRepository',
+        # resolved on first use, importing this module doesn't load botocore
+        pool_size=providers.Callable(get_config).provided.max_pool_connections,
+    )
     SomeStuff_repository = providers.Factory(
         SomeStuffRepository,
         s3_client=s3_client,
+        request_metrics=s3_request_metrics,
     )
@@ -0,0 +1,400 @@
+import asyncio
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, BinaryIO, Callable
+
+from bodies import BytesBody, ChainedBody, MappedBody
+from caches import CacheStats
+
+LRU = 'lru'
+LFU = 'lfu'
+EVICTION_POLICIES = (LRU, LFU)
+INDEX_FILE_NAME = 'index.sqlite3'
+# bytes read from a body per write to its cache file
+WRITE_CHUNK_SIZE = 1024 * 1024
+# hits are written to the index in batches rather than in a transaction per read
+TOUCH_FLUSH_SIZE = 256
+# temporary files older than this were left by a crashed writer
+TEMP_MAX_AGE_S = 3600
+# entries evicted per index query
+EVICTION_BATCH_SIZE = 64
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    etag TEXT NOT NULL,
+    content_type TEXT,
+    validated_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL,
+    PRIMARY KEY (bucket, key)
+);
+CREATE INDEX IF NOT EXISTS entries_by_recency ON entries (last_access);
+CREATE INDEX IF NOT EXISTS entries_by_frequency ON entries (hits, last_access);
+CREATE TABLE IF NOT EXISTS total (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL);
+INSERT OR IGNORE INTO total VALUES (0, 0);
+'''
+_EVICTION_ORDER = {LRU: 'last_access', LFU: 'hits, last_access'}
+
+
+@dataclass
+class CachedFile:
+    """An object in the disk cache.
+
+    Eviction may remove the file at any time, so open it right away, through ``open`` to read it
+    in-process or ``open_file`` to serve it with ``sendfile``; what is open stays readable. A
+    ``FileResponse`` of ``path`` opens it only once the response starts.
+    """
+
+    bucket: str
+    key: str
+    path: Path
+    size: int
+    etag: str
+    content_type: str | None
+    validated_at: float
+    # set by open_file, for sendfile
+    file: BinaryIO | None = field(default=None, repr=False, compare=False)
+
+    def open(self) -> MappedBody:
+        return MappedBody(self.path)
+
+    def open_file(self) -> BinaryIO:
+        if self.file is None:
+            self.file = open(self.path, 'rb')
+        return self.file
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+    def headers(self) -> dict[str, str]:
+        return {'ETag': self.etag}
+
+
+def _file_name(bucket: str, key: str) -> str:
+    return hashlib.sha256(f'{bucket}\0{key}'.encode()).hexdigest()
+
+
+class DiskCache:
+    """Byte-bounded cache of object bodies in files under ``directory``, read through like ``ObjectCache``.
+
+    Entries younger than ``ttl_s`` are served without asking S3, older ones are kept and handed
+    back for revalidation with a conditional GET on their ETag. A body is written to a temporary
+    file and renamed over the entry's file, so a reader sees a whole old or a whole new body and
+    a crash leaves no torn entry. Entries are indexed in SQLite next to the files, with their
+    total size, so a restart picks the cache up without scanning the directory, and processes
+    sharing ``directory`` share the cache.
+
+    Over ``max_bytes``, entries are evicted least recently used first with ``policy='lru'`` or
+    least frequently used first, ties going to the least recent, with ``policy='lfu'``. File
+    I/O and index queries run in ``executor`` (the loop's default one when None), as SQLite
+    waits up to its busy timeout for writers in other processes.
+    """
+
+    def __init__(self,
+                 directory: str | os.PathLike,
+                 max_bytes: int,
+                 ttl_s: float = 30.0,
+                 max_item_bytes: int | None = None,
+                 policy: str = LRU,
+                 executor: Executor | None = None,
+                 clock: Callable[[], float] = time.time) -> None:
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f'Unknown eviction policy {policy!r}, expected one of {EVICTION_POLICIES}')
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.max_item_bytes = max_bytes if max_item_bytes is None else min(max_item_bytes, max_bytes)
+        self.policy = policy
+        self.executor = executor
+        self.stats = CacheStats()
+        # wall clock, as validation and access times are kept across restarts
+        self._clock = clock
+        # bumped by every invalidation, so a fetch that raced a write doesn't store the old body
+        self.generation = 0
+
+        self._objects = self.directory / 'objects'
+        self._temp = self.directory / 'tmp'
+        self._objects.mkdir(parents=True, exist_ok=True)
+        self._temp.mkdir(exist_ok=True)
+        self._remove_stale_temp_files()
+        # used from executor threads, one at a time
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.directory / INDEX_FILE_NAME, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        # with WAL, a crash can lose the last commits but never corrupt the index
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('PRAGMA busy_timeout=5000')
+        self._db.executescript(_SCHEMA)
+        # (bucket, key) -> (hits, last access) not written to the index yet
+        self._touches: dict[tuple[str, str], tuple[int, float]] = {}
+
+    async def count(self) -> int:
+        return await self._query('SELECT count(*) FROM entries')
+
+    async def size(self) -> int:
+        return await self._query('SELECT size FROM total')
+
+    async def _query(self, sql: str) -> int:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._query_sync, sql)
+
+    def _query_sync(self, sql: str) -> int:
+        with self._lock:
+            return self._db.execute(sql).fetchone()[0]
+
+    def _path(self, bucket: str, key: str) -> Path:
+        name = _file_name(bucket, key)
+        return self._objects / name[:2] / name
+
+    async def lookup(self, bucket: str, key: str) -> CachedFile | None:
+        """Return the entry for ``key``, fresh or due for revalidation, and count a hit if it's fresh."""
+        entry = await asyncio.get_running_loop().run_in_executor(self.executor, self._lookup, bucket, key)
+        if entry is not None and self.is_fresh(entry):
+            self.stats.hits += 1
+        return entry
+
+    def _lookup(self, bucket: str, key: str) -> CachedFile | None:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT size, etag, content_type, validated_at FROM entries WHERE bucket = ? AND key = ?', (bucket, key)
+            ).fetchone()
+            if row is None:
+                return None
+            hits, _ = self._touches.get((bucket, key), (0, 0.0))
+            self._touches[(bucket, key)] = (hits + 1, self._clock())
+            if len(self._touches) >= TOUCH_FLUSH_SIZE:
+                self._flush_touches()
+        return CachedFile(bucket, key, self._path(bucket, key), *row)
+
+    def is_fresh(self, entry: CachedFile) -> bool:
+        return self._clock() - entry.validated_at < self.ttl_s
+
+    def accepts(self, size: int | None) -> bool:
+        return size is not None and size <= self.max_item_bytes
+
+    async def revalidated(self, entry: CachedFile) -> None:
+        self.stats.revalidations += 1
+        entry.validated_at = self._clock()
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._revalidated, entry)
+
+    def _revalidated(self, entry: CachedFile) -> None:
+        with self._lock:
+            self._db.execute('UPDATE entries SET validated_at = ? WHERE bucket = ? AND key = ?',
+                             (entry.validated_at, entry.bucket, entry.key))
+
+    def record_miss(self) -> None:
+        self.stats.misses += 1
+
+    async def store(self,
+                    bucket: str,
+                    key: str,
+                    body: Any,
+                    etag: str,
+                    content_type: str | None,
+                    generation: int) -> CachedFile | MappedBody | ChainedBody:
+        """Count a miss, write ``body`` to the cache, close it and return the new entry.
+
+        The body isn't kept when ``key`` was invalidated since ``generation``: it is returned as
+        a ``MappedBody`` of a file that is already deleted. Nor is it when it turns out larger
+        than ``max_item_bytes``, e.g. once decompressed: writing stops there and what was
+        written is returned chained to the rest of ``body``, still open.
+        """
+        self.record_miss()
+        loop = asyncio.get_running_loop()
+        temp_path = self._temp / f'{uuid.uuid4().hex}.part'
+        try:
+            file = await loop.run_in_executor(self.executor, open, temp_path, 'wb')
+            try:
+                written = 0
+                while chunk := await body.read(WRITE_CHUNK_SIZE):
+                    if written + len(chunk) > self.max_item_bytes:
+                        file.close()
+                        return ChainedBody(MappedBody(temp_path), BytesBody(chunk), body)
+                    await loop.run_in_executor(self.executor, file.write, chunk)
+                    written += len(chunk)
+                # the rename must not reach the disk before the bytes it points at
+                await loop.run_in_executor(self.executor, os.fsync, file.fileno())
+            finally:
+                file.close()
+            body.close()
+            if generation != self.generation:
+                return MappedBody(temp_path)
+            return await loop.run_in_executor(
+                self.executor, self._commit, bucket, key, temp_path, etag, content_type, generation
+            )
+        except BaseException:
+            body.close()
+            raise
+        finally:
+            # a no-op once the file was renamed into the cache
+            temp_path.unlink(missing_ok=True)
+
+    def _commit(self,
+                bucket: str,
+                key: str,
+                temp_path: Path,
+                etag: str,
+                content_type: str | None,
+                generation: int) -> CachedFile | MappedBody:
+        path = self._path(bucket, key)
+        path.parent.mkdir(exist_ok=True)
+        size = temp_path.stat().st_size
+        now = self._clock()
+        with self._lock:
+            # checked again under the lock, an invalidation may have run while the body was written
+            if generation != self.generation:
+                return MappedBody(temp_path)
+            self._touches.pop((bucket, key), None)
+            self._flush_touches()
+            # files are renamed and deleted inside the write transaction, which serialises them with
+            # the commits and invalidations of other threads and processes sharing the index
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                os.replace(temp_path, path)
+                previous = self._db.execute('SELECT size FROM entries WHERE bucket = ? AND key = ?',
+                                            (bucket, key)).fetchone()
+                self._db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, 1)',
+                                 (bucket, key, size, etag, content_type, now, now))
+                self._db.execute('UPDATE total SET size = size + ?', (size - (previous[0] if previous else 0),))
+                evicted = self._evict(exclude=(bucket, key))
+                for evicted_path in evicted:
+                    evicted_path.unlink(missing_ok=True)
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                # the old row must not point at the new body
+                path.unlink(missing_ok=True)
+                raise
+            self.stats.evictions += len(evicted)
+        return CachedFile(bucket, key, path, size, etag, content_type, now)
+
+    def _evict(self, exclude: tuple[str, str]) -> list[Path]:
+        """Delete entries, other than ``exclude``, until the total fits ``max_bytes``; return their files."""
+        evicted = []
+        total = self._db.execute('SELECT size FROM total').fetchone()[0]
+        while total > self.max_bytes:
+            rows = self._db.execute(
+                f'SELECT bucket, key, size FROM entries WHERE NOT (bucket = ? AND key = ?) '
+                f'ORDER BY {_EVICTION_ORDER[self.policy]} LIMIT ?',
+                (*exclude, EVICTION_BATCH_SIZE),
+            ).fetchall()
+            if not rows:
+                break
+            for bucket, key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._db.execute('DELETE FROM entries WHERE bucket = ? AND key = ?', (bucket, key))
+                self._touches.pop((bucket, key), None)
+                total -= size
+                evicted.append(self._path(bucket, key))
+        self._db.execute('UPDATE total SET size = ?', (total,))
+        return evicted
+
+    def _flush_touches(self) -> None:
+        if not self._touches:
+            return
+        self._db.executemany(
+            'UPDATE entries SET hits = hits + ?, last_access = max(last_access, ?) WHERE bucket = ? AND key = ?',
+            [(hits, last_access, bucket, key) for (bucket, key), (hits, last_access) in self._touches.items()],
+        )
+        self._touches.clear()
+
+    async def invalidate(self, bucket: str, key: str) -> None:
+        # bumped before waiting for the index, so a fetch finishing meanwhile isn't kept
+        self.generation += 1
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._invalidate, bucket, key)
+
+    def _invalidate(self, bucket: str, key: str) -> None:
+        with self._lock:
+            self._touches.pop((bucket, key), None)
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._db.execute('SELECT size FROM entries WHERE bucket = ? AND key = ?', (bucket, key)).fetchone()
+                if row is not None:
+                    self._db.execute('DELETE FROM entries WHERE bucket = ? AND key = ?', (bucket, key))
+                    self._db.execute('UPDATE total SET size = size - ?', (row[0],))
+                    self._path(bucket, key).unlink(missing_ok=True)
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    async def discard(self, entry: CachedFile) -> None:
+        """Drop ``entry`` from the index if its file is gone, e.g. deleted by hand or by a crash."""
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._discard, entry)
+
+    def _discard(self, entry: CachedFile) -> None:
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                # a commit may have put a new file in place since the entry was looked up
+                if not entry.path.exists():
+                    row = self._db.execute('SELECT size FROM entries WHERE bucket = ? AND key = ? AND etag = ?',
+                                           (entry.bucket, entry.key, entry.etag)).fetchone()
+                    if row is not None:
+                        self._db.execute('DELETE FROM entries WHERE bucket = ? AND key = ?', (entry.bucket, entry.key))
+                        self._touches.pop((entry.bucket, entry.key), None)
+                        self._db.execute('UPDATE total SET size = size - ?', (row[0],))
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    async def clear(self) -> None:
+        self.generation += 1
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._clear)
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._touches.clear()
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.execute('DELETE FROM entries')
+                self._db.execute('UPDATE total SET size = 0')
+                for path in self._objects.glob('*/*'):
+                    path.unlink(missing_ok=True)
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    async def close(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._close)
+
+    def _close(self) -> None:
+        with self._lock:
+            self._flush_touches()
+            self._db.close()
+
+    def _remove_stale_temp_files(self) -> None:
+        # other processes sharing the directory may be writing the recent ones
+        deadline = time.time() - TEMP_MAX_AGE_S
+        for path in self._temp.iterdir():
+            try:
+                if path.stat().st_mtime < deadline:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+async def sendfile(sock: socket.socket, entry: CachedFile, offset: int = 0, count: int | None = None) -> int:
+    """Send the entry's bytes to a non-blocking ``sock`` with ``os.sendfile`` where the platform has it.
+
+    Sends the file the entry has open, if any, or opens it.
+    """
+    loop = asyncio.get_running_loop()
+    if entry.file is not None:
+        return await loop.sock_sendfile(sock, entry.file, offset, count)
+    with open(entry.path, 'rb') as file:
+        return await loop.sock_sendfile(sock, file, offset, count)
@@ -0,0 +1,160 @@
+import logging
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Any, Protocol
+
+from resilience import stream_position
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class MetricsSink(Protocol):
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        ...
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        ...
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        ...
+
+
+class InMemoryMetricsSink:
+    """Keeps histograms, counters and gauges in memory for ``render_prometheus``."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS_S) -> None:
+        self.buckets = buckets
+        # per series: count in each bucket (the last one is +Inf), sum, count
+        self.histograms: dict[str, dict[Labels, list]] = defaultdict(dict)
+        self.counters: dict[str, dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+        self.gauges: dict[str, dict[Labels, float]] = defaultdict(dict)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        series = self.histograms[name].get(key := _labels(labels))
+        if series is None:
+            series = self.histograms[name][key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        self.counters[name][_labels(labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        self.gauges[name][_labels(labels)] = value
+
+
+# process-wide sink used by the adapters unless they are given another one;
+# serve render_prometheus(default_sink) from a /metrics endpoint
+default_sink = InMemoryMetricsSink()
+
+
+def _labels(labels: dict[str, Any]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: tuple[tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    escaped = (f'{name}="{_escape(value)}"' for name, value in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(sink: InMemoryMetricsSink) -> str:
+    """Render ``sink`` in the Prometheus text exposition format."""
+    lines = []
+    for name, series in sorted(sink.histograms.items()):
+        lines.append(f'# TYPE {name} histogram')
+        for labels, (bucket_counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*sink.buckets, '+Inf'), bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels(labels, (("le", str(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    for kind, metrics in (('counter', sink.counters), ('gauge', sink.gauges)):
+        for name, series in sorted(metrics.items()):
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(series.items()):
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def loggable_kwargs(request_kwargs: dict[str, Any]) -> dict[str, Any]:
+    """``request_kwargs`` with the request body replaced by a short description."""
+    if 'Body' not in request_kwargs:
+        return request_kwargs
+    body = request_kwargs['Body']
+    description = f'<{len(body)} bytes>' if isinstance(body, (bytes, bytearray, memoryview)) else f'<{type(body).__name__}>'
+    return {**request_kwargs, 'Body': description}
+
+
+class RequestMetrics:
+    """Latency, bytes, in-flight and pool saturation of one adapter's S3 requests.
+
+    Share one instance between all adapters using the same connection pool, so the
+    in-flight gauge and saturation cover the whole pool.
+    """
+
+    def __init__(self,
+                 sink: MetricsSink,
+                 adapter: str,
+                 pool_size: int,
+                 slow_request_threshold_s: float | None = None) -> None:
+        self.sink = sink
+        self.adapter = adapter
+        self.pool_size = pool_size
+        self.slow_request_threshold_s = slow_request_threshold_s
+        self.in_flight = 0
+
+    def started(self, request_kwargs: dict[str, Any]) -> tuple[float, int | None]:
+        self.in_flight += 1
+        self._set_in_flight_gauges()
+        return time.perf_counter(), stream_position(request_kwargs.get('Body'))
+
+    def finished(self,
+                 command: str,
+                 token: tuple[float, int | None],
+                 http_status_code: int,
+                 request_kwargs: dict[str, Any],
+                 response: dict | None) -> None:
+        started, body_position = token
+        duration = time.perf_counter() - started
+        self.in_flight -= 1
+        self._set_in_flight_gauges()
+
+        labels = {'adapter': self.adapter, 'command': command, 'status': str(http_status_code)}
+        self.sink.observe('s3_request_duration_seconds', duration, **labels)
+        bytes_sent = _bytes_sent(request_kwargs.get('Body'), body_position)
+        if bytes_sent:
+            self.sink.increment('s3_bytes_sent_total', bytes_sent, adapter=self.adapter, command=command)
+        bytes_received = response.get('ContentLength') if command == 'get_object' and response else None
+        if bytes_received:
+            self.sink.increment('s3_bytes_received_total', bytes_received, adapter=self.adapter, command=command)
+
+        if self.slow_request_threshold_s is not None and duration >= self.slow_request_threshold_s:
+            logger.warning('Slow S3 request %s key=%s status=%s took %.3fs',
+                           command, request_kwargs.get('Key'), http_status_code, duration)
+
+    def _set_in_flight_gauges(self) -> None:
+        self.sink.set_gauge('s3_requests_in_flight', self.in_flight, adapter=self.adapter)
+        self.sink.set_gauge('s3_pool_saturation', self.in_flight / self.pool_size, adapter=self.adapter)
+
+
+def _bytes_sent(body: Any, position: int | None) -> int:
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return len(body)
+    end = stream_position(body)
+    return end - position if end is not None and position is not None else 0
@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, TypeVar
+
+from metrics import MetricsSink, default_sink
+from resilience import DeadlineExceeded, is_retryable_error
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar('R')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+# s3_circuit_state gauge values
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class Overloaded(Exception):
+    """The request was refused locally, without being sent."""
+
+
+class CircuitOpen(Overloaded):
+    pass
+
+
+class LoadShed(Overloaded):
+    pass
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """Errors telling the endpoint is struggling, as opposed to answers like 404 or 412."""
+    return is_retryable_error(error) or isinstance(error, (asyncio.TimeoutError, DeadlineExceeded))
+
+
+@dataclass
+class BreakerPolicy:
+    """Open once ``failure_rate`` of the last ``window`` calls failed, or were slower than ``slow_call_s``."""
+
+    failure_rate: float = 0.5
+    window: int = 50
+    # no opinion until this many calls are in the window
+    min_calls: int = 20
+    # slow successes still hold a connection for that long, so they count as failures; None to ignore latency
+    slow_call_s: float | None = None
+    # how long to fail fast before letting trial calls through
+    open_s: float = 5.0
+    # trial calls let through while half-open; all of them must succeed to close
+    half_open_calls: int = 3
+
+
+class CircuitBreaker:
+    """Fail fast while an endpoint keeps failing instead of waiting out its timeouts.
+
+    Closed, calls go through and their outcomes are counted. Open, calls raise ``CircuitOpen``
+    at once. After ``open_s`` it is half-open: ``half_open_calls`` trial calls go through,
+    closing the breaker if they all succeed and opening it again as soon as one fails.
+    """
+
+    def __init__(self,
+                 policy: BreakerPolicy | None = None,
+                 name: str = '',
+                 sink: MetricsSink = default_sink,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.policy = policy or BreakerPolicy()
+        self.name = name
+        self.sink = sink
+        self.clock = clock
+        self.state = CLOSED
+        self._outcomes: deque[bool] = deque(maxlen=self.policy.window)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trials_started = 0
+        self._trials_succeeded = 0
+
+    def acquire(self) -> None:
+        """Raise ``CircuitOpen`` unless a call may go through now; pair with ``record`` or ``release``."""
+        if self.state == OPEN:
+            if self.clock() - self._opened_at < self.policy.open_s:
+                raise CircuitOpen(f'Circuit of {self.name} is open')
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._trials_started >= self.policy.half_open_calls:
+                raise CircuitOpen(f'Circuit of {self.name} is half-open, waiting on trial requests')
+            self._trials_started += 1
+
+    def release(self) -> None:
+        """Give back a call that ended without an outcome, e.g. cancelled."""
+        if self.state == HALF_OPEN:
+            self._trials_started -= 1
+
+    def record(self, failed: bool, duration_s: float) -> None:
+        failed = failed or (self.policy.slow_call_s is not None and duration_s >= self.policy.slow_call_s)
+        if self.state == HALF_OPEN:
+            if failed:
+                self._open()
+                return
+            self._trials_succeeded += 1
+            if self._trials_succeeded >= self.policy.half_open_calls:
+                self._close()
+            return
+        if self.state == OPEN:
+            # sent before the breaker opened
+            return
+
+        if len(self._outcomes) == self._outcomes.maxlen:
+            self._failures -= self._outcomes[0]
+        self._outcomes.append(failed)
+        self._failures += failed
+        if len(self._outcomes) >= self.policy.min_calls and self._failures >= self.policy.failure_rate * len(self._outcomes):
+            self._open()
+
+    def _open(self) -> None:
+        logger.warning('Opening the circuit of %s for %ss', self.name, self.policy.open_s)
+        self._opened_at = self.clock()
+        self._set_state(OPEN)
+
+    def _close(self) -> None:
+        logger.info('Closing the circuit of %s', self.name)
+        self._outcomes.clear()
+        self._failures = 0
+        self._set_state(CLOSED)
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        self._trials_started = 0
+        self._trials_succeeded = 0
+        self.sink.set_gauge('s3_circuit_state', STATE_VALUES[state], endpoint=self.name)
+
+
+@dataclass
+class LimitPolicy:
+    """AIMD bounds of an ``AdaptiveConcurrencyLimit``; None limits default to the connection pool size."""
+
+    initial_limit: int | None = None
+    min_limit: int = 1
+    max_limit: int | None = None
+    # multiplicative decrease on overload
+    backoff_ratio: float = 0.9
+    # a call slower than this many times the best recent latency of its command signals queueing
+    latency_tolerance: float = 2.0
+    # calls per command after which the best latency is measured afresh, so it follows the endpoint
+    baseline_window: int = 500
+
+
+class _Baseline:
+    """Best latency of a command over the current and the previous window."""
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self.best = float('inf')
+        self._current = float('inf')
+        self._count = 0
+
+    def record(self, latency: float) -> None:
+        self._current = min(self._current, latency)
+        self.best = min(self.best, latency)
+        self._count += 1
+        if self._count >= self.window:
+            self.best, self._current, self._count = self._current, float('inf'), 0
+
+
+class AdaptiveConcurrencyLimit:
+    """Concurrency limit that finds what the endpoint sustains, shedding calls above it.
+
+    The limit grows by one per limit's worth of calls answered in time, and shrinks by
+    ``backoff_ratio`` at most once per round trip when calls fail with overload errors or
+    take ``latency_tolerance`` times longer than the best recent latency (as in TCP Vegas,
+    latency rises as soon as requests queue). Calls over the limit raise ``LoadShed`` right
+    away instead of queueing behind the connection pool until they time out.
+    """
+
+    def __init__(self,
+                 pool_size: int,
+                 policy: LimitPolicy | None = None,
+                 name: str = '',
+                 sink: MetricsSink = default_sink,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.policy = policy or LimitPolicy()
+        self.max_limit = self.policy.max_limit or pool_size
+        self.limit = float(min(self.max_limit, self.policy.initial_limit or pool_size))
+        self.name = name
+        self.sink = sink
+        self.clock = clock
+        self.in_flight = 0
+        self._baselines: dict[str, _Baseline] = {}
+        self._last_decrease = float('-inf')
+        self._set_gauge()
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, command: str, latency: float | None, overloaded: bool) -> None:
+        """End a call; ``latency`` is None when it says nothing about the endpoint's load, e.g. cancelled."""
+        self.in_flight -= 1
+        if latency is None:
+            return
+        baseline = self._baselines.setdefault(command, _Baseline(self.policy.baseline_window))
+        queued = baseline.best != float('inf') and latency > baseline.best * self.policy.latency_tolerance
+        if not overloaded:
+            baseline.record(latency)
+        now = self.clock()
+        if overloaded or queued:
+            # calls that were in flight together fail together: back off once for all of them
+            if now - self._last_decrease >= latency:
+                self._last_decrease = now
+                self.limit = max(self.policy.min_limit, self.limit * self.policy.backoff_ratio)
+                self._set_gauge()
+        elif self.in_flight + 1 >= int(self.limit) / 2:
+            # only grow a limit that is being used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._set_gauge()
+
+    def _set_gauge(self) -> None:
+        self.sink.set_gauge('s3_concurrency_limit', self.limit, endpoint=self.name)
+
+
+class EndpointGuard:
+    """Circuit breaker and adaptive concurrency limit in front of the requests to one endpoint.
+
+    Share one per endpoint between all adapters (see ``endpoint_guard``), so they all stop
+    sending when it struggles. Either part may be None to go without it. Every attempt, retries
+    and hedges included, goes through ``call`` on its own.
+
+    A call ends when ``send`` returns, so a GET holds its slot of the concurrency limit until
+    its headers arrive, not while its body streams: the limit tracks how fast the endpoint
+    answers, and bodies being read are bounded by the connection pool instead.
+    """
+
+    def __init__(self,
+                 endpoint: str,
+                 breaker: CircuitBreaker | None = None,
+                 limiter: AdaptiveConcurrencyLimit | None = None,
+                 sink: MetricsSink = default_sink) -> None:
+        self.endpoint = endpoint
+        self.breaker = breaker
+        self.limiter = limiter
+        self.sink = sink
+
+    async def call(self, command: str, send: Callable[[], Awaitable[R]]) -> R:
+        if self.breaker is not None:
+            try:
+                self.breaker.acquire()
+            except CircuitOpen:
+                self.sink.increment('s3_requests_rejected_total', endpoint=self.endpoint, reason='circuit_open')
+                raise
+        if self.limiter is not None and not self.limiter.try_acquire():
+            if self.breaker is not None:
+                self.breaker.release()
+            self.sink.increment('s3_requests_rejected_total', endpoint=self.endpoint, reason='shed')
+            raise LoadShed(f'{self.endpoint} is at its concurrency limit of {int(self.limiter.limit)}')
+
+        started = time.perf_counter()
+        try:
+            response = await send()
+        except Exception as e:
+            overloaded = is_overload_error(e)
+            self._finished(command, time.perf_counter() - started, overloaded)
+            raise
+        except BaseException:
+            if self.breaker is not None:
+                self.breaker.release()
+            if self.limiter is not None:
+                self.limiter.release(command, None, False)
+            raise
+        self._finished(command, time.perf_counter() - started, False)
+        return response
+
+    def _finished(self, command: str, duration_s: float, overloaded: bool) -> None:
+        if self.breaker is not None:
+            self.breaker.record(overloaded, duration_s)
+        if self.limiter is not None:
+            self.limiter.release(command, duration_s, overloaded)
+
+
+_guards: dict[str, EndpointGuard] = {}
+
+
+def endpoint_guard(endpoint: str,
+                   pool_size: int,
+                   breaker: BreakerPolicy | None = None,
+                   limit: LimitPolicy | None = None,
+                   sink: MetricsSink = default_sink) -> EndpointGuard:
+    """The ``EndpointGuard`` of ``endpoint``, created with these settings by the first caller.
+
+    ``breaker``/``limit`` None leave that part out. ``pool_size`` is the connection pool size,
+    the default ceiling of the concurrency limit.
+    """
+    guard = _guards.get(endpoint)
+    if guard is None:
+        guard = _guards[endpoint] = EndpointGuard(
+            endpoint,
+            breaker=CircuitBreaker(breaker, endpoint, sink) if breaker is not None else None,
+            limiter=AdaptiveConcurrencyLimit(pool_size, limit, endpoint, sink) if limit is not None else None,
+            sink=sink,
+        )
+    return guard
@@ -0,0 +1,27 @@
+from dataclasses import dataclass
+from typing import Any, Hashable
+
+DEFAULT_EXPIRES_S = 3600
+# S3 allows up to 10000 parts per multipart upload
+MAX_PARTS = 10_000
+
+
+@dataclass
+class PresignedMultipartUpload:
+    """A multipart upload the client sends itself: PUT part ``n`` to ``part_urls[n - 1]``.
+
+    Each part response carries an ETag; hand the ``{'PartNumber': n, 'ETag': etag}`` list back
+    to complete the upload.
+    """
+    object_name: str
+    upload_id: str
+    part_urls: list[str]
+
+
+def presign_cache_key(command: str, params: dict[str, Any], expires_in: int) -> Hashable:
+    return command, tuple(sorted(params.items())), expires_in
+
+
+def check_part_count(part_count: int) -> None:
+    if not 1 <= part_count <= MAX_PARTS:
+        raise ValueError(f'A multipart upload has 1 to {MAX_PARTS} parts, got {part_count}')
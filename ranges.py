@@ -0,0 +1,142 @@
+import re
+import secrets
+from dataclasses import dataclass
+from typing import Any, AsyncIterable, AsyncIterator, NamedTuple
+
+# more ranges than this in one Range header are answered with the whole object
+MAX_RANGES = 16
+MULTIPART_BYTERANGES = 'multipart/byteranges; boundary={boundary}'
+
+_RANGE_SPEC = re.compile(r'^(\d*)-(\d*)$')
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    """None of the requested ranges overlaps the object; answer with 416 and ``Content-Range: bytes */size``."""
+
+    def __init__(self, header: str, size: int) -> None:
+        super().__init__(f'Range {header!r} is not satisfiable for {size} bytes')
+        self.size = size
+
+    @property
+    def content_range(self) -> str:
+        return f'bytes */{self.size}'
+
+
+class ByteRange(NamedTuple):
+    start: int
+    # inclusive, as in HTTP
+    end: int
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start + 1
+
+    def content_range(self, size: int | None) -> str:
+        return f"bytes {self.start}-{self.end}/{'*' if size is None else size}"
+
+
+def parse_range_header(header: str | None, size: int) -> list[ByteRange] | None:
+    """Resolve a ``Range`` request header against an object of ``size`` bytes.
+
+    Returns the ranges clipped to the object, or None when the header is absent, malformed
+    or asks for more than ``MAX_RANGES`` ranges; RFC 9110 lets the server answer those with
+    the whole object. Raises ``RangeNotSatisfiable`` when no range overlaps the object.
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+    specs = [spec.strip() for spec in specs.split(',')]
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        match = _RANGE_SPEC.match(spec)
+        if match is None or match.group(1) == match.group(2) == '':
+            return None
+        first, last = match.groups()
+        if first == '':
+            # suffix range: the last N bytes
+            if int(last) > 0 and size > 0:
+                ranges.append(ByteRange(max(0, size - int(last)), size - 1))
+            continue
+        start = int(first)
+        if last != '' and int(last) < start:
+            return None
+        if start < size:
+            ranges.append(ByteRange(start, size - 1 if last == '' else min(int(last), size - 1)))
+    if not ranges:
+        raise RangeNotSatisfiable(header, size)
+    return ranges
+
+
+def parse_content_range(value: str) -> tuple[ByteRange, int | None]:
+    """Split a ``Content-Range: bytes start-end/size`` response header; size is None for ``*``."""
+    match = _CONTENT_RANGE.match(value.strip())
+    if match is None:
+        raise ValueError(f'Malformed Content-Range {value!r}')
+    start, end, size = match.groups()
+    return ByteRange(int(start), int(end)), None if size == '*' else int(size)
+
+
+@dataclass
+class RangeResponse:
+    """One byte range of an object, ready for a 206 ``StreamingResponse``::
+
+        StreamingResponse(response.body, status_code=206, headers=response.headers,
+                          media_type=response.content_type)
+
+    ``body`` streams exactly ``length`` bytes and releases the connection once exhausted;
+    call ``aclose`` to release it early, even before ``body`` was started.
+    """
+    body: AsyncIterator[bytes]
+    byte_range: ByteRange
+    size: int | None
+    content_type: str | None = None
+    etag: str | None = None
+    # the response's StreamingBody: closing a generator that never started doesn't run its cleanup
+    raw_body: Any = None
+
+    @property
+    def length(self) -> int:
+        return self.byte_range.length
+
+    @property
+    def content_range(self) -> str:
+        return self.byte_range.content_range(self.size)
+
+    @property
+    def headers(self) -> dict[str, str]:
+        headers = {'Content-Range': self.content_range, 'Content-Length': str(self.length), 'Accept-Ranges': 'bytes'}
+        if self.etag is not None:
+            headers['ETag'] = self.etag
+        return headers
+
+    async def aclose(self) -> None:
+        await self.body.aclose()
+        if self.raw_body is not None:
+            self.raw_body.close()
+
+
+def new_boundary() -> str:
+    return secrets.token_hex(16)
+
+
+async def multipart_byteranges(responses: AsyncIterable[RangeResponse], boundary: str) -> AsyncIterator[bytes]:
+    """Frame several ranges as a ``multipart/byteranges`` body, streaming each part as it arrives.
+
+    Serve it with ``media_type=MULTIPART_BYTERANGES.format(boundary=boundary)`` and status 206.
+    """
+    async for response in responses:
+        part_headers = [f'--{boundary}']
+        if response.content_type:
+            part_headers.append(f'Content-Type: {response.content_type}')
+        part_headers.append(f'Content-Range: {response.content_range}')
+        yield ('\r\n'.join(part_headers) + '\r\n\r\n').encode()
+        async for chunk in response.body:
+            yield chunk
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode()
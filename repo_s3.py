@@ -1,35 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import io
 import logging
+import os
+from collections import deque
+from concurrent.futures import Executor
+from contextlib import aclosing
+from functools import partial
 from io import BufferedReader
-from typing import Any, Literal
+from typing import TYPE_CHECKING, Any, AsyncIterable, AsyncIterator, Awaitable, BinaryIO, Callable, Iterable, Literal
 
-from aiobotocore.client import AioBaseClient
-from aiobotocore.response import StreamingBody
 from botocore.exceptions import ClientError
-from fastapi import status
+# fastapi.status re-exports it; importing fastapi itself takes a few hundred milliseconds
+from starlette import status
 
+from aio_utils import SingleFlight, batched, bounded_as_completed, bounded_merge, ordered_prefetch
+from bodies import BytesBody, ChainedBody, ChecksumVerifyingBody, DecompressingBody, MappedBody
+from caches import MetadataCache, ObjectCache, PresignedUrlCache
+from checksums import (
+    FULL_OBJECT,
+    Checksum,
+    checksum_kwargs,
+    checksum_of,
+    new_checksum,
+    read_checksummed,
+    stored_checksum,
+)
+from content_codecs import CODEC_METADATA_KEY, Codec, CompressionPolicy, compress_parts, get_codec
+from copies import COPY_MAX_SIZE, COPY_PART_SIZE, copied_headers, copy_source_ranges
+from dedup import DigestIndex, HashingReader, IndexedObject, stream_sha256
+from disk_cache import CachedFile, DiskCache
+from metrics import RequestMetrics, loggable_kwargs
+from overload import EndpointGuard, Overloaded
+from presigned import DEFAULT_EXPIRES_S, MAX_PARTS, PresignedMultipartUpload, check_part_count, presign_cache_key
+from ranges import ByteRange, RangeResponse, parse_content_range
+from resilience import HEDGEABLE_COMMANDS, RETRYABLE_COMMANDS, DeadlineExceeded, Resilience, stream_position
 from some_module.config import settings
 
+if TYPE_CHECKING:
+    from aiobotocore.client import AioBaseClient
+    from aiobotocore.response import StreamingBody
+
 logger = logging.getLogger(__name__)
 
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+# S3 rejects parts smaller than 5 MiB, except for the last one
+MULTIPART_MIN_CHUNKSIZE = 5 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+MULTIPART_MAX_CONCURRENCY = 4
+DOWNLOAD_PART_SIZE = 8 * 1024 * 1024
+DOWNLOAD_MAX_CONCURRENCY = 4
+RANGE_CHUNK_SIZE = 64 * 1024
+# coalesced reads buffer the whole body once for all their callers
+COALESCE_MAX_BYTES = 4 * 1024 * 1024
+# checksumming less than this takes less time than handing it to the executor
+CHECKSUM_INLINE_MAX_SIZE = 64 * 1024
+# botocore's default max_pool_connections, used when the client doesn't expose its config
+DEFAULT_POOL_SIZE = 10
+# DeleteObjects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+DELETE_MAX_CONCURRENCY = 4
+# ListObjectsV2 returns at most 1000 keys per page
+LIST_PAGE_SIZE = 1000
+
+# (object_name, data, content_type) as taken by put_some_stuff
+PutItem = tuple[str, BufferedReader, str]
+
+
 class SomeStuffRepositoryError(RepositoryError):
     pass
 
+
+def _stream_size(data: BufferedReader) -> int | None:
+    """Bytes left in ``data`` or None when the stream can't tell without being read."""
+    try:
+        size = os.fstat(data.fileno()).st_size - data.tell()
+    except (AttributeError, OSError, TypeError, ValueError):
+        try:
+            if not data.seekable():
+                return None
+            position = data.tell()
+            size = data.seek(0, io.SEEK_END) - position
+            data.seek(position)
+        except (AttributeError, OSError, TypeError, ValueError):
+            return None
+    return size if isinstance(size, int) else None
+
+
+async def _read_parts(data: BufferedReader, part_size: int) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    while part := await loop.run_in_executor(None, data.read, part_size):
+        yield part
+
+
+async def _regroup(chunks: AsyncIterator[bytes], part_size: int) -> AsyncIterator[bytes]:
+    """``chunks`` as parts of ``part_size`` bytes, the last one shorter."""
+    part = bytearray()
+    async for chunk in chunks:
+        part += chunk
+        while len(part) >= part_size:
+            yield bytes(part[:part_size])
+            del part[:part_size]
+    if part:
+        yield bytes(part)
+
+
+async def _prepend(items: list[bytes], rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    for item in items:
+        yield item
+    async for item in rest:
+        yield item
+
+
+def _client_error_status_code(error: SomeStuffRepositoryError) -> int | None:
+    """HTTP status of the S3 error behind ``error``, if there is one."""
+    cause = error.__cause__
+    if isinstance(cause, ClientError):
+        return cause.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return None
+
+
+async def _iter_streaming_body(body: StreamingBody, chunk_size: int) -> AsyncIterator[bytes]:
+    async with body:
+        async for chunk in body.iter_chunks(chunk_size):
+            yield chunk
+
+
+def _byte_ranges(size: int, part_size: int) -> list[tuple[int, int]]:
+    """Inclusive ``(start, end)`` pairs covering ``size`` bytes."""
+    return [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+
 class SomeStuffRepository:
 
-    def __init__(self, s3_client: AioBaseClient, bucket: str = settings.S3_BUCKET) -> None:
+    def __init__(self,
+                 s3_client: AioBaseClient,
+                 bucket: str = settings.S3_BUCKET,
+                 multipart_threshold: int = MULTIPART_THRESHOLD,
+                 multipart_chunksize: int = MULTIPART_CHUNKSIZE,
+                 multipart_max_concurrency: int = MULTIPART_MAX_CONCURRENCY,
+                 object_cache: ObjectCache | None = None,
+                 metadata_cache: MetadataCache | None = None,
+                 coalesce_reads: bool = False,
+                 coalesce_max_bytes: int = COALESCE_MAX_BYTES,
+                 resilience: Resilience | None = None,
+                 request_metrics: RequestMetrics | None = None,
+                 compression: CompressionPolicy | None = None,
+                 codec_executor: Executor | None = None,
+                 digest_index: DigestIndex | None = None,
+                 presigned_url_cache: PresignedUrlCache | None = None,
+                 checksum_algorithm: str | None = None,
+                 verify_checksums: bool = False,
+                 guard: EndpointGuard | None = None,
+                 disk_cache: DiskCache | None = None) -> None:
         logger.debug('Creating minio client')
         self.s3_client = s3_client
         self.bucket = bucket
+        self.multipart_threshold = multipart_threshold
+        if multipart_chunksize < MULTIPART_MIN_CHUNKSIZE:
+            raise ValueError(f'multipart_chunksize must be at least {MULTIPART_MIN_CHUNKSIZE} bytes, '
+                             f'got {multipart_chunksize}')
+        self.multipart_chunksize = multipart_chunksize
+        self.multipart_max_concurrency = multipart_max_concurrency
+        self.object_cache = object_cache
+        self.metadata_cache = metadata_cache
+        # concurrent get/head of the same key share one request; bodies are buffered to fan them out
+        self.single_flight = SingleFlight() if coalesce_reads else None
+        self.coalesce_max_bytes = coalesce_max_bytes
+        self.pool_size = self._client_pool_size()
+        self.resilience = resilience
+        if resilience is not None and resilience.max_in_flight is None:
+            resilience.max_in_flight = self.pool_size
+        self.request_metrics = request_metrics
+        # compressed objects are decoded by get_some_stuff; range and parallel reads see the stored bytes
+        self.compression = compression
+        self.codec_executor = codec_executor
+        # uploads of content the index already knows become server-side copies
+        self.digest_index = digest_index
+        self.presigned_url_cache = presigned_url_cache
+        # uploads carry a checksum S3 checks them against ('CRC32', 'CRC32C' or 'SHA256')
+        if checksum_algorithm is not None:
+            # fail now rather than on the first upload if the algorithm is unknown or unavailable
+            new_checksum(checksum_algorithm)
+        self.checksum_algorithm = checksum_algorithm
+        # get_some_stuff checks what it reads against the stored checksum; ranges can't be checked
+        self.verify_checksums = verify_checksums
+        # circuit breaker and concurrency limit shared by every adapter of the endpoint, see endpoint_guard
+        self.guard = guard
+        # read-through tier under object_cache, for working sets larger than memory
+        self.disk_cache = disk_cache
+        # shared by all bulk calls, so together they never ask for more connections than the pool has
+        self._pool_slots = asyncio.Semaphore(self.pool_size)
+
+    def _part_size(self, size: int | None) -> int:
+        """``multipart_chunksize``, grown so that ``size`` bytes fit in ``MAX_PARTS`` parts."""
+        if size is None:
+            return self.multipart_chunksize
+        return max(self.multipart_chunksize, -(-size // MAX_PARTS))
+
+    def _client_pool_size(self) -> int:
+        config = getattr(getattr(self.s3_client, 'meta', None), 'config', None)
+        pool_size = getattr(config, 'max_pool_connections', None)
+        return pool_size if isinstance(pool_size, int) and pool_size > 0 else DEFAULT_POOL_SIZE
 
     async def _send_request(self, command: str, request_kwargs: dict[str, Any]) -> tuple[dict, int]:
+        if self.request_metrics is None:
+            return await self._dispatch_request(command, request_kwargs)
+
+        token = self.request_metrics.started(request_kwargs)
+        response, http_status_code = None, 0
+        try:
+            response, http_status_code = await self._dispatch_request(command, request_kwargs)
+            return response, http_status_code
+        except SomeStuffRepositoryError as e:
+            http_status_code = _client_error_status_code(e) or 0
+            raise
+        finally:
+            self.request_metrics.finished(command, token, http_status_code, request_kwargs, response)
+
+    async def _dispatch_request(self, command: str, request_kwargs: dict[str, Any]) -> tuple[dict, int]:
         try:
             request_command = getattr(self.s3_client, command)
-            logger.debug('Sending request %s with kwargs %s', command, request_kwargs)
-            response = await request_command(
-                Bucket=self.bucket,
-                **request_kwargs,
-            )
-            logger.debug('S3 Client returning response command=%s request_kwargs=%s', command, request_kwargs)
+            # formatting the kwargs would render the whole request Body
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Sending request %s with kwargs %s', command, loggable_kwargs(request_kwargs))
+            response = await self._call_client(command, request_command, request_kwargs)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('S3 Client returning response command=%s request_kwargs=%s',
+                             command, loggable_kwargs(request_kwargs))
             http_status_code = response['ResponseMetadata']['HTTPStatusCode']
             return response, http_status_code
         except AttributeError as e:
@@ -38,47 +237,1123 @@ class SomeStuffRepository:
             error = e.response.get('Error', {})
             try:
                 code = e.response['ResponseMetadata']['HTTPStatusCode']
-                raise SomeStuffRepositoryError(f'{request_kwargs=}, {command=}. Error {error=}, {code=}') from e
+                raise SomeStuffRepositoryError(f'request_kwargs={loggable_kwargs(request_kwargs)}, {command=}. '
+                                               f'Error {error=}, {code=}') from e
             except KeyError as e:
-                raise SomeStuffRepositoryError(f'Images storage communication problem {request_kwargs=}, {command=}') from e
+                raise SomeStuffRepositoryError(f'Images storage communication problem '
+                                               f'request_kwargs={loggable_kwargs(request_kwargs)}, {command=}') from e
         except KeyError as e:
-            raise SomeStuffRepositoryError(f'Unexpected response for {request_kwargs=}, {command=}') from e
+            raise SomeStuffRepositoryError(f'Unexpected response for '
+                                           f'request_kwargs={loggable_kwargs(request_kwargs)}, {command=}') from e
+        except DeadlineExceeded as e:
+            raise SomeStuffRepositoryError(f'request_kwargs={loggable_kwargs(request_kwargs)}, {command=}. {e}') from e
+        except Overloaded as e:
+            raise SomeStuffRepositoryError(f'{command=} was not sent. {e}') from e
         except Exception as e:
             raise SomeStuffRepositoryError('Unexpected error') from e
 
+    async def _call_client(self,
+                           command: str,
+                           request_command: Callable[..., Awaitable[dict]],
+                           request_kwargs: dict[str, Any]) -> dict:
+        if self.resilience is None:
+            return await self._send_attempt(command, request_command, request_kwargs)
+        return await self._send_resilient_request(command, request_command, request_kwargs)
+
+    async def _send_attempt(self,
+                            command: str,
+                            request_command: Callable[..., Awaitable[dict]],
+                            request_kwargs: dict[str, Any]) -> dict:
+        """Send the request once; the guard counts every retry and hedge as a request of its own."""
+        # copies may target another bucket
+        send = partial(request_command, **{'Bucket': self.bucket, **request_kwargs})
+        if self.guard is None:
+            return await send()
+        return await self.guard.call(command, send)
+
+    async def _send_resilient_request(self,
+                                      command: str,
+                                      request_command: Callable[..., Awaitable[dict]],
+                                      request_kwargs: dict[str, Any]) -> dict:
+        body = request_kwargs.get('Body')
+        position = stream_position(body)
+
+        async def attempt() -> dict:
+            if position is not None:
+                body.seek(position)
+            return await self._send_attempt(command, request_command, request_kwargs)
+
+        # a partly consumed stream can only be sent again if it can be rewound
+        rewindable = body is None or isinstance(body, (bytes, bytearray, memoryview)) or position is not None
+        return await self.resilience.call(
+            command,
+            attempt,
+            retryable=command in RETRYABLE_COMMANDS and rewindable,
+            hedgeable=command in HEDGEABLE_COMMANDS,
+        )
+
+    async def _invalidate(self, object_name: str) -> None:
+        if self.object_cache is not None:
+            self.object_cache.invalidate(self.bucket, object_name)
+        if self.metadata_cache is not None:
+            self.metadata_cache.invalidate(self.bucket, object_name)
+        if self.single_flight is not None:
+            self.single_flight.forget(('get_object', object_name))
+            self.single_flight.forget(('head_object', object_name))
+        if self.disk_cache is not None:
+            await self.disk_cache.invalidate(self.bucket, object_name)
+
     async def put_some_stuff(self, object_name: str, data: BufferedReader, content_type: str) -> Literal[True]:
+        try:
+            if self.digest_index is not None:
+                await self._put_some_stuff_deduplicated(object_name, data, content_type)
+            else:
+                await self._put_some_stuff(object_name, data, content_type)
+            return True
+        finally:
+            await self._invalidate(object_name)
+
+    async def put_some_stuff_chunks(self,
+                                    object_name: str,
+                                    chunks: AsyncIterator[bytes],
+                                    request_kwargs: dict[str, Any]) -> Literal[True]:
+        """Upload ``chunks`` as they arrive, e.g. another object's body, with put_object headers in ``request_kwargs``.
+
+        The bytes are stored as they are, neither compressed nor deduplicated, so the
+        ContentEncoding and Metadata of an object that already is compressed can be carried over.
+        They are sent a part at a time, as a single put_object if they fit in one part.
+        """
+        try:
+            if self.digest_index is not None:
+                await self.digest_index.discard_keys([object_name])
+            part_size = self.multipart_chunksize
+            parts = _regroup(chunks, part_size)
+            first_part = await anext(parts, b'')
+            second_part = await anext(parts, None)
+            if second_part is None:
+                await self._put_some_stuff_bytes(object_name, first_part, request_kwargs)
+            else:
+                await self._put_some_stuff_multipart(object_name, _prepend([first_part, second_part], parts),
+                                                     part_size, request_kwargs)
+            return True
+        finally:
+            await self._invalidate(object_name)
+
+    async def _put_some_stuff_deduplicated(self, object_name: str, data: BufferedReader, content_type: str) -> None:
+        """Copy an object already holding the same bytes instead of uploading them again.
+
+        The index is keyed by digest and content type, so a copy also carries over the codec and
+        headers the upload would have produced. Uploads of one digest are serialised by the
+        index's lock, so concurrent uploads of new content send it once and copy it for the rest.
+        """
+        size = _stream_size(data)
+        if size is not None and size > COPY_MAX_SIZE:
+            await self.digest_index.discard_keys([object_name])
+            await self._put_some_stuff(object_name, data, content_type)
+            return
+        if size is None:
+            # can't be rewound after hashing: hashed while it is sent, so only later uploads are spared
+            reader = HashingReader(data)
+            await self.digest_index.discard_keys([object_name])
+            etag = await self._put_some_stuff(object_name, reader, content_type)
+            if etag is not None:
+                await self.digest_index.add(f'{reader.hexdigest()}:{content_type}', object_name, etag)
+            return
+
+        loop = asyncio.get_running_loop()
+        digest = f'{await loop.run_in_executor(None, stream_sha256, data)}:{content_type}'
+        async with self.digest_index.lock(digest):
+            await self.digest_index.discard_keys([object_name])
+            source = await self.digest_index.get(digest)
+            if source is not None and source.key != object_name:
+                if await self._copy_deduplicated(object_name, source):
+                    return
+                await self.digest_index.discard(digest, source.key)
+            etag = await self._put_some_stuff(object_name, data, content_type)
+            if etag is not None:
+                await self.digest_index.add(digest, object_name, etag)
+
+    async def _copy_deduplicated(self, object_name: str, source: IndexedObject) -> bool:
+        """Copy ``source`` to ``object_name`` unless it was removed or overwritten since it was indexed."""
+        request_kwargs = {
+            'Key': object_name,
+            'CopySource': {'Bucket': self.bucket, 'Key': source.key},
+            'CopySourceIfMatch': source.etag,
+            'MetadataDirective': 'COPY',
+        }
+        try:
+            _, http_status_code = await self._send_request('copy_object', request_kwargs)
+        except SomeStuffRepositoryError as e:
+            if _client_error_status_code(e) in (status.HTTP_404_NOT_FOUND, status.HTTP_412_PRECONDITION_FAILED):
+                return False
+            raise
+        if http_status_code != status.HTTP_200_OK:
+            raise SomeStuffRepositoryError(f'Upload some_stuff {object_name=} as a copy of {source.key!r} failed. '
+                                           f'Response code: {http_status_code}')
+        return True
+
+    async def _put_some_stuff(self, object_name: str, data: BufferedReader, content_type: str) -> str | None:
+        """Upload ``data`` and return the new object's ETag."""
+        size = _stream_size(data)
+        codec = self.compression.codec_for(content_type, size) if self.compression is not None else None
+        if codec is not None:
+            return await self._put_some_stuff_compressed(object_name, data, content_type, codec, size)
+        if self.checksum_algorithm is not None:
+            return await self._put_some_stuff_checksummed(object_name, data, content_type, size)
+        if size is not None and size >= self.multipart_threshold:
+            part_size = self._part_size(size)
+            return await self._put_some_stuff_multipart(
+                object_name,
+                _read_parts(data, part_size),
+                part_size,
+                {'ContentType': content_type},
+            )
+
         request_kwargs = {
             'Key': object_name,
             'Body': data,
             'ContentType': content_type,
         }
-        _, http_status_code = await self._send_request('put_object', request_kwargs)
+        response, http_status_code = await self._send_request('put_object', request_kwargs)
 
         if http_status_code != status.HTTP_200_OK:
             raise SomeStuffRepositoryError(f'Upload some_stuff {object_name=} failed. Response code: {http_status_code}')
 
-        return True
+        return response.get('ETag')
+
+    async def _put_some_stuff_compressed(self,
+                                         object_name: str,
+                                         data: BufferedReader,
+                                         content_type: str,
+                                         codec: Codec,
+                                         size: int | None) -> str | None:
+        """Compress ``data`` on the fly; one put_object below ``multipart_threshold``, a multipart upload otherwise.
+
+        The compressed size is only known once compressed, so compressed parts are held until
+        they reach the threshold.
+        """
+        request_kwargs = {
+            'ContentType': content_type,
+            'ContentEncoding': codec.name,
+            'Metadata': {CODEC_METADATA_KEY: codec.name},
+        }
+        # the uncompressed size bounds the compressed one, give or take the codec's framing
+        part_size = self._part_size(size)
+        parts = compress_parts(data, codec, part_size, self.codec_executor)
+        held: list[bytes] = []
+        held_size = 0
+        async for part in parts:
+            held.append(part)
+            held_size += len(part)
+            if held_size >= self.multipart_threshold:
+                return await self._put_some_stuff_multipart(object_name, _prepend(held, parts), part_size,
+                                                            request_kwargs)
+
+        return await self._put_some_stuff_bytes(object_name, b''.join(held), request_kwargs)
+
+    async def _put_some_stuff_checksummed(self,
+                                          object_name: str,
+                                          data: BufferedReader,
+                                          content_type: str,
+                                          size: int | None) -> str | None:
+        """Upload ``data`` with checksums of the bytes that are sent.
+
+        A checksum goes in the request headers, so the body has to be read first. Streams below
+        ``multipart_threshold`` are read into memory in ``codec_executor``, checksummed a chunk
+        at a time as they are read, and sent. Larger ones and those of unknown size are sent a
+        part at a time, each checksummed as it is read, as a single put_object if they fit in one part.
+        """
+        request_kwargs = {'ContentType': content_type}
+        if size is not None and size < self.multipart_threshold:
+            loop = asyncio.get_running_loop()
+            body, checksum = await loop.run_in_executor(self.codec_executor, read_checksummed,
+                                                        self.checksum_algorithm, data)
+            return await self._put_some_stuff_bytes(object_name, body, request_kwargs, checksum)
+        part_size = self._part_size(size)
+        parts = _read_parts(data, part_size)
+        first_part = await anext(parts, b'')
+        second_part = await anext(parts, None)
+        if second_part is None:
+            return await self._put_some_stuff_bytes(object_name, first_part, request_kwargs)
+        return await self._put_some_stuff_multipart(object_name, _prepend([first_part, second_part], parts),
+                                                    part_size, request_kwargs)
+
+    async def _put_some_stuff_bytes(self,
+                                    object_name: str,
+                                    body: bytes,
+                                    request_kwargs: dict[str, Any],
+                                    checksum: Checksum | None = None) -> str | None:
+        request_kwargs = {'Key': object_name, 'Body': body, **request_kwargs}
+        if self.checksum_algorithm is not None:
+            if checksum is None:
+                checksum = await self._checksum(body)
+            request_kwargs.update(checksum_kwargs(checksum))
+        response, http_status_code = await self._send_request('put_object', request_kwargs)
+        if http_status_code != status.HTTP_200_OK:
+            raise SomeStuffRepositoryError(f'Upload some_stuff {object_name=} failed. Response code: {http_status_code}')
+        return response.get('ETag')
+
+    async def _checksum(self, body: bytes) -> Checksum:
+        if len(body) < CHECKSUM_INLINE_MAX_SIZE:
+            return checksum_of(self.checksum_algorithm, body)
+        loop = asyncio.get_running_loop()
+        # zlib, crc32c and hashlib release the GIL on large buffers
+        return await loop.run_in_executor(self.codec_executor, checksum_of, self.checksum_algorithm, body)
+
+    async def _put_some_stuff_multipart(self,
+                                        object_name: str,
+                                        parts: AsyncIterator[bytes],
+                                        part_size: int,
+                                        request_kwargs: dict[str, Any]) -> str | None:
+        """Upload ``parts`` of ``part_size`` bytes, the last one shorter, concurrently as one multipart upload.
+
+        A part is read only once a slot is free, so at most ``multipart_max_concurrency`` parts are
+        held in memory. Any failure aborts the upload so S3 doesn't keep the uploaded parts.
+
+        With ``checksum_algorithm`` each part carries its checksum. CRC part checksums are combined
+        into the whole object's, so it can be checked on download; SHA-256 ones are only COMPOSITE.
+        """
+        algorithm = self.checksum_algorithm
+        if algorithm is not None:
+            request_kwargs = {**request_kwargs, 'ChecksumAlgorithm': algorithm,
+                              'ChecksumType': new_checksum(algorithm).checksum_type}
+        response, _ = await self._send_request('create_multipart_upload', {'Key': object_name, **request_kwargs})
+        upload_id = response['UploadId']
+        slots = asyncio.Semaphore(self.multipart_max_concurrency)
+        failed = asyncio.Event()
+        uploads: list[asyncio.Task] = []
+        # part number -> (checksum, length)
+        part_checksums: dict[int, tuple[Checksum, int]] = {}
+
+        async def upload_part(part_number: int, body: bytes) -> dict[str, Any]:
+            try:
+                part_kwargs = {'Key': object_name, 'UploadId': upload_id, 'PartNumber': part_number, 'Body': body}
+                part = {'PartNumber': part_number}
+                if algorithm is not None:
+                    checksum = await self._checksum(body)
+                    part_checksums[part_number] = checksum, len(body)
+                    part_kwargs.update(checksum_kwargs(checksum))
+                    part[f'Checksum{algorithm}'] = checksum.b64digest()
+                part_response, _ = await self._send_request('upload_part', part_kwargs)
+                return {'ETag': part_response['ETag'], **part}
+            except BaseException:
+                failed.set()
+                raise
+            finally:
+                slots.release()
+
+        try:
+            part_number = 0
+            while True:
+                await slots.acquire()
+                if failed.is_set():
+                    slots.release()
+                    break
+                try:
+                    body = await anext(parts)
+                except StopAsyncIteration:
+                    slots.release()
+                    break
+                part_number += 1
+                if part_number > MAX_PARTS:
+                    raise SomeStuffRepositoryError(f'Upload some_stuff {object_name=} failed. '
+                                                   f'It needs more than {MAX_PARTS} parts of '
+                                                   f'{part_size} bytes')
+                uploads.append(asyncio.create_task(upload_part(part_number, body)))
+
+            uploaded_parts = await asyncio.gather(*uploads)
+            complete_kwargs = {
+                'Key': object_name,
+                'UploadId': upload_id,
+                'MultipartUpload': {'Parts': uploaded_parts},
+            }
+            if algorithm is not None and request_kwargs['ChecksumType'] == FULL_OBJECT:
+                checksum = new_checksum(algorithm)
+                for part_number in sorted(part_checksums):
+                    part_checksum, length = part_checksums[part_number]
+                    checksum.combine(part_checksum.value, length)
+                complete_kwargs[f'Checksum{algorithm}'] = checksum.b64digest()
+                complete_kwargs['ChecksumType'] = FULL_OBJECT
+            completed, http_status_code = await self._send_request('complete_multipart_upload', complete_kwargs)
+        except BaseException:
+            for upload in uploads:
+                upload.cancel()
+            await asyncio.gather(*uploads, return_exceptions=True)
+            await self._abort_multipart_upload(object_name, upload_id)
+            raise
+
+        if http_status_code != status.HTTP_200_OK:
+            raise SomeStuffRepositoryError(f'Upload some_stuff {object_name=} failed. Response code: {http_status_code}')
+
+        return completed.get('ETag')
+
+    async def _abort_multipart_upload(self, object_name: str, upload_id: str, bucket: str | None = None) -> None:
+        request_kwargs = {'Bucket': bucket or self.bucket, 'Key': object_name, 'UploadId': upload_id}
+        try:
+            await self._send_request('abort_multipart_upload', request_kwargs)
+        except SomeStuffRepositoryError:
+            logger.exception('Abort of multipart upload %s for %s failed', upload_id, object_name)
 
     async def get_some_stuff(self, object_name: str) -> StreamingBody:
+        if self.single_flight is None:
+            return await self._get_some_stuff(object_name)
+        shared = await self.single_flight.do(('get_object', object_name),
+                                             lambda: self._read_some_stuff(object_name))
+        if isinstance(shared, bytes):
+            return BytesBody(shared)
+        # too large to buffer: the first caller gets the shared body, the others read their own
+        if shared:
+            return shared.pop()
+        return await self._get_some_stuff(object_name)
+
+    async def _read_some_stuff(self, object_name: str) -> bytes | list[ChainedBody]:
+        """The object's bytes when there are at most ``coalesce_max_bytes``, for all callers to share.
+
+        The body is read until it ends or grows past the limit, so its decoded size counts, also
+        of compressed objects. A larger one is handed back whole, in a list for one caller to take.
+        """
+        body = await self._get_some_stuff(object_name)
+        chunks = []
+        size = 0
+        try:
+            while chunk := await body.read(self.coalesce_max_bytes + 1 - size):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > self.coalesce_max_bytes:
+                    return [ChainedBody(BytesBody(b''.join(chunks)), body)]
+        except BaseException:
+            body.close()
+            raise
+        body.close()
+        return b''.join(chunks)
+
+    async def _get_some_stuff(self, object_name: str) -> StreamingBody:
+        if self.object_cache is not None:
+            return await self._get_some_stuff_cached(object_name)
+        if self.disk_cache is not None:
+            return await self._get_some_stuff_from_disk(object_name)
+        return await self._get_some_stuff_uncached(object_name)
+
+    async def _get_some_stuff_uncached(self, object_name: str) -> StreamingBody:
         request_kwargs = {'Key': object_name}
+        if self.verify_checksums:
+            request_kwargs['ChecksumMode'] = 'ENABLED'
         response, http_status_code = await self._send_request('get_object', request_kwargs)
 
         if http_status_code != status.HTTP_200_OK:
             raise SomeStuffRepositoryError(f'Get some_stuff {object_name=} failed. Response code: {http_status_code}')
 
-        data = response['Body']
+        return self._decoded_body(object_name, response)
+
+    def _decoded_body(self, object_name: str, response: dict) -> StreamingBody | DecompressingBody:
+        body = self._verified_body(object_name, response)
+        codec_name = response.get('Metadata', {}).get(CODEC_METADATA_KEY)
+        if codec_name is None:
+            return body
+        try:
+            codec = get_codec(codec_name)
+        except (ImportError, ValueError) as e:
+            body.close()
+            raise SomeStuffRepositoryError(f'Get some_stuff {object_name=} failed. Cannot decode it: {e}') from e
+        return DecompressingBody(body, codec.decompressor(), self.codec_executor)
+
+    def _verified_body(self, object_name: str, response: dict) -> StreamingBody | ChecksumVerifyingBody:
+        """Check the stored bytes, before decompression, against the checksum S3 keeps for them."""
+        body = response['Body']
+        checksum = stored_checksum(response) if self.verify_checksums else None
+        if checksum is None:
+            return body
+        algorithm, expected = checksum
+        # botocore already checks bodies it was asked the checksum for; only its error is translated
+        if hasattr(body, '_validate_checksum'):
+            return ChecksumVerifyingBody(body, None, expected, self._checksum_error(object_name))
+        try:
+            running_checksum = new_checksum(algorithm)
+        except ImportError:
+            logger.debug('Not verifying %s of some_stuff %s without the crc32c package', algorithm, object_name)
+            return body
+        return ChecksumVerifyingBody(body, running_checksum, expected, self._checksum_error(object_name))
+
+    @staticmethod
+    def _checksum_error(object_name: str) -> Callable[[str], SomeStuffRepositoryError]:
+        return lambda message: SomeStuffRepositoryError(f'Get some_stuff {object_name=} failed. {message}')
+
+    async def _get_some_stuff_cached(self, object_name: str) -> StreamingBody | BytesBody:
+        cache = self.object_cache
+        entry = cache.lookup(self.bucket, object_name)
+        if entry is not None and cache.is_fresh(entry):
+            return BytesBody(entry.data)
+        if entry is None and self.disk_cache is not None:
+            return await self._get_some_stuff_cached_from_disk(object_name)
+
+        request_kwargs = {'Key': object_name}
+        if entry is not None:
+            request_kwargs['IfNoneMatch'] = entry.etag
+        if self.verify_checksums:
+            request_kwargs['ChecksumMode'] = 'ENABLED'
+        generation = cache.generation
+        try:
+            response, http_status_code = await self._send_request('get_object', request_kwargs)
+        except SomeStuffRepositoryError as e:
+            if entry is not None and _client_error_status_code(e) == status.HTTP_304_NOT_MODIFIED:
+                cache.revalidated(entry)
+                return BytesBody(entry.data)
+            raise
+
+        if http_status_code != status.HTTP_200_OK:
+            raise SomeStuffRepositoryError(f'Get some_stuff {object_name=} failed. Response code: {http_status_code}')
+
+        if not cache.accepts(response.get('ContentLength')):
+            cache.record_miss()
+            return self._decoded_body(object_name, response)
+        async with self._decoded_body(object_name, response) as body:
+            data = await body.read()
+        cache.store(self.bucket, object_name, data, response['ETag'], response.get('ContentType'), generation)
+        return BytesBody(data)
+
+    async def _get_some_stuff_cached_from_disk(self, object_name: str) -> StreamingBody | BytesBody | MappedBody:
+        """Fill object_cache from the disk tier, which fetches what it misses."""
+        cache = self.object_cache
+        generation = cache.generation
+        cached = await self._read_through_disk(object_name)
+        if not isinstance(cached, CachedFile):
+            cache.record_miss()
+            return cached
+        body = await self._open_cached_file(cached)
+        if not cache.accepts(cached.size):
+            cache.record_miss()
+            return body
+        async with body:
+            data = await body.read()
+        cache.store(self.bucket, object_name, data, cached.etag, cached.content_type, generation)
+        return BytesBody(data)
+
+    async def _get_some_stuff_from_disk(self, object_name: str) -> StreamingBody | MappedBody:
+        cached = await self._read_through_disk(object_name)
+        if isinstance(cached, CachedFile):
+            return await self._open_cached_file(cached)
+        return cached
+
+    async def _open_cached_file(self, cached: CachedFile) -> StreamingBody | MappedBody:
+        try:
+            return cached.open()
+        except FileNotFoundError:
+            # evicted or invalidated since it was looked up, or lost: then its entry has to go
+            await self.disk_cache.discard(cached)
+            return await self._get_some_stuff_uncached(cached.key)
+
+    async def _read_through_disk(self, object_name: str) -> CachedFile | StreamingBody | MappedBody | ChainedBody:
+        """The object's entry in disk_cache, fetched into it on a miss, or its body when it isn't kept.
+
+        Entries hold decoded bodies, checked against their checksum when verify_checksums is set.
+        The stored size can only rule out bodies too large for the cache, as a compressed one grows
+        when decoded; the cache bounds what it writes.
+        """
+        cache = self.disk_cache
+        entry = await cache.lookup(self.bucket, object_name)
+        if entry is not None and cache.is_fresh(entry):
+            return entry
+
+        request_kwargs = {'Key': object_name}
+        if entry is not None:
+            request_kwargs['IfNoneMatch'] = entry.etag
+        if self.verify_checksums:
+            request_kwargs['ChecksumMode'] = 'ENABLED'
+        generation = cache.generation
+        try:
+            response, http_status_code = await self._send_request('get_object', request_kwargs)
+        except SomeStuffRepositoryError as e:
+            if entry is not None and _client_error_status_code(e) == status.HTTP_304_NOT_MODIFIED:
+                await cache.revalidated(entry)
+                return entry
+            raise
+
+        if http_status_code != status.HTTP_200_OK:
+            raise SomeStuffRepositoryError(f'Get some_stuff {object_name=} failed. Response code: {http_status_code}')
+
+        if not cache.accepts(response.get('ContentLength')):
+            cache.record_miss()
+            return self._decoded_body(object_name, response)
+        return await cache.store(self.bucket, object_name, self._decoded_body(object_name, response),
+                                 response['ETag'], response.get('ContentType'), generation)
+
+    async def get_some_stuff_file(self, object_name: str) -> CachedFile | None:
+        """The object's entry in disk_cache, fetched into it on a miss, with its file open to serve with ``sendfile``.
+
+        The open file stays readable when the entry is evicted meanwhile; ``close`` the entry once
+        it was sent. None when the cache doesn't keep the object: it is larger than the cache
+        takes, or was overwritten or evicted before it was opened. Read it with get_some_stuff then.
+        """
+        if self.disk_cache is None:
+            raise RuntimeError('get_some_stuff_file needs a disk_cache')
+        cached = await self._read_through_disk(object_name)
+        if not isinstance(cached, CachedFile):
+            cached.close()
+            return None
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.disk_cache.executor, cached.open_file)
+        except FileNotFoundError:
+            await self.disk_cache.discard(cached)
+            return None
+        return cached
+
+    async def get_some_stuff_range(self,
+                                   object_name: str,
+                                   start: int,
+                                   end: int | None = None,
+                                   etag: str | None = None,
+                                   chunk_size: int = RANGE_CHUNK_SIZE) -> RangeResponse:
+        """Read bytes ``start`` to ``end`` inclusive, or to the end of the object when ``end`` is None.
+
+        Maps to a single S3 ``Range`` request. ``end`` past the object is clipped by S3, which
+        answers a ``start`` past the object with 416, raised as SomeStuffRepositoryError.
+        With ``etag`` the read fails instead of mixing in bytes from a newer version.
+        """
+        request_kwargs = {'Key': object_name, 'Range': f"bytes={start}-{'' if end is None else end}"}
+        if etag is not None:
+            request_kwargs['IfMatch'] = etag
+        response, http_status_code = await self._send_request('get_object', request_kwargs)
+        if http_status_code != status.HTTP_206_PARTIAL_CONTENT:
+            if 'Body' in response:
+                response['Body'].close()
+            raise SomeStuffRepositoryError(f"Get some_stuff {object_name=} range {request_kwargs['Range']} failed. "
+                                           f'Response code: {http_status_code}')
+        byte_range, size = parse_content_range(response['ContentRange'])
+        return RangeResponse(_iter_streaming_body(response['Body'], chunk_size), byte_range, size,
+                             response.get('ContentType'), response.get('ETag'), raw_body=response['Body'])
+
+    async def get_some_stuff_ranges(self,
+                                    object_name: str,
+                                    ranges: Iterable[ByteRange | tuple[int, int]],
+                                    max_concurrency: int = DOWNLOAD_MAX_CONCURRENCY,
+                                    chunk_size: int = RANGE_CHUNK_SIZE) -> AsyncIterator[RangeResponse]:
+        """Yield a RangeResponse per range, in order, e.g. for ``ranges.multipart_byteranges``.
+
+        S3 serves one range per request, so up to ``max_concurrency`` ranges are requested
+        ahead of the consumer. Every range is pinned to the ETag of the first one.
+        """
+        ranges = iter(ranges)
+        first = next(ranges, None)
+        if first is None:
+            return
+        response = await self.get_some_stuff_range(object_name, *first, chunk_size=chunk_size)
+        etag = response.etag
+        yield response
+        # closed with this generator, so ranges fetched ahead are discarded right away
+        async with aclosing(ordered_prefetch(
+            lambda byte_range: self.get_some_stuff_range(object_name, *byte_range, etag=etag, chunk_size=chunk_size),
+            ranges, max_concurrency, discard=RangeResponse.aclose,
+        )) as responses:
+            async for response in responses:
+                yield response
+
+    async def _get_some_stuff_range_bytes(self, object_name: str, start: int, end: int, etag: str) -> bytes:
+        request_kwargs = {'Key': object_name, 'Range': f'bytes={start}-{end}', 'IfMatch': etag}
+        response, http_status_code = await self._send_request('get_object', request_kwargs)
+        if http_status_code != status.HTTP_206_PARTIAL_CONTENT:
+            raise SomeStuffRepositoryError(f'Get some_stuff {object_name=} range {start}-{end} failed. '
+                                           f'Response code: {http_status_code}')
+        if response.get('ETag', etag) != etag:
+            raise SomeStuffRepositoryError(f'Get some_stuff {object_name=} changed during download')
+
+        async with response['Body'] as body:
+            data = await body.read()
+        if len(data) != end - start + 1:
+            raise SomeStuffRepositoryError(f'Get some_stuff {object_name=} range {start}-{end} is incomplete: '
+                                           f'got {len(data)} bytes')
         return data
 
+    async def download_some_stuff_parallel(self,
+                                           object_name: str,
+                                           target: str | os.PathLike | BinaryIO | bytearray | memoryview,
+                                           part_size: int = DOWNLOAD_PART_SIZE,
+                                           max_concurrency: int = DOWNLOAD_MAX_CONCURRENCY) -> int:
+        """Download ``object_name`` with concurrent ranged GETs into a file or a preallocated buffer.
+
+        Every range is requested with ``IfMatch`` on the ETag from ``head_object``, so an object
+        overwritten mid-download fails instead of producing a mix of two versions. Files are
+        opened and written in the loop's default executor.
+        Returns the number of bytes written.
+        """
+        metadata = await self.get_some_stuff_metadata(object_name)
+        size, etag = metadata['ContentLength'], metadata['ETag']
+        if not isinstance(target, (str, os.PathLike)):
+            return await self._download_ranges(object_name, size, etag, target, part_size, max_concurrency)
+
+        loop = asyncio.get_running_loop()
+        file = await loop.run_in_executor(None, open, target, 'wb')
+        try:
+            await loop.run_in_executor(None, file.truncate, size)
+            return await self._download_ranges(object_name, size, etag, file, part_size, max_concurrency)
+        finally:
+            await loop.run_in_executor(None, file.close)
+
+    async def _download_ranges(self,
+                               object_name: str,
+                               size: int,
+                               etag: str,
+                               target: BinaryIO | bytearray | memoryview,
+                               part_size: int,
+                               max_concurrency: int) -> int:
+        if isinstance(target, (bytearray, memoryview)):
+            view = memoryview(target)
+            if len(view) < size:
+                raise SomeStuffRepositoryError(f'Buffer of {len(view)} bytes is too small for {object_name=} '
+                                               f'of {size} bytes')
+
+            async def write(start: int, data: bytes) -> None:
+                view[start:start + len(data)] = data
+        else:
+            base = target.tell()
+            loop = asyncio.get_running_loop()
+            # writes share the file position, so they run one at a time
+            write_lock = asyncio.Lock()
+
+            def write_at(start: int, data: bytes) -> None:
+                target.seek(base + start)
+                target.write(data)
+
+            async def write(start: int, data: bytes) -> None:
+                async with write_lock:
+                    await loop.run_in_executor(None, write_at, start, data)
+
+        slots = asyncio.Semaphore(max_concurrency)
+        written = 0
+
+        async def download_range(start: int, end: int) -> None:
+            nonlocal written
+            async with slots:
+                data = await self._get_some_stuff_range_bytes(object_name, start, end, etag)
+            await write(start, data)
+            written += len(data)
+
+        downloads = [asyncio.create_task(download_range(start, end)) for start, end in _byte_ranges(size, part_size)]
+        try:
+            await asyncio.gather(*downloads)
+        except BaseException:
+            for download in downloads:
+                download.cancel()
+            await asyncio.gather(*downloads, return_exceptions=True)
+            raise
+
+        if written != size:
+            raise SomeStuffRepositoryError(f'Download of {object_name=} is incomplete: {written} of {size} bytes')
+        return written
+
+    async def iter_some_stuff_parallel(self,
+                                       object_name: str,
+                                       part_size: int = DOWNLOAD_PART_SIZE,
+                                       max_concurrency: int = DOWNLOAD_MAX_CONCURRENCY) -> AsyncIterator[bytes]:
+        """Yield ``object_name`` in order while up to ``max_concurrency`` ranges are prefetched."""
+        metadata = await self.get_some_stuff_metadata(object_name)
+        size, etag = metadata['ContentLength'], metadata['ETag']
+        ranges = iter(_byte_ranges(size, part_size))
+        prefetched: deque[asyncio.Task] = deque()
+
+        def prefetch() -> None:
+            while len(prefetched) < max_concurrency:
+                byte_range = next(ranges, None)
+                if byte_range is None:
+                    return
+                prefetched.append(asyncio.create_task(self._get_some_stuff_range_bytes(object_name, *byte_range, etag)))
+
+        received = 0
+        try:
+            prefetch()
+            while prefetched:
+                data = await prefetched.popleft()
+                prefetch()
+                received += len(data)
+                yield data
+        finally:
+            for task in prefetched:
+                task.cancel()
+            await asyncio.gather(*prefetched, return_exceptions=True)
+
+        if received != size:
+            raise SomeStuffRepositoryError(f'Download of {object_name=} is incomplete: {received} of {size} bytes')
+
     async def get_some_stuff_metadata(self, object_name: str) -> dict:
+        if self.single_flight is not None:
+            metadata = await self.single_flight.do(('head_object', object_name),
+                                                   lambda: self._get_some_stuff_metadata(object_name))
+            return dict(metadata)
+        return await self._get_some_stuff_metadata(object_name)
+
+    async def _get_some_stuff_metadata(self, object_name: str) -> dict:
+        if self.metadata_cache is not None:
+            return await self._get_some_stuff_metadata_cached(object_name)
+
         request_kwargs = {'Key': object_name}
         response, http_status_code = await self._send_request('head_object', request_kwargs)
         if http_status_code != status.HTTP_200_OK:
             raise SomeStuffRepositoryError(f'Get some_stuff metadata {object_name=} failed. Response code: {http_status_code}')
         return response
 
+    async def _get_some_stuff_metadata_cached(self, object_name: str) -> dict:
+        cache = self.metadata_cache
+        entry = cache.lookup(self.bucket, object_name)
+        if entry is not None:
+            if entry.error is not None:
+                raise SomeStuffRepositoryError(*entry.error.args) from entry.error.__cause__
+            return dict(entry.metadata)
+
+        generation = cache.generation
+        request_kwargs = {'Key': object_name}
+        try:
+            response, http_status_code = await self._send_request('head_object', request_kwargs)
+        except SomeStuffRepositoryError as e:
+            if _client_error_status_code(e) == status.HTTP_404_NOT_FOUND:
+                cache.store_missing(self.bucket, object_name, e, generation)
+            raise
+        if http_status_code != status.HTTP_200_OK:
+            raise SomeStuffRepositoryError(f'Get some_stuff metadata {object_name=} failed. Response code: {http_status_code}')
+        cache.store(self.bucket, object_name, response, generation)
+        return dict(response)
+
     async def remove_some_stuff(self, object_name: str) -> Literal[True]:
         request_kwargs = {'Key': object_name}
-        _, http_status_code = await self._send_request('delete_object', request_kwargs)
+        try:
+            _, http_status_code = await self._send_request('delete_object', request_kwargs)
+        finally:
+            await self._invalidate(object_name)
+            if self.digest_index is not None:
+                await self.digest_index.discard_keys([object_name])
         if http_status_code != status.HTTP_204_NO_CONTENT:
             raise SomeStuffRepositoryError(f'Deletion of some_stuff {object_name=} failed. Response code: {http_status_code}')
         return True
+
+    async def remove_many_some_stuff(self,
+                                     object_names: Iterable[str] | AsyncIterable[str],
+                                     batch_size: int = DELETE_BATCH_SIZE,
+                                     max_concurrency: int = DELETE_MAX_CONCURRENCY,
+                                     ) -> dict[str, SomeStuffRepositoryError | None]:
+        """Delete ``object_names`` with batched DeleteObjects requests.
+
+        Returns the outcome per key: None when it was deleted, the error otherwise. A failed
+        batch is reported for each of its keys instead of failing the whole call.
+        """
+        results = {}
+        batches = batched(object_names, batch_size)
+        async for batch_results in bounded_as_completed(self._remove_some_stuff_batch, batches, max_concurrency):
+            results.update(batch_results)
+        return results
+
+    async def _remove_some_stuff_batch(self, object_names: list[str]) -> dict[str, SomeStuffRepositoryError | None]:
+        request_kwargs = {'Delete': {'Objects': [{'Key': object_name} for object_name in object_names], 'Quiet': True}}
+        try:
+            response, http_status_code = await self._send_request('delete_objects', request_kwargs)
+            if http_status_code != status.HTTP_200_OK:
+                raise SomeStuffRepositoryError(f'Deletion of {len(object_names)} some_stuff failed. '
+                                               f'Response code: {http_status_code}')
+        except SomeStuffRepositoryError as e:
+            return dict.fromkeys(object_names, e)
+        finally:
+            for object_name in object_names:
+                await self._invalidate(object_name)
+            if self.digest_index is not None:
+                await self.digest_index.discard_keys(object_names)
+
+        results: dict[str, SomeStuffRepositoryError | None] = dict.fromkeys(object_names)
+        for error in response.get('Errors', []):
+            results[error['Key']] = SomeStuffRepositoryError(
+                f"Deletion of some_stuff object_name={error['Key']!r} failed. Error {error=}"
+            )
+        return results
+
+    async def copy_some_stuff(self,
+                              source_name: str,
+                              target_name: str,
+                              target_bucket: str | None = None,
+                              part_size: int = COPY_PART_SIZE) -> Literal[True]:
+        """Copy ``source_name`` to ``target_name`` inside storage, without the bytes passing through here.
+
+        Objects up to ``COPY_MAX_SIZE`` take one CopyObject. Larger ones are copied as a multipart
+        upload of ``part_size`` ranges, ``multipart_max_concurrency`` at a time, all pinned to the
+        source's ETag. ``target_bucket`` defaults to the repository's bucket.
+        """
+        target_bucket = target_bucket or self.bucket
+        try:
+            metadata, http_status_code = await self._send_request('head_object', {'Key': source_name})
+            if http_status_code != status.HTTP_200_OK:
+                raise SomeStuffRepositoryError(f'Copy of some_stuff {source_name=} failed. '
+                                               f'Response code: {http_status_code}')
+            if metadata['ContentLength'] > COPY_MAX_SIZE:
+                await self._copy_some_stuff_multipart(source_name, target_name, target_bucket, metadata, part_size)
+                return True
+
+            request_kwargs = {
+                'Bucket': target_bucket,
+                'Key': target_name,
+                'CopySource': {'Bucket': self.bucket, 'Key': source_name},
+                'MetadataDirective': 'COPY',
+            }
+            _, http_status_code = await self._send_request('copy_object', request_kwargs)
+            if http_status_code != status.HTTP_200_OK:
+                raise SomeStuffRepositoryError(f'Copy of some_stuff {source_name=} to {target_name=} failed. '
+                                               f'Response code: {http_status_code}')
+            return True
+        finally:
+            if target_bucket == self.bucket:
+                await self._invalidate(target_name)
+                if self.digest_index is not None:
+                    await self.digest_index.discard_keys([target_name])
+
+    async def _copy_some_stuff_multipart(self,
+                                         source_name: str,
+                                         target_name: str,
+                                         target_bucket: str,
+                                         metadata: dict,
+                                         part_size: int) -> None:
+        create_kwargs = {'Bucket': target_bucket, 'Key': target_name, **copied_headers(metadata)}
+        response, _ = await self._send_request('create_multipart_upload', create_kwargs)
+        upload_id = response['UploadId']
+
+        async def copy_part(part: tuple[int, str]) -> dict[str, Any]:
+            part_number, source_range = part
+            part_kwargs = {
+                'Bucket': target_bucket,
+                'Key': target_name,
+                'UploadId': upload_id,
+                'PartNumber': part_number,
+                'CopySource': {'Bucket': self.bucket, 'Key': source_name},
+                'CopySourceRange': source_range,
+                # a source overwritten mid-copy fails the copy instead of mixing two versions
+                'CopySourceIfMatch': metadata['ETag'],
+            }
+            part_response, _ = await self._send_request('upload_part_copy', part_kwargs)
+            return {'ETag': part_response['CopyPartResult']['ETag'], 'PartNumber': part_number}
+
+        try:
+            parts = enumerate(copy_source_ranges(metadata['ContentLength'], part_size), start=1)
+            copied_parts = [part async for part in bounded_as_completed(copy_part, parts,
+                                                                        self.multipart_max_concurrency)]
+            complete_kwargs = {
+                'Bucket': target_bucket,
+                'Key': target_name,
+                'UploadId': upload_id,
+                'MultipartUpload': {'Parts': sorted(copied_parts, key=lambda part: part['PartNumber'])},
+            }
+            _, http_status_code = await self._send_request('complete_multipart_upload', complete_kwargs)
+        except BaseException:
+            await self._abort_multipart_upload(target_name, upload_id, target_bucket)
+            raise
+
+        if http_status_code != status.HTTP_200_OK:
+            raise SomeStuffRepositoryError(f'Copy of some_stuff {source_name=} to {target_name=} failed. '
+                                           f'Response code: {http_status_code}')
+
+    def _is_same_object(self, source_name: str, target_name: str, target_bucket: str | None) -> bool:
+        return source_name == target_name and (target_bucket or self.bucket) == self.bucket
+
+    async def move_some_stuff(self,
+                              source_name: str,
+                              target_name: str,
+                              target_bucket: str | None = None) -> Literal[True]:
+        """Copy ``source_name`` to ``target_name``, then remove it; a failed copy leaves the source as is."""
+        if self._is_same_object(source_name, target_name, target_bucket):
+            return True
+        await self.copy_some_stuff(source_name, target_name, target_bucket)
+        return await self.remove_some_stuff(source_name)
+
+    async def move_many_some_stuff(self,
+                                   pairs: Iterable[tuple[str, str]] | AsyncIterable[tuple[str, str]],
+                                   target_bucket: str | None = None,
+                                   ) -> dict[str, SomeStuffRepositoryError | None]:
+        """Move many ``(source_name, target_name)`` pairs, copying like the other bulk methods.
+
+        Copied sources are removed with batched DeleteObjects while the remaining copies run.
+        Returns the outcome per source: None when it was moved, the error otherwise. A source
+        whose deletion failed exists under both names.
+        """
+        results: dict[str, SomeStuffRepositoryError | None] = {}
+
+        async def copy(pair: tuple[str, str]) -> bool:
+            if self._is_same_object(*pair, target_bucket):
+                return False
+            return await self.copy_some_stuff(*pair, target_bucket=target_bucket)
+
+        async def copied_sources() -> AsyncIterator[str]:
+            async for source_name, result in self._run_many(copy, pairs):
+                if result is True:
+                    yield source_name
+                else:
+                    results[source_name] = None if result is False else result
+
+        results.update(await self.remove_many_some_stuff(copied_sources()))
+        return results
+
+    async def list_some_stuff(self,
+                              prefix: str = '',
+                              start_after: str | None = None,
+                              page_size: int = LIST_PAGE_SIZE) -> AsyncIterator[dict]:
+        """Yield the objects under ``prefix`` in key order, as ``list_objects_v2`` ``Contents`` entries.
+
+        The next page is requested while the caller consumes the current one, and at most two
+        pages are held at a time however many keys the bucket has.
+        """
+        request_kwargs: dict[str, Any] = {'Prefix': prefix, 'MaxKeys': page_size}
+        if start_after is not None:
+            request_kwargs['StartAfter'] = start_after
+        next_page: asyncio.Task | None = asyncio.create_task(self._list_some_stuff_page(request_kwargs))
+        try:
+            while next_page is not None:
+                response = await next_page
+                next_page = None
+                if response.get('IsTruncated'):
+                    next_page = asyncio.create_task(self._list_some_stuff_page(
+                        {**request_kwargs, 'ContinuationToken': response['NextContinuationToken']}
+                    ))
+                for item in response.get('Contents', []):
+                    yield item
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+                await asyncio.gather(next_page, return_exceptions=True)
+
+    async def _list_some_stuff_page(self, request_kwargs: dict[str, Any]) -> dict:
+        response, http_status_code = await self._send_request('list_objects_v2', request_kwargs)
+        if http_status_code != status.HTTP_200_OK:
+            raise SomeStuffRepositoryError(f"Listing of some_stuff prefix={request_kwargs['Prefix']!r} failed. "
+                                           f'Response code: {http_status_code}')
+        return response
+
+    def list_many_some_stuff(self,
+                             prefixes: Iterable[str] | AsyncIterable[str],
+                             max_concurrency: int | None = None,
+                             page_size: int = LIST_PAGE_SIZE) -> AsyncIterator[dict]:
+        """Yield the objects under several prefixes, listing up to ``max_concurrency`` of them at once.
+
+        Objects of different prefixes are interleaved; each prefix is still listed in key order.
+        ``max_concurrency`` defaults to ``pool_size``.
+        """
+        return bounded_merge(lambda prefix: self.list_some_stuff(prefix, page_size=page_size),
+                             prefixes, max_concurrency or self.pool_size, max_buffered=page_size)
+
+    async def _run_many(self,
+                        func: Callable[[Any], Awaitable[Any]],
+                        items: Iterable[Any] | AsyncIterable[Any],
+                        ) -> AsyncIterator[tuple[str, Any]]:
+        async def run(item: Any) -> tuple[str, Any]:
+            object_name = item if isinstance(item, str) else item[0]
+            async with self._pool_slots:
+                try:
+                    return object_name, await func(item)
+                except SomeStuffRepositoryError as e:
+                    return object_name, e
+
+        async for result in bounded_as_completed(run, items, self.pool_size):
+            yield result
+
+    async def _get_some_stuff_bytes(self, object_name: str) -> bytes:
+        async with await self.get_some_stuff(object_name) as body:
+            return await body.read()
+
+    def get_many_some_stuff(self,
+                            object_names: Iterable[str] | AsyncIterable[str],
+                            ) -> AsyncIterator[tuple[str, bytes | SomeStuffRepositoryError]]:
+        """Read many objects concurrently, yielding ``(object_name, data or error)`` as they complete.
+
+        Like the other bulk methods, at most ``pool_size`` requests run at once across all bulk calls.
+        """
+        return self._run_many(self._get_some_stuff_bytes, object_names)
+
+    def put_many_some_stuff(self,
+                            items: Iterable[PutItem] | AsyncIterable[PutItem],
+                            ) -> AsyncIterator[tuple[str, Literal[True] | SomeStuffRepositoryError]]:
+        """Upload many ``(object_name, data, content_type)`` items, yielding ``(object_name, True or error)``."""
+        return self._run_many(lambda item: self.put_some_stuff(*item), items)
+
+    def get_many_some_stuff_metadata(self,
+                                     object_names: Iterable[str] | AsyncIterable[str],
+                                     ) -> AsyncIterator[tuple[str, dict | SomeStuffRepositoryError]]:
+        """Head many objects concurrently, yielding ``(object_name, metadata or error)``."""
+        return self._run_many(self.get_some_stuff_metadata, object_names)
+
+    async def presign_get_some_stuff(self,
+                                     object_name: str,
+                                     expires_in: int = DEFAULT_EXPIRES_S,
+                                     response_headers: dict[str, str] | None = None) -> str:
+        """URL to download ``object_name`` straight from storage, e.g. for a redirect.
+
+        ``response_headers`` override headers of the response, e.g. ``{'ResponseContentDisposition': ...}``.
+        """
+        return await self._presign('get_object', {'Key': object_name, **(response_headers or {})}, expires_in)
+
+    async def presign_put_some_stuff(self,
+                                     object_name: str,
+                                     content_type: str,
+                                     expires_in: int = DEFAULT_EXPIRES_S) -> str:
+        """URL to upload ``object_name`` straight to storage; the client must send the same Content-Type."""
+        return await self._presign('put_object', {'Key': object_name, 'ContentType': content_type}, expires_in)
+
+    async def _presign(self, command: str, params: dict[str, Any], expires_in: int, cacheable: bool = True) -> str:
+        """Sign locally, without a request; with a cache, a URL is reused until shortly before it expires."""
+        params = {'Bucket': self.bucket, **params}
+        cache = self.presigned_url_cache if cacheable else None
+        if cache is not None:
+            cache_key = presign_cache_key(command, params, expires_in)
+            url = cache.lookup(cache_key)
+            if url is not None:
+                return url
+            signed_at = cache.now()
+        url = await self.s3_client.generate_presigned_url(command, Params=params, ExpiresIn=expires_in)
+        if cache is not None:
+            cache.store(cache_key, url, signed_at + expires_in)
+        return url
+
+    async def create_presigned_multipart_upload(self,
+                                                object_name: str,
+                                                content_type: str,
+                                                part_count: int,
+                                                expires_in: int = DEFAULT_EXPIRES_S) -> PresignedMultipartUpload:
+        """Start a multipart upload and presign a PUT URL for each of its ``part_count`` parts.
+
+        Every part but the last must be at least 5 MiB. Finish with
+        ``complete_presigned_multipart_upload`` or give up with ``abort_presigned_multipart_upload``.
+        """
+        try:
+            check_part_count(part_count)
+        except ValueError as e:
+            raise SomeStuffRepositoryError(f'Upload some_stuff {object_name=} failed. {e}') from e
+        request_kwargs = {'Key': object_name, 'ContentType': content_type}
+        response, http_status_code = await self._send_request('create_multipart_upload', request_kwargs)
+        if http_status_code != status.HTTP_200_OK:
+            raise SomeStuffRepositoryError(f'Upload some_stuff {object_name=} failed. Response code: {http_status_code}')
+        upload_id = response['UploadId']
+        try:
+            part_urls = [
+                await self._presign('upload_part',
+                                    {'Key': object_name, 'UploadId': upload_id, 'PartNumber': part_number},
+                                    expires_in,
+                                    cacheable=False)
+                for part_number in range(1, part_count + 1)
+            ]
+        except BaseException:
+            # nobody gets the upload id, so nobody else could abort it
+            await self._abort_multipart_upload(object_name, upload_id)
+            raise
+        return PresignedMultipartUpload(object_name, upload_id, part_urls)
+
+    async def complete_presigned_multipart_upload(self,
+                                                  object_name: str,
+                                                  upload_id: str,
+                                                  parts: list[dict[str, Any]]) -> Literal[True]:
+        """Assemble the uploaded ``parts``, given as ``{'PartNumber': n, 'ETag': etag}``."""
+        request_kwargs = {
+            'Key': object_name,
+            'UploadId': upload_id,
+            'MultipartUpload': {'Parts': sorted(parts, key=lambda part: part['PartNumber'])},
+        }
+        try:
+            _, http_status_code = await self._send_request('complete_multipart_upload', request_kwargs)
+        finally:
+            await self._invalidate(object_name)
+            if self.digest_index is not None:
+                await self.digest_index.discard_keys([object_name])
+        if http_status_code != status.HTTP_200_OK:
+            raise SomeStuffRepositoryError(f'Upload some_stuff {object_name=} failed. Response code: {http_status_code}')
+        return True
+
+    async def abort_presigned_multipart_upload(self, object_name: str, upload_id: str) -> None:
+        await self._abort_multipart_upload(object_name, upload_id)
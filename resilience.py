@@ -0,0 +1,213 @@
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, TypeVar
+
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, HTTPClientError
+
+R = TypeVar('R')
+
+# reads can be sent twice without side effects, so they may be hedged
+HEDGEABLE_COMMANDS = frozenset({'get_object', 'head_object'})
+# commands that leave the same state when repeated; multipart create/complete/abort are not
+RETRYABLE_COMMANDS = HEDGEABLE_COMMANDS | {
+    'list_objects_v2', 'put_object', 'upload_part', 'copy_object', 'upload_part_copy',
+    'delete_object', 'delete_objects',
+}
+RETRYABLE_ERROR_CODES = frozenset({
+    'Throttling', 'ThrottlingException', 'SlowDown', 'RequestLimitExceeded', 'TooManyRequests',
+    'RequestTimeout', 'InternalError', 'ServiceUnavailable',
+})
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+@dataclass
+class RetryPolicy:
+    """Jittered exponential backoff; ``max_attempts=1`` disables retries."""
+
+    max_attempts: int = 1
+    base_delay_s: float = 0.05
+    max_delay_s: float = 2.0
+    # total budget for all attempts and backoff sleeps of one call, None for no limit
+    deadline_s: float | None = None
+
+    def backoff(self, retry_number: int) -> float:
+        return random.uniform(0, min(self.max_delay_s, self.base_delay_s * 2 ** retry_number))
+
+
+@dataclass
+class HedgePolicy:
+    """Send a second read once the first is slower than ``percentile`` of recent latencies."""
+
+    percentile: float = 95
+    min_delay_s: float = 0.005
+    max_delay_s: float = 1.0
+    # no hedging until this many latencies are known for a command
+    min_samples: int = 20
+    window: int = 1000
+
+
+@dataclass
+class ResilienceStats:
+    attempts: int = 0
+    retries: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    deadline_exceeded: int = 0
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code')
+        http_status_code = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        return code in RETRYABLE_ERROR_CODES or http_status_code == 429 or http_status_code >= 500
+    return isinstance(error, (BotocoreConnectionError, HTTPClientError))
+
+
+def stream_position(body: Any) -> int | None:
+    """Position to rewind ``body`` to before resending it, None if it can't be rewound."""
+    try:
+        position = body.tell() if body.seekable() else None
+    except (AttributeError, OSError, ValueError):
+        return None
+    return position if isinstance(position, int) else None
+
+
+def close_response_body(response: Any) -> None:
+    body = response.get('Body') if isinstance(response, dict) else None
+    if body is not None:
+        body.close()
+
+
+class LatencyTracker:
+    """Sliding window of successful request latencies per command."""
+
+    def __init__(self, window: int = 1000, refresh_every: int = 50) -> None:
+        self.window = window
+        self.refresh_every = refresh_every
+        self._samples: dict[str, deque[float]] = {}
+        self._since_refresh: dict[str, int] = {}
+        self._sorted: dict[str, list[float]] = {}
+
+    def record(self, command: str, seconds: float) -> None:
+        self._samples.setdefault(command, deque(maxlen=self.window)).append(seconds)
+        self._since_refresh[command] = self._since_refresh.get(command, 0) + 1
+
+    def count(self, command: str) -> int:
+        return len(self._samples.get(command, ()))
+
+    def percentile(self, command: str, percentile: float) -> float | None:
+        samples = self._samples.get(command)
+        if not samples:
+            return None
+        # re-sorting on every call would cost more than the requests it speeds up
+        if command not in self._sorted or self._since_refresh[command] >= self.refresh_every:
+            self._sorted[command] = sorted(samples)
+            self._since_refresh[command] = 0
+        ordered = self._sorted[command]
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+class Resilience:
+    """Retry and hedging policy shared by the requests of one adapter.
+
+    ``max_in_flight`` should be the HTTP connection pool size (the adapters fill it in when it's
+    left unset): a hedge is only sent while fewer attempts than that are running, so hedging
+    never queues requests behind the pool.
+    """
+
+    def __init__(self,
+                 retry: RetryPolicy | None = None,
+                 hedge: HedgePolicy | None = None,
+                 max_in_flight: int | None = None) -> None:
+        self.retry = retry or RetryPolicy()
+        self.hedge = hedge
+        self.max_in_flight = max_in_flight
+        self.latencies = LatencyTracker(hedge.window if hedge else 1000)
+        self.stats = ResilienceStats()
+        self.in_flight = 0
+
+    async def call(self,
+                   command: str,
+                   attempt: Callable[[], Awaitable[R]],
+                   retryable: bool = False,
+                   hedgeable: bool = False) -> R:
+        loop = asyncio.get_running_loop()
+        deadline = None if self.retry.deadline_s is None else loop.time() + self.retry.deadline_s
+        max_attempts = self.retry.max_attempts if retryable else 1
+        for attempt_number in range(max_attempts):
+            request = self._hedged(command, attempt) if hedgeable and self.hedge else self._timed(command, attempt)
+            try:
+                if deadline is None:
+                    return await request
+                return await asyncio.wait_for(request, max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError as e:
+                self.stats.deadline_exceeded += 1
+                raise DeadlineExceeded(f'{command} exceeded its {self.retry.deadline_s}s deadline') from e
+            except Exception as e:
+                if attempt_number + 1 >= max_attempts or not is_retryable_error(e):
+                    raise
+                delay = self.retry.backoff(attempt_number)
+                if deadline is not None and loop.time() + delay >= deadline:
+                    raise
+                self.stats.retries += 1
+                await asyncio.sleep(delay)
+        raise AssertionError('unreachable')
+
+    async def _timed(self, command: str, attempt: Callable[[], Awaitable[R]]) -> R:
+        self.stats.attempts += 1
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            result = await attempt()
+        finally:
+            self.in_flight -= 1
+        self.latencies.record(command, time.perf_counter() - started)
+        return result
+
+    def _hedge_delay(self, command: str) -> float | None:
+        if self.latencies.count(command) < self.hedge.min_samples:
+            return None
+        delay = self.latencies.percentile(command, self.hedge.percentile)
+        return min(self.hedge.max_delay_s, max(self.hedge.min_delay_s, delay))
+
+    async def _hedged(self, command: str, attempt: Callable[[], Awaitable[R]]) -> R:
+        delay = self._hedge_delay(command)
+        first = asyncio.ensure_future(self._timed(command, attempt))
+        if delay is None:
+            return await first
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except BaseException:
+            first.cancel()
+            raise
+        if done or (self.max_in_flight is not None and self.in_flight >= self.max_in_flight):
+            return await first
+
+        self.stats.hedges += 1
+        second = asyncio.ensure_future(self._timed(command, attempt))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.stats.hedge_wins += 1
+                        return task.result()
+            # both failed: report the original request's error
+            return first.result()
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(_discard_loser)
+
+
+def _discard_loser(task: asyncio.Future) -> None:
+    if not task.cancelled() and task.exception() is None:
+        close_response_body(task.result())
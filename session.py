@@ -1,25 +1,138 @@
-from typing import AsyncGenerator
+from __future__ import annotations
 
-from aiobotocore.client import AioBaseClient
-from aiobotocore.session import get_session
-from botocore.client import Config
+import asyncio
+import logging
+from contextlib import AsyncExitStack
+from functools import cache
+from typing import TYPE_CHECKING, AsyncGenerator
+
+from botocore.exceptions import ClientError
 
 from some_stuff.config import settings
 
-CONFIG = Config(
-    read_timeout=settings.S3_CLIENT_READ_TIMEOUT_S,
-    connect_timeout=settings.S3_CLIENT_CONNECT_TIMEOUT_S,
-    max_pool_connections=settings.S3_HTTP_POOL_MAX_SIZE,
-    region_name=settings.S3_REGION
-)
+if TYPE_CHECKING:
+    from aiobotocore.client import AioBaseClient
+    from aiobotocore.session import AioSession
+    from botocore.client import Config
+
+logger = logging.getLogger(__name__)
+
+
+@cache
+def get_config() -> Config:
+    from botocore.client import Config
+
+    return Config(
+        read_timeout=settings.S3_CLIENT_READ_TIMEOUT_S,
+        connect_timeout=settings.S3_CLIENT_CONNECT_TIMEOUT_S,
+        max_pool_connections=settings.S3_HTTP_POOL_MAX_SIZE,
+        region_name=settings.S3_REGION
+    )
+
+
+@cache
+def get_aio_session() -> AioSession:
+    """One session per process, so the service models it loads are parsed for the first client only."""
+    # aiobotocore takes a few hundred milliseconds to import, so it waits for the first client
+    from aiobotocore.session import get_session
+
+    return get_session()
+
+
+def __getattr__(name: str):
+    # CONFIG used to be built on import
+    if name == 'CONFIG':
+        return get_config()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def _create_client(config: Config | None = None):
+    session = get_aio_session()
+    return session.create_client('s3',
+                                 endpoint_url=settings.S3_ENDPOINT,
+                                 aws_access_key_id=settings.S3_ACCESS_KEY,
+                                 aws_secret_access_key=settings.S3_SECRET_KEY,
+                                 config=config or get_config(),
+                                 )
 
 
 async def get_async_client() -> AsyncGenerator[AioBaseClient, None]:
-    session = get_session()
-    async with session.create_client('s3',
-                                     endpoint_url=settings.S3_ENDPOINT,
-                                     aws_access_key_id=settings.S3_ACCESS_KEY,
-                                     aws_secret_access_key=settings.S3_SECRET_KEY,
-                                     config=CONFIG,
-                                     ) as client:
+    async with _create_client() as client:
         yield client
+
+
+async def prewarm_connections(client: AioBaseClient, connections: int, bucket: str | None = None) -> None:
+    """Open up to ``connections`` keep-alive connections with as many concurrent ``head_bucket`` calls.
+
+    An error response still leaves its connection open, so only transport failures count as failed.
+    """
+    bucket = bucket or settings.S3_BUCKET
+    results = await asyncio.gather(*(client.head_bucket(Bucket=bucket) for _ in range(connections)),
+                                   return_exceptions=True)
+    failed = sum(isinstance(result, Exception) and not isinstance(result, ClientError) for result in results)
+    if failed:
+        logger.warning('%s of %s S3 connections failed to prewarm', failed, connections)
+
+
+class SharedAsyncClient:
+    """One aiobotocore client per process, opened on application startup and closed on shutdown.
+
+    Every repository built from ``get_shared_client`` uses the same connection pool, so
+    keep-alive connections survive between requests.
+    """
+
+    def __init__(self, config: Config | None = None) -> None:
+        self._config = config
+        self._client: AioBaseClient | None = None
+        self._exit_stack: AsyncExitStack | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def config(self) -> Config:
+        return self._config or get_config()
+
+    @property
+    def started(self) -> bool:
+        return self._client is not None
+
+    @property
+    def client(self) -> AioBaseClient:
+        if self._client is None:
+            raise RuntimeError('Shared S3 client is not started, call start() on application startup')
+        return self._client
+
+    async def start(self, prewarm: bool = False) -> AioBaseClient:
+        async with self._lock:
+            if self._client is None:
+                async with AsyncExitStack() as exit_stack:
+                    client = await exit_stack.enter_async_context(_create_client(self.config))
+                    if prewarm:
+                        await prewarm_connections(client, self.config.max_pool_connections)
+                    # closed on stop(); a failed start closes it right away
+                    self._exit_stack = exit_stack.pop_all()
+                self._client = client
+        return self._client
+
+    async def stop(self) -> None:
+        async with self._lock:
+            if self._exit_stack is not None:
+                await self._exit_stack.aclose()
+            self._client = None
+            self._exit_stack = None
+
+
+shared_client = SharedAsyncClient()
+
+
+def get_shared_client() -> AioBaseClient:
+    return shared_client.client
+
+
+async def on_startup(prewarm: bool = True) -> None:
+    """FastAPI startup hook: ``app.add_event_handler('startup', on_startup)``."""
+    await shared_client.start(prewarm=prewarm)
+
+
+async def on_shutdown() -> None:
+    """FastAPI shutdown hook: ``app.add_event_handler('shutdown', on_shutdown)``."""
+    await shared_client.stop()
@@ -0,0 +1,418 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+from bisect import bisect_right
+from collections import Counter
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from io import BufferedReader
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Iterable, Literal, TypeVar
+
+from starlette import status
+
+from aio_utils import KeyedLock, bounded_as_completed, bounded_merge
+from copies import copied_headers
+from metrics import MetricsSink, RequestMetrics, default_sink
+from ranges import RangeResponse
+from repo_s3 import LIST_PAGE_SIZE, SomeStuffRepository, SomeStuffRepositoryError, _client_error_status_code
+from some_stuff.adapters.s3.storage.sessions import get_aio_session
+
+if TYPE_CHECKING:
+    from aiobotocore.response import StreamingBody
+    from botocore.client import Config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# points per unit of weight; more points spread keys more evenly at the cost of a bigger ring
+DEFAULT_VNODES = 160
+REBALANCE_MAX_CONCURRENCY = 16
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hashing of keys onto named nodes, each placed at ``vnodes * weight`` points of the ring.
+
+    A key belongs to the node of the first point after its hash. Adding a node only takes over
+    the keys just before its points, about ``weight / total weight`` of them, so as few keys as
+    possible change owner; removing one hands its keys to the nodes after its points.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = DEFAULT_VNODES) -> None:
+        self.vnodes = vnodes
+        self._weights: dict[str, int] = {}
+        self._points: list[int] = []
+        self._owners: list[str] = []
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> list[str]:
+        return list(self._weights)
+
+    def __len__(self) -> int:
+        return len(self._weights)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._weights
+
+    def copy(self) -> 'HashRing':
+        ring = HashRing(vnodes=self.vnodes)
+        ring._weights = dict(self._weights)
+        ring._points = list(self._points)
+        ring._owners = list(self._owners)
+        return ring
+
+    def add(self, node: str, weight: int = 1) -> None:
+        if node in self._weights:
+            raise ValueError(f'Node {node!r} is already on the ring')
+        self._weights[node] = weight
+        self._build()
+
+    def remove(self, node: str) -> None:
+        del self._weights[node]
+        self._build()
+
+    def _build(self) -> None:
+        points = sorted((_hash(f'{node}#{index}'), node)
+                        for node, weight in self._weights.items() for index in range(self.vnodes * weight))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        if not self._points:
+            raise LookupError('The hash ring has no nodes')
+        return self._owners[bisect_right(self._points, _hash(key)) % len(self._points)]
+
+    def shares(self) -> dict[str, float]:
+        """Fraction of the hash space, and so of the keys, each node owns."""
+        shares = dict.fromkeys(self._weights, 0.0)
+        if not self._points:
+            return shares
+        space = 1 << 64
+        previous = self._points[-1] - space
+        for point, owner in zip(self._points, self._owners):
+            shares[owner] += (point - previous) / space
+            previous = point
+        return shares
+
+
+@dataclass
+class RebalanceReport:
+    moved: int = 0
+    # already written to their new shard since the ring changed
+    skipped: int = 0
+    failed: dict[str, SomeStuffRepositoryError] = field(default_factory=dict)
+
+
+class ShardedSomeStuffRepository:
+    """Spread objects over several ``SomeStuffRepository`` instances by consistent hashing of their names.
+
+    Each shard is a repository with its own endpoint, bucket and client (see ``open_shards``),
+    so throughput adds up across them. After ``add_shard`` or ``remove_shard`` the keys that
+    changed owner are moved by ``rebalance``; until it finishes, reads that miss on a key's new
+    shard fall back to its previous one and removals go to both.
+    """
+
+    def __init__(self,
+                 shards: dict[str, SomeStuffRepository],
+                 vnodes: int = DEFAULT_VNODES,
+                 sink: MetricsSink = default_sink) -> None:
+        self.shards = dict(shards)
+        self.ring = HashRing(self.shards, vnodes)
+        # the ring before the last add_shard/remove_shard, until rebalance moved every key off it
+        self.previous_ring: HashRing | None = None
+        self.sink = sink
+        self._key_locks = KeyedLock()
+        # bumped on every ring change; rebalance waits for writes routed by an older ring
+        self._generation = 0
+        self._writes: Counter[int] = Counter()
+        self._writes_done = asyncio.Condition()
+        self._rebalance_task: asyncio.Task | None = None
+        self._set_gauges()
+
+    def shard_for(self, object_name: str) -> str:
+        return self.ring.node_for(object_name)
+
+    def _previous_shard_for(self, object_name: str) -> str | None:
+        if self.previous_ring is None:
+            return None
+        previous = self.previous_ring.node_for(object_name)
+        return previous if previous != self.ring.node_for(object_name) else None
+
+    def _set_gauges(self) -> None:
+        for shard, share in self.ring.shares().items():
+            self.sink.set_gauge('s3_shard_ring_share', share, shard=shard)
+        self.sink.set_gauge('s3_shard_rebalance_pending', int(self.previous_ring is not None))
+
+    def _count(self, shard: str, operation: str) -> None:
+        self.sink.increment('s3_shard_operations_total', shard=shard, operation=operation)
+
+    async def _read(self, object_name: str, operation: str, read: Callable[[SomeStuffRepository], Awaitable[T]]) -> T:
+        shard = self.shard_for(object_name)
+        self._count(shard, operation)
+        try:
+            return await read(self.shards[shard])
+        except SomeStuffRepositoryError as e:
+            previous = self._previous_shard_for(object_name)
+            if previous is None or _client_error_status_code(e) != status.HTTP_404_NOT_FOUND:
+                raise
+        # not moved to its new shard yet
+        self.sink.increment('s3_shard_fallback_reads_total', shard=previous, operation=operation)
+        return await read(self.shards[previous])
+
+    async def _write(self, object_name: str, write: Callable[[str], Awaitable[T]]) -> T:
+        generation = self._generation
+        self._writes[generation] += 1
+        try:
+            # serialised with the rebalance of the key, which would otherwise overwrite it with the old body
+            async with self._key_locks(object_name):
+                return await write(self.shard_for(object_name))
+        finally:
+            self._writes[generation] -= 1
+            async with self._writes_done:
+                self._writes_done.notify_all()
+
+    async def put_some_stuff(self, object_name: str, data: BufferedReader, content_type: str) -> Literal[True]:
+        async def put(shard: str) -> Literal[True]:
+            self._count(shard, 'put')
+            return await self.shards[shard].put_some_stuff(object_name, data, content_type)
+
+        return await self._write(object_name, put)
+
+    async def get_some_stuff(self, object_name: str) -> StreamingBody:
+        return await self._read(object_name, 'get', lambda shard: shard.get_some_stuff(object_name))
+
+    async def get_some_stuff_metadata(self, object_name: str) -> dict:
+        return await self._read(object_name, 'head', lambda shard: shard.get_some_stuff_metadata(object_name))
+
+    async def get_some_stuff_range(self, object_name: str, start: int, end: int | None = None) -> RangeResponse:
+        return await self._read(object_name, 'get_range',
+                                lambda shard: shard.get_some_stuff_range(object_name, start, end))
+
+    async def presign_get_some_stuff(self, object_name: str, **kwargs) -> str:
+        if self._previous_shard_for(object_name) is not None:
+            # the URL must point at the shard that has the object right now
+            async def presign(shard: SomeStuffRepository) -> str:
+                await shard.get_some_stuff_metadata(object_name)
+                return await shard.presign_get_some_stuff(object_name, **kwargs)
+
+            return await self._read(object_name, 'presign_get', presign)
+        shard = self.shard_for(object_name)
+        self._count(shard, 'presign_get')
+        return await self.shards[shard].presign_get_some_stuff(object_name, **kwargs)
+
+    async def presign_put_some_stuff(self, object_name: str, content_type: str, **kwargs) -> str:
+        shard = self.shard_for(object_name)
+        self._count(shard, 'presign_put')
+        return await self.shards[shard].presign_put_some_stuff(object_name, content_type, **kwargs)
+
+    async def remove_some_stuff(self, object_name: str) -> Literal[True]:
+        async def remove(shard: str) -> Literal[True]:
+            self._count(shard, 'delete')
+            previous = self._previous_shard_for(object_name)
+            if previous is not None:
+                await self.shards[previous].remove_some_stuff(object_name)
+            return await self.shards[shard].remove_some_stuff(object_name)
+
+        return await self._write(object_name, remove)
+
+    async def remove_many_some_stuff(self,
+                                     object_names: Iterable[str],
+                                     ) -> dict[str, SomeStuffRepositoryError | None]:
+        """Delete ``object_names`` with batched DeleteObjects on every shard at once; see ``remove_some_stuff``."""
+        by_shard: dict[str, list[str]] = {}
+        for object_name in object_names:
+            by_shard.setdefault(self.shard_for(object_name), []).append(object_name)
+            previous = self._previous_shard_for(object_name)
+            if previous is not None:
+                by_shard.setdefault(previous, []).append(object_name)
+        for shard, names in by_shard.items():
+            self._count(shard, 'delete_many')
+        shard_results = await asyncio.gather(*(self.shards[shard].remove_many_some_stuff(names)
+                                               for shard, names in by_shard.items()))
+        results: dict[str, SomeStuffRepositoryError | None] = {}
+        for shard_result in shard_results:
+            for object_name, error in shard_result.items():
+                # a key removed from two shards failed if either removal did
+                results[object_name] = results.get(object_name) or error
+        return results
+
+    def list_some_stuff(self, prefix: str = '', page_size: int = LIST_PAGE_SIZE) -> AsyncIterator[dict]:
+        """Yield the objects under ``prefix`` on all shards, listed concurrently and interleaved.
+
+        During a rebalance an object being moved may be listed twice, once per shard.
+        """
+        return bounded_merge(lambda shard: shard.list_some_stuff(prefix, page_size=page_size),
+                             list(self.shards.values()), len(self.shards), max_buffered=page_size)
+
+    def add_shard(self, name: str, repository: SomeStuffRepository, weight: int = 1) -> None:
+        """Route keys to a new shard right away; call ``rebalance`` to move its keys to it."""
+        self._check_rebalanced()
+        self.previous_ring = self.ring.copy()
+        self.shards[name] = repository
+        self.ring.add(name, weight)
+        self._generation += 1
+        self._set_gauges()
+
+    def remove_shard(self, name: str) -> None:
+        """Stop routing keys to a shard; it is dropped once ``rebalance`` moved its keys off it."""
+        self._check_rebalanced()
+        self.previous_ring = self.ring.copy()
+        self.ring.remove(name)
+        self._generation += 1
+        self._set_gauges()
+
+    def _check_rebalanced(self) -> None:
+        if self.previous_ring is not None:
+            raise RuntimeError('Rebalance the previous shard change first')
+
+    def start_rebalance(self, max_concurrency: int = REBALANCE_MAX_CONCURRENCY) -> asyncio.Task:
+        """Run ``rebalance`` in the background; the task returns its ``RebalanceReport``."""
+        if self._rebalance_task is None or self._rebalance_task.done():
+            self._rebalance_task = asyncio.create_task(self.rebalance(max_concurrency))
+        return self._rebalance_task
+
+    async def rebalance(self, max_concurrency: int = REBALANCE_MAX_CONCURRENCY) -> RebalanceReport:
+        """Move every key that isn't on its shard, ``max_concurrency`` at a time.
+
+        Every shard of the previous ring is listed, as S3 can't list a hash range. Keys on the
+        same endpoint are copied inside storage, others are read and uploaded again. Once all
+        keys moved the previous ring is dropped; after failures, run it again.
+        """
+        report = RebalanceReport()
+        if self.previous_ring is None:
+            return report
+        generation = self._generation
+        async with self._writes_done:
+            await self._writes_done.wait_for(lambda: not any(count for older, count in self._writes.items()
+                                                             if older < generation))
+
+        async def misplaced_keys() -> AsyncIterator[tuple[str, str]]:
+            for source in self.previous_ring.nodes:
+                async for item in self.shards[source].list_some_stuff():
+                    if self.ring.node_for(item['Key']) != source:
+                        yield source, item['Key']
+
+        async for source, object_name, outcome in bounded_as_completed(self._migrate, misplaced_keys(),
+                                                                          max_concurrency):
+            if isinstance(outcome, SomeStuffRepositoryError):
+                report.failed[object_name] = outcome
+            elif outcome == 'moved':
+                report.moved += 1
+            else:
+                report.skipped += 1
+
+        if not report.failed:
+            for name in self.previous_ring.nodes:
+                if name not in self.ring:
+                    del self.shards[name]
+            self.previous_ring = None
+            self._set_gauges()
+        logger.info('Rebalanced shards: %s moved, %s skipped, %s failed',
+                    report.moved, report.skipped, len(report.failed))
+        return report
+
+    async def _migrate(self, item: tuple[str, str]) -> tuple[str, str, str | SomeStuffRepositoryError]:
+        source, object_name = item
+        target = self.ring.node_for(object_name)
+        source_repository, target_repository = self.shards[source], self.shards[target]
+        async with self._key_locks(object_name):
+            try:
+                # both shards name one bucket: the object already is where it belongs, and its only copy
+                same_location = _same_location(source_repository, target_repository)
+                if same_location or await self._exists(target_repository, object_name):
+                    outcome = 'skipped'
+                elif _same_endpoint(source_repository, target_repository):
+                    await source_repository.copy_some_stuff(object_name, object_name, target_repository.bucket)
+                    outcome = 'moved'
+                else:
+                    metadata = await source_repository.get_some_stuff_metadata(object_name)
+                    await target_repository.put_some_stuff_chunks(
+                        object_name, _stored_bytes(source_repository, object_name, metadata), copied_headers(metadata)
+                    )
+                    outcome = 'moved'
+                if not same_location:
+                    await source_repository.remove_some_stuff(object_name)
+            except SomeStuffRepositoryError as e:
+                logger.warning('Moving %s from shard %s to %s failed: %s', object_name, source, target, e)
+                self.sink.increment('s3_shard_rebalanced_keys_total', source=source, target=target, status='failed')
+                return source, object_name, e
+        self.sink.increment('s3_shard_rebalanced_keys_total', source=source, target=target, status=outcome)
+        return source, object_name, outcome
+
+    @staticmethod
+    async def _exists(repository: SomeStuffRepository, object_name: str) -> bool:
+        try:
+            await repository.get_some_stuff_metadata(object_name)
+        except SomeStuffRepositoryError as e:
+            if _client_error_status_code(e) == status.HTTP_404_NOT_FOUND:
+                return False
+            raise
+        return True
+
+
+async def _stored_bytes(repository: SomeStuffRepository, object_name: str, metadata: dict) -> AsyncIterator[bytes]:
+    """The object's bytes as stored, compressed or not, from the version ``metadata`` describes."""
+    # S3 answers a range of an empty object with 416
+    if metadata.get('ContentLength') == 0:
+        return
+    response = await repository.get_some_stuff_range(object_name, 0, etag=metadata.get('ETag'))
+    try:
+        async for chunk in response.body:
+            yield chunk
+    finally:
+        await response.aclose()
+
+
+def _same_endpoint(repository: SomeStuffRepository, other: SomeStuffRepository) -> bool:
+    """Whether a copy from one to the other can run inside storage."""
+    endpoint = getattr(getattr(repository.s3_client, 'meta', None), 'endpoint_url', None)
+    return endpoint is not None and endpoint == getattr(getattr(other.s3_client, 'meta', None), 'endpoint_url', None)
+
+
+def _same_location(repository: SomeStuffRepository, other: SomeStuffRepository) -> bool:
+    """Whether both store their objects in the same bucket, so an object of one is the other's too."""
+    return repository.bucket == other.bucket and (repository.s3_client is other.s3_client
+                                                  or _same_endpoint(repository, other))
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    name: str
+    endpoint: str
+    bucket: str
+    access_key: str
+    secret_key: str
+
+
+async def open_shards(specs: Iterable[ShardSpec],
+                      exit_stack: AsyncExitStack,
+                      config: Config,
+                      sink: MetricsSink = default_sink) -> dict[str, SomeStuffRepository]:
+    """A repository per shard, each with its own client and so its own connection pool.
+
+    Clients are closed with ``exit_stack``. Each shard's requests are measured under the
+    adapter label ``SomeStuffRepository[<name>]``.
+    """
+    # the process-wide session: the S3 service model is loaded once for every client
+    session = get_aio_session()
+    shards = {}
+    for spec in specs:
+        s3_client = await exit_stack.enter_async_context(session.create_client(
+            's3',
+            endpoint_url=spec.endpoint,
+            aws_access_key_id=spec.access_key,
+            aws_secret_access_key=spec.secret_key,
+            config=config,
+        ))
+        request_metrics = RequestMetrics(sink=sink, adapter=f'SomeStuffRepository[{spec.name}]',
+                                         pool_size=config.max_pool_connections)
+        shards[spec.name] = SomeStuffRepository(s3_client, bucket=spec.bucket, request_metrics=request_metrics)
+    return shards
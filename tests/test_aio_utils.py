@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from aio_utils import SingleFlight, batched, bounded_as_completed, bounded_merge, ordered_prefetch
+
+
+async def numbers(count):
+    for number in range(count):
+        yield number
+
+
+@pytest.mark.parametrize('items', (range(5), numbers(5)))
+async def test_batched_accepts_sync_and_async_iterables(items):
+    assert [batch async for batch in batched(items, 2)] == [[0, 1], [2, 3], [4]]
+
+
+async def test_bounded_as_completed_limits_concurrency():
+    in_flight = max_in_flight = 0
+
+    async def work(item):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.001 * (item % 3))
+        in_flight -= 1
+        return item * 2
+
+    results = [result async for result in bounded_as_completed(work, range(20), 4)]
+
+    assert sorted(results) == [item * 2 for item in range(20)]
+    assert max_in_flight == 4
+
+
+async def test_bounded_as_completed_cancels_pending_on_error():
+    cancelled = []
+
+    async def work(item):
+        if item == 0:
+            raise ValueError('boom')
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(item)
+            raise
+
+    with pytest.raises(ValueError):
+        async for _ in bounded_as_completed(work, range(10), 3):
+            pass
+
+    assert sorted(cancelled) == [1, 2]
+
+
+async def test_bounded_merge_interleaves_sources_within_limits():
+    running = max_running = 0
+
+    async def source(item):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        for number in range(3):
+            await asyncio.sleep(0)
+            yield item, number
+        running -= 1
+
+    merged = [value async for value in bounded_merge(source, 'abcde', 2, max_buffered=1)]
+
+    assert sorted(merged) == [(item, number) for item in 'abcde' for number in range(3)]
+    for item in 'abcde':
+        assert [number for source_item, number in merged if source_item == item] == [0, 1, 2]
+    assert max_running == 2
+
+
+async def test_bounded_merge_raises_producer_errors():
+    async def source(item):
+        yield item
+        if item == 'b':
+            raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        async for _ in bounded_merge(source, 'abc', 3):
+            pass
+
+
+async def test_ordered_prefetch_keeps_order_and_discards_unconsumed():
+    started, discarded = [], []
+
+    async def work(item):
+        started.append(item)
+        await asyncio.sleep(0)
+        return item
+
+    async def discard(result):
+        discarded.append(result)
+
+    results = ordered_prefetch(work, range(5), 3, discard=discard)
+    assert [await anext(results), await anext(results)] == [0, 1]
+    await results.aclose()
+
+    # 3 was queued behind the consumer but cancelled before it ran; 2 finished unconsumed
+    assert started == [0, 1, 2]
+    assert discarded == [2]
+
+
+async def test_single_flight_shares_one_call():
+    single_flight = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.001)
+        return 'result'
+
+    results = await asyncio.gather(*(single_flight.do('key', fetch) for _ in range(10)))
+
+    assert results == ['result'] * 10
+    assert calls == 1
+    assert single_flight.shared == 9
+    assert len(single_flight) == 0
+
+
+async def test_single_flight_survives_cancelled_caller():
+    single_flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    first = asyncio.create_task(single_flight.do('key', fetch))
+    second = asyncio.create_task(single_flight.do('key', fetch))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == 'result'
@@ -0,0 +1,145 @@
+import pytest
+
+from caches import MetadataCache, ObjectCache, PresignedUrlCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_object_cache_serves_fresh_entries(clock):
+    cache = ObjectCache(max_bytes=100, ttl_s=10, clock=clock)
+    cache.store('bucket', 'key', b'data', '"etag"', 'image/jpeg', cache.generation)
+
+    entry = cache.lookup('bucket', 'key')
+
+    assert entry.data == b'data'
+    assert cache.is_fresh(entry)
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+
+
+def test_object_cache_expired_entry_needs_revalidation(clock):
+    cache = ObjectCache(max_bytes=100, ttl_s=10, clock=clock)
+    cache.store('bucket', 'key', b'data', '"etag"', 'image/jpeg', cache.generation)
+    clock.now = 11
+
+    entry = cache.lookup('bucket', 'key')
+    assert not cache.is_fresh(entry)
+    assert cache.stats.hits == 0
+
+    cache.revalidated(entry)
+    assert cache.is_fresh(entry)
+    assert cache.stats.revalidations == 1
+
+
+def test_object_cache_evicts_least_recently_used(clock):
+    cache = ObjectCache(max_bytes=10, clock=clock)
+    cache.store('bucket', 'a', b'aaaa', '"a"', None, cache.generation)
+    cache.store('bucket', 'b', b'bbbb', '"b"', None, cache.generation)
+    cache.lookup('bucket', 'a')
+
+    cache.store('bucket', 'c', b'cccc', '"c"', None, cache.generation)
+
+    assert cache.lookup('bucket', 'b') is None
+    assert cache.lookup('bucket', 'a') is not None
+    assert cache.size == 8
+    assert cache.stats.evictions == 1
+
+
+def test_object_cache_skips_items_over_limit(clock):
+    cache = ObjectCache(max_bytes=100, max_item_bytes=3, clock=clock)
+    cache.store('bucket', 'key', b'data', '"etag"', None, cache.generation)
+
+    assert cache.lookup('bucket', 'key') is None
+    assert cache.stats.misses == 1
+
+
+def test_object_cache_ignores_store_after_invalidation(clock):
+    cache = ObjectCache(max_bytes=100, clock=clock)
+    generation = cache.generation
+    cache.invalidate('bucket', 'key')
+
+    cache.store('bucket', 'key', b'stale', '"etag"', None, generation)
+
+    assert cache.lookup('bucket', 'key') is None
+
+
+def test_metadata_cache_expires_entries(clock):
+    cache = MetadataCache(ttl_s=5, clock=clock)
+    cache.store('bucket', 'key', {'ContentLength': 4}, cache.generation)
+
+    assert cache.lookup('bucket', 'key').metadata == {'ContentLength': 4}
+    clock.now = 5
+    assert cache.lookup('bucket', 'key') is None
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+
+
+def test_metadata_cache_keeps_misses_for_negative_ttl(clock):
+    cache = MetadataCache(ttl_s=5, negative_ttl_s=1, clock=clock)
+    error = LookupError('not found')
+    cache.store_missing('bucket', 'key', error, cache.generation)
+
+    assert cache.lookup('bucket', 'key').error is error
+    clock.now = 1
+    assert cache.lookup('bucket', 'key') is None
+    assert cache.stats.negative_hits == 1
+
+
+def test_metadata_cache_evicts_oldest_entries(clock):
+    cache = MetadataCache(max_entries=2, clock=clock)
+    for key in ('a', 'b', 'c'):
+        cache.store('bucket', key, {}, cache.generation)
+
+    assert cache.lookup('bucket', 'a') is None
+    assert len(cache) == 2
+    assert cache.stats.evictions == 1
+
+
+def test_metadata_cache_ignores_store_after_invalidation(clock):
+    cache = MetadataCache(clock=clock)
+    generation = cache.generation
+    cache.invalidate('bucket', 'key')
+
+    cache.store('bucket', 'key', {'ContentLength': 4}, generation)
+
+    assert cache.lookup('bucket', 'key') is None
+
+
+def test_presigned_url_cache_refreshes_before_expiry(clock):
+    cache = PresignedUrlCache(refresh_margin_s=60, clock=clock)
+    cache.store('key', 'https://signed', expires_at=3600)
+
+    clock.now = 3539
+    assert cache.lookup('key') == 'https://signed'
+    clock.now = 3540
+    assert cache.lookup('key') is None
+    assert len(cache) == 0
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_presigned_url_cache_skips_short_lived_urls(clock):
+    cache = PresignedUrlCache(refresh_margin_s=60, clock=clock)
+    cache.store('key', 'https://signed', expires_at=30)
+
+    assert cache.lookup('key') is None
+
+
+def test_presigned_url_cache_evicts_least_recently_used(clock):
+    cache = PresignedUrlCache(max_entries=2, clock=clock)
+    for key in 'abc':
+        cache.store(key, f'https://{key}', expires_at=3600)
+
+    assert cache.lookup('a') is None
+    assert cache.lookup('c') == 'https://c'
+    assert cache.stats.evictions == 1
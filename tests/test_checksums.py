@@ -0,0 +1,84 @@
+import base64
+import hashlib
+import os
+import zlib
+from io import BytesIO
+
+import pytest
+
+from bodies import BytesBody, ChecksumVerifyingBody
+from checksums import CHECKSUMS, Checksum, checksum_kwargs, checksum_of, new_checksum, read_checksummed, stored_checksum
+
+
+def crc_algorithms():
+    yield 'CRC32'
+    try:
+        new_checksum('CRC32C')
+        yield 'CRC32C'
+    except ImportError:
+        pass
+
+
+def test_checksums_use_s3_encoding():
+    data = b'some_stuff'
+
+    assert checksum_of('CRC32', data).b64digest() == base64.b64encode(zlib.crc32(data).to_bytes(4, 'big')).decode()
+    assert checksum_of('SHA256', data).b64digest() == base64.b64encode(hashlib.sha256(data).digest()).decode()
+    assert checksum_kwargs(checksum_of('SHA256', data)) == {
+        'ChecksumAlgorithm': 'SHA256',
+        'ChecksumSHA256': base64.b64encode(hashlib.sha256(data).digest()).decode(),
+    }
+
+
+def test_read_checksummed_reads_in_chunks():
+    data = BytesIO(b'head' + os.urandom(1000))
+    data.seek(4)
+
+    body, checksum = read_checksummed('CRC32', data, read_size=64)
+
+    assert body == data.getvalue()[4:]
+    assert checksum.b64digest() == checksum_of('CRC32', body).b64digest()
+
+
+@pytest.mark.parametrize('algorithm', list(crc_algorithms()))
+def test_crc_combine_matches_whole_object(algorithm):
+    parts = [os.urandom(size) for size in (5 * 1024 * 1024, 1, 4097)]
+    checksum = new_checksum(algorithm)
+    for part in parts:
+        checksum.combine(checksum_of(algorithm, part).value, len(part))
+
+    assert checksum.b64digest() == checksum_of(algorithm, b''.join(parts)).b64digest()
+
+
+def test_new_checksum_rejects_unknown_algorithm():
+    with pytest.raises(ValueError):
+        new_checksum('MD5')
+    assert set(CHECKSUMS) == {'CRC32', 'CRC32C', 'SHA256'}
+
+
+def test_stored_checksum_skips_composite_checksums():
+    assert stored_checksum({'ChecksumCRC32': 'AAAAAA=='}) == ('CRC32', 'AAAAAA==')
+    assert stored_checksum({'ChecksumSHA256': 'abc=-3', 'ChecksumType': 'COMPOSITE'}) is None
+    assert stored_checksum({'ChecksumSHA256': 'abc=-3'}) is None
+    assert stored_checksum({}) is None
+
+
+async def test_checksum_verifying_body_raises_at_end_of_stream():
+    data = b'x' * 10_000
+    expected = checksum_of('CRC32', data).b64digest()
+
+    body = ChecksumVerifyingBody(BytesBody(data), new_checksum('CRC32'), expected, ValueError)
+    assert b''.join([chunk async for chunk in body.iter_chunks(1000)]) == data
+
+    body = ChecksumVerifyingBody(BytesBody(data[:-1] + b'y'), new_checksum('CRC32'), expected, ValueError)
+    assert len(await body.read(9_999)) == 9_999
+    with pytest.raises(ValueError, match='CRC32 checksum mismatch'):
+        await body.read()
+
+
+def test_checksum_without_update_and_digest_cannot_be_created():
+    class Incomplete(Checksum):
+        algorithm = 'NONE'
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,209 @@
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+from fastapi import HTTPException
+
+import client
+import overload
+from benchmarks.fake_s3 import FakeBotoClient, FakeS3Backend
+from client import S3Client
+from config import Settings
+from ranges import ByteRange
+
+DATA = b'0123456789'
+
+
+@pytest.fixture
+def backend():
+    backend = FakeS3Backend()
+    backend.store('name', 'some_stuff.png', DATA, 'image/png')
+    return backend
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    def configure(**overrides):
+        monkeypatch.setattr(client, 'get_settings', lambda: Settings(**overrides))
+
+    return configure
+
+
+@pytest.fixture
+def make_client(configure, backend):
+    clients = []
+
+    def make_client(**overrides):
+        configure(**overrides)
+        s3_client = S3Client()
+        s3_client.client = FakeBotoClient(backend)
+        clients.append(s3_client)
+        return s3_client
+
+    yield make_client
+    for s3_client in clients:
+        s3_client.close()
+
+
+def record_threads(backend, monkeypatch):
+    threads = []
+
+    def wait():
+        threads.append(threading.current_thread().name)
+
+    monkeypatch.setattr(backend, 'wait', wait)
+    return threads
+
+
+def test_s3_client_rejects_unknown_execution_mode(configure):
+    configure(s3_client_execution_mode='threads')
+
+    with pytest.raises(ValueError, match='execution mode'):
+        S3Client()
+
+
+async def test_s3_client_runs_boto3_calls_on_a_pool_sized_like_the_connection_pool(make_client, backend,
+                                                                                   monkeypatch):
+    s3_client = make_client(s3_client_execution_mode='executor', s3_http_pool_max_size=3)
+    threads = record_threads(backend, monkeypatch)
+
+    assert s3_client._executor._max_workers == 3
+    assert await s3_client.get_binary_file('some_stuff.png') == DATA
+    assert threads[0].startswith('s3-client')
+
+    s3_client.close()
+    assert s3_client._executor is None
+
+
+async def test_s3_client_inline_mode_calls_boto3_on_the_loop(make_client, backend, monkeypatch):
+    s3_client = make_client(s3_client_execution_mode='inline')
+    threads = record_threads(backend, monkeypatch)
+
+    assert s3_client._executor is None
+    assert await s3_client.get_binary_file('some_stuff.png') == DATA
+    assert threads == [threading.current_thread().name]
+
+
+async def test_s3_client_streams_and_reads_into_a_buffer(make_client):
+    s3_client = make_client()
+
+    chunks = [chunk async for chunk in await s3_client.get_binary_file_stream('some_stuff.png', chunk_size=4)]
+    buffer = bytearray(16)
+    size = await s3_client.read_binary_file_into('some_stuff.png', buffer)
+
+    assert chunks == [b'0123', b'4567', b'89']
+    assert (size, bytes(buffer[:size])) == (10, DATA)
+    with pytest.raises(HTTPException) as excinfo:
+        await s3_client.read_binary_file_into('some_stuff.png', bytearray(4))
+    assert excinfo.value.status_code == 500
+
+
+async def test_s3_client_reads_ranges(make_client):
+    s3_client = make_client()
+
+    response = await s3_client.get_binary_file_range('some_stuff.png', 2, 5)
+    responses = [response async for response in s3_client.get_binary_file_ranges('some_stuff.png', [(0, 1), (8, None)])]
+
+    assert (response.byte_range, response.size) == (ByteRange(2, 5), 10)
+    assert b''.join([chunk async for chunk in response.body]) == b'2345'
+    assert [b''.join([chunk async for chunk in response.body]) for response in responses] == [b'01', b'89']
+
+
+async def test_s3_client_object_cache_serves_fresh_entries_and_revalidates(make_client, backend, mocker):
+    s3_client = make_client(s3_client_cache_max_bytes=1000, s3_client_cache_ttl_s=60)
+    get_object = mocker.spy(s3_client.client, 'get_object')
+
+    assert await s3_client.get_binary_file('some_stuff.png') == DATA
+    assert await s3_client.get_binary_file('some_stuff.png') == DATA
+    assert get_object.call_count == 1
+
+    s3_client.object_cache.ttl_s = 0
+    assert await s3_client.get_binary_file('some_stuff.png') == DATA
+    assert get_object.call_args.kwargs['IfNoneMatch'] == backend.objects['name', 'some_stuff.png']['ETag']
+    assert s3_client.object_cache.stats.revalidations == 1
+
+    await s3_client.put_binary_file('some_stuff.png', b'new', 'image/png')
+    assert await s3_client.get_binary_file('some_stuff.png') == b'new'
+
+
+async def test_s3_client_metadata_cache_keeps_hits_and_misses(make_client, mocker):
+    s3_client = make_client(s3_client_metadata_cache_ttl_s=60, s3_client_metadata_cache_negative_ttl_s=60)
+    head_object = mocker.spy(s3_client.client, 'head_object')
+
+    for _ in range(2):
+        assert (await s3_client.get_file_metadata('some_stuff.png'))['ContentLength'] == 10
+        with pytest.raises(HTTPException) as excinfo:
+            await s3_client.get_file_metadata('missing.png')
+        assert excinfo.value.status_code == 404
+
+    assert head_object.call_count == 2
+
+
+async def test_s3_client_removes_many_files_in_batches(make_client, backend, mocker):
+    s3_client = make_client()
+    keys = [f'some_stuff_{number}.png' for number in range(2500)]
+    for key in keys:
+        backend.store('name', key, DATA)
+    delete_objects = mocker.spy(s3_client.client, 'delete_objects')
+
+    results = await s3_client.remove_many_files(keys)
+
+    assert results == dict.fromkeys(keys)
+    assert sorted(len(call.kwargs['Delete']['Objects']) for call in delete_objects.call_args_list) == [500, 1000, 1000]
+    assert list(backend.objects) == [('name', 'some_stuff.png')]
+
+
+async def test_s3_client_remove_many_files_reports_failed_keys(make_client, mocker):
+    s3_client = make_client()
+    mocker.patch.object(s3_client.client, 'delete_objects', return_value={
+        'Errors': [{'Key': 'b.png', 'Message': 'Access Denied'}], 'ResponseMetadata': {'HTTPStatusCode': 200},
+    })
+
+    results = await s3_client.remove_many_files(['a.png', 'b.png'])
+
+    assert results['a.png'] is None
+    assert (results['b.png'].status_code, results['b.png'].detail) == (500, 'Access Denied')
+
+
+async def test_s3_client_moves_files(make_client, backend):
+    s3_client = make_client()
+    backend.store('name', 'other.png', b'other', 'image/png')
+
+    await s3_client.move_file('some_stuff.png', 'moved/some_stuff.png')
+    results = await s3_client.move_many_files([('other.png', 'moved/other.png'), ('missing.png', 'moved/missing.png')])
+
+    assert set(backend.objects) == {('name', 'moved/some_stuff.png'), ('name', 'moved/other.png')}
+    assert backend.objects['name', 'moved/other.png']['data'] == b'other'
+    assert results['other.png'] is None
+    assert results['missing.png'].status_code == 404
+
+
+def test_s3_client_presigns_with_the_default_expiry_and_caches_urls(configure, mocker):
+    configure(s3_client_execution_mode='inline', s3_client_presign_expires_s=900)
+    s3_client = S3Client()
+    generate_presigned_url = mocker.spy(s3_client.client, 'generate_presigned_url')
+
+    url = s3_client.presign_get_file('some_stuff.png')
+
+    assert s3_client.presign_get_file('some_stuff.png') == url
+    generate_presigned_url.assert_called_once_with('get_object', Params={'Bucket': 'name', 'Key': 'some_stuff.png'},
+                                                   ExpiresIn=900)
+    s3_client.presign_put_file('some_stuff.png', 'image/png', expires_in=60)
+    assert generate_presigned_url.call_args.kwargs['ExpiresIn'] == 60
+
+
+async def test_s3_client_guard_fails_fast_once_the_endpoint_keeps_failing(make_client, mocker, monkeypatch):
+    monkeypatch.setattr(overload, '_guards', {})
+    s3_client = make_client(s3_endpoint='http://guarded:9000', s3_client_circuit_breaker_enabled=True)
+    slow_down = ClientError({'Error': {'Code': 'SlowDown'}, 'ResponseMetadata': {'HTTPStatusCode': 503}}, 'GetObject')
+    get_object = mocker.patch.object(s3_client.client, 'get_object', side_effect=slow_down)
+
+    for _ in range(overload.BreakerPolicy().min_calls):
+        with pytest.raises(HTTPException):
+            await s3_client.get_binary_file_stream('some_stuff.png')
+    calls = get_object.call_count
+    with pytest.raises(HTTPException) as excinfo:
+        await s3_client.get_binary_file_stream('some_stuff.png')
+
+    assert excinfo.value.status_code == 503
+    assert get_object.call_count == calls
@@ -0,0 +1,26 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.bench_cold_start import HEAVY_MODULES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('module, allowed', (
+        ('repo_s3', ()),
+        ('session', ()),
+        ('sharding', ()),
+        # HTTPException is the client's error contract
+        ('client', ('fastapi',)),
+))
+def test_import_defers_heavy_modules(tmp_path, module, allowed):
+    script = f'import json, sys, {module}; print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))'
+    # a fresh interpreter, where nothing is imported yet
+    python_path = os.pathsep.join(filter(None, (os.environ.get('PYTHONPATH'), ROOT)))
+    completed = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                               cwd=tmp_path, env={**os.environ, 'PYTHONPATH': python_path})
+    assert set(json.loads(completed.stdout)) <= set(allowed)
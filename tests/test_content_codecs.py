@@ -0,0 +1,70 @@
+import gzip
+from io import BytesIO
+
+import pytest
+
+from bodies import BytesBody, DecompressingBody
+from content_codecs import Codec, CompressionPolicy, GzipCodec, ZstdCodec, compress_parts, get_codec
+
+DATA = b''.join(b'%d,some_stuff_%d.png,image/png\n' % (number, number) for number in range(20_000))
+
+
+def codecs():
+    yield GzipCodec()
+    try:
+        yield ZstdCodec()
+    except ImportError:
+        pass
+
+
+@pytest.mark.parametrize('codec', list(codecs()), ids=lambda codec: codec.name)
+async def test_compress_parts_round_trip(codec):
+    parts = [part async for part in compress_parts(BytesIO(DATA), codec, part_size=4096, read_size=10_000)]
+
+    assert all(len(part) == 4096 for part in parts[:-1])
+    assert 0 < len(parts[-1]) <= 4096
+    body = DecompressingBody(BytesBody(b''.join(parts)), codec.decompressor(), read_size=1000)
+    assert b''.join([chunk async for chunk in body.iter_chunks(5000)]) == DATA
+
+
+async def test_gzip_codec_writes_standard_gzip():
+    parts = [part async for part in compress_parts(BytesIO(DATA), GzipCodec(), part_size=1 << 20)]
+
+    assert gzip.decompress(b''.join(parts)) == DATA
+
+
+async def test_decompressing_body_read_sizes():
+    body = DecompressingBody(BytesBody(gzip.compress(DATA)), GzipCodec().decompressor(), read_size=100)
+
+    assert await body.read(10) == DATA[:10]
+    assert await body.read() == DATA[10:]
+    assert await body.read() == b''
+
+
+@pytest.mark.parametrize(
+    'content_type, size, expected',
+    (
+            ('text/csv', None, True),
+            ('text/csv; charset=utf-8', 10_000, True),
+            ('application/json', 10_000, True),
+            ('text/csv', 10, False),
+            ('image/png', 10_000, False),
+    )
+)
+def test_compression_policy(content_type, size, expected):
+    codec = GzipCodec()
+
+    assert (CompressionPolicy(codec).codec_for(content_type, size) is codec) is expected
+
+
+def test_get_codec_unknown():
+    with pytest.raises(ValueError):
+        get_codec('br')
+
+
+def test_codec_without_compressor_and_decompressor_cannot_be_created():
+    class Incomplete(Codec):
+        name = 'none'
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,62 @@
+import asyncio
+import hashlib
+from io import BytesIO
+
+from dedup import HashingReader, IndexedObject, InMemoryDigestIndex, stream_sha256
+
+
+async def test_in_memory_digest_index_evicts_least_recently_used():
+    index = InMemoryDigestIndex(max_entries=2)
+    await index.add('a', 'a.png', '"1"')
+    await index.add('b', 'b.png', '"2"')
+    await index.get('a')
+    await index.add('c', 'c.png', '"3"')
+
+    assert await index.get('b') is None
+    assert await index.get('a') == IndexedObject('a.png', '"1"')
+    assert len(index) == 2
+
+
+async def test_in_memory_digest_index_tracks_keys():
+    index = InMemoryDigestIndex()
+    await index.add('a', 'some_stuff.png', '"1"')
+    # the key was overwritten with other content
+    await index.add('b', 'some_stuff.png', '"2"')
+
+    assert await index.get('a') is None
+    await index.discard('b', 'other.png')
+    assert await index.get('b') == IndexedObject('some_stuff.png', '"2"')
+    await index.discard_keys(['some_stuff.png'])
+    assert len(index) == 0
+
+
+async def test_in_memory_digest_index_lock_serialises_one_digest():
+    index = InMemoryDigestIndex()
+    order = []
+
+    async def hold(name):
+        async with index.lock('a'):
+            order.append(f'{name} in')
+            await asyncio.sleep(0.001)
+            order.append(f'{name} out')
+
+    await asyncio.gather(hold('first'), hold('second'))
+
+    assert order == ['first in', 'first out', 'second in', 'second out']
+    assert len(index._locks) == 0
+
+
+def test_stream_sha256_rewinds():
+    data = BytesIO(b'header' + b'x' * 10)
+    data.read(6)
+
+    assert stream_sha256(data, read_size=3) == hashlib.sha256(b'x' * 10).hexdigest()
+    assert data.tell() == 6
+
+
+def test_hashing_reader():
+    reader = HashingReader(BytesIO(b'abcdef'))
+    while reader.read(4):
+        pass
+
+    assert reader.hexdigest() == hashlib.sha256(b'abcdef').hexdigest()
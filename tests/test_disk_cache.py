@@ -0,0 +1,179 @@
+import asyncio
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bodies import BytesBody, ChainedBody, MappedBody
+from disk_cache import DiskCache, sendfile
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+async def store(cache, key, data, etag='"etag"'):
+    return await cache.store('bucket', key, BytesBody(data), etag, 'image/jpeg', cache.generation)
+
+
+async def test_disk_cache_serves_fresh_entries(tmp_path, clock):
+    cache = DiskCache(tmp_path, max_bytes=100, ttl_s=10, clock=clock)
+    stored = await store(cache, 'key', b'data')
+
+    entry = await cache.lookup('bucket', 'key')
+
+    assert entry == stored
+    assert cache.is_fresh(entry)
+    async with entry.open() as body:
+        assert await body.read() == b'data'
+    assert entry.headers() == {'ETag': '"etag"'}
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+
+
+async def test_disk_cache_expired_entry_needs_revalidation(tmp_path, clock):
+    cache = DiskCache(tmp_path, max_bytes=100, ttl_s=10, clock=clock)
+    await store(cache, 'key', b'data')
+    clock.now += 11
+
+    entry = await cache.lookup('bucket', 'key')
+    assert not cache.is_fresh(entry)
+    assert cache.stats.hits == 0
+
+    await cache.revalidated(entry)
+    assert cache.is_fresh(await cache.lookup('bucket', 'key'))
+    assert cache.stats.revalidations == 1
+
+
+async def test_disk_cache_survives_restart(tmp_path, clock):
+    cache = DiskCache(tmp_path, max_bytes=100, clock=clock)
+    await store(cache, 'key', b'data')
+    await cache.lookup('bucket', 'key')
+    await cache.close()
+
+    reopened = DiskCache(tmp_path, max_bytes=100, clock=clock)
+
+    assert await reopened.size() == 4
+    async with (await reopened.lookup('bucket', 'key')).open() as body:
+        assert await body.read() == b'data'
+
+
+@pytest.mark.parametrize('policy, evicted', (('lru', 'a'), ('lfu', 'b')))
+async def test_disk_cache_evicts_by_policy(tmp_path, clock, policy, evicted):
+    cache = DiskCache(tmp_path, max_bytes=10, policy=policy, clock=clock)
+    await store(cache, 'a', b'aaaa')
+    await store(cache, 'b', b'bbbb')
+    for key in ('a', 'a', 'b'):
+        clock.now += 1
+        await cache.lookup('bucket', key)
+
+    clock.now += 1
+    await store(cache, 'c', b'cccc')
+
+    assert await cache.lookup('bucket', evicted) is None
+    assert await cache.size() == 8
+    assert await cache.count() == 2
+    assert cache.stats.evictions == 1
+    assert len(list((tmp_path / 'objects').glob('*/*'))) == 2
+
+
+async def test_disk_cache_replaces_entry_atomically(tmp_path, clock):
+    cache = DiskCache(tmp_path, max_bytes=100, clock=clock)
+    await store(cache, 'key', b'old', '"old"')
+    reader = (await cache.lookup('bucket', 'key')).open()
+
+    await store(cache, 'key', b'newer', '"new"')
+
+    assert await reader.read() == b'old'
+    entry = await cache.lookup('bucket', 'key')
+    assert (entry.etag, entry.size, await cache.size()) == ('"new"', 5, 5)
+    assert not list((tmp_path / 'tmp').iterdir())
+
+
+async def test_disk_cache_does_not_keep_body_fetched_before_invalidation(tmp_path, clock):
+    cache = DiskCache(tmp_path, max_bytes=100, clock=clock)
+    generation = cache.generation
+    await cache.invalidate('bucket', 'key')
+
+    body = await cache.store('bucket', 'key', BytesBody(b'stale'), '"etag"', None, generation)
+
+    assert isinstance(body, MappedBody)
+    assert await body.read() == b'stale'
+    assert await cache.lookup('bucket', 'key') is None
+    assert not list((tmp_path / 'tmp').iterdir())
+
+
+async def test_disk_cache_stops_writing_body_larger_than_it_takes(tmp_path, clock):
+    cache = DiskCache(tmp_path, max_bytes=100, max_item_bytes=10, clock=clock)
+
+    body = await store(cache, 'key', b'x' * 2_500_000)
+
+    assert isinstance(body, ChainedBody)
+    assert await body.read() == b'x' * 2_500_000
+    assert await cache.lookup('bucket', 'key') is None
+    assert not list((tmp_path / 'tmp').iterdir())
+
+
+async def test_disk_cache_invalidate_removes_file(tmp_path, clock):
+    cache = DiskCache(tmp_path, max_bytes=100, clock=clock)
+    entry = await store(cache, 'key', b'data')
+
+    await cache.invalidate('bucket', 'key')
+
+    assert await cache.lookup('bucket', 'key') is None
+    assert not entry.path.exists()
+    assert await cache.size() == 0
+
+
+
+async def test_disk_cache_keeps_files_of_commits_racing_invalidation_and_eviction(tmp_path):
+    # two caches on one directory stand in for two processes sharing it
+    with ThreadPoolExecutor(4) as executor:
+        writer = DiskCache(tmp_path, max_bytes=100, executor=executor)
+        other = DiskCache(tmp_path, max_bytes=100, executor=executor)
+        for _ in range(50):
+            await asyncio.gather(store(writer, 'key', b'new'),
+                                 other.invalidate('bucket', 'key'),
+                                 store(other, 'other', b'x' * 98))
+
+            for key in ('key', 'other'):
+                entry = await writer.lookup('bucket', key)
+                assert entry is None or entry.path.exists()
+            files = list((tmp_path / 'objects').glob('*/*'))
+            assert await writer.size() == sum(path.stat().st_size for path in files)
+            assert await writer.count() == len(files)
+        await writer.close()
+        await other.close()
+
+
+async def test_sendfile_sends_cached_file(tmp_path, clock):
+    cache = DiskCache(tmp_path, max_bytes=100, clock=clock)
+    entry = await store(cache, 'key', b'0123456789')
+    sender, receiver = socket.socketpair()
+    sender.setblocking(False)
+    try:
+        assert await sendfile(sender, entry, offset=2, count=5) == 5
+        assert receiver.recv(100) == b'23456'
+    finally:
+        sender.close()
+        receiver.close()
+
+
+async def test_mapped_body_buffer_is_zero_copy(tmp_path):
+    path = tmp_path / 'object'
+    path.write_bytes(b'data')
+    body = MappedBody(path)
+    assert len(body) == 4
+    with body.buffer as view:
+        assert view[1:3] == b'at'
+    body.close()
+    assert await body.read() == b''
@@ -0,0 +1,39 @@
+from io import BytesIO
+
+from metrics import InMemoryMetricsSink, RequestMetrics, loggable_kwargs, render_prometheus
+
+
+def test_render_prometheus_histogram_is_cumulative():
+    sink = InMemoryMetricsSink(buckets=(0.1, 1.0))
+    sink.observe('s3_request_duration_seconds', 0.05, command='get_object')
+    sink.observe('s3_request_duration_seconds', 0.5, command='get_object')
+    sink.observe('s3_request_duration_seconds', 5, command='get_object')
+
+    rendered = render_prometheus(sink)
+
+    assert 's3_request_duration_seconds_bucket{command="get_object",le="0.1"} 1\n' in rendered
+    assert 's3_request_duration_seconds_bucket{command="get_object",le="1.0"} 2\n' in rendered
+    assert 's3_request_duration_seconds_bucket{command="get_object",le="+Inf"} 3\n' in rendered
+    assert 's3_request_duration_seconds_count{command="get_object"} 3\n' in rendered
+
+
+def test_request_metrics_counts_bytes_and_in_flight():
+    sink = InMemoryMetricsSink()
+    request_metrics = RequestMetrics(sink, adapter='repo', pool_size=4)
+    body = BytesIO(b'content')
+    request_kwargs = {'Key': 'some_stuff.png', 'Body': body}
+
+    token = request_metrics.started(request_kwargs)
+    assert sink.gauges['s3_pool_saturation'][(('adapter', 'repo'),)] == 0.25
+    body.read()
+    request_metrics.finished('put_object', token, 200, request_kwargs, {})
+
+    assert sink.counters['s3_bytes_sent_total'][(('adapter', 'repo'), ('command', 'put_object'))] == 7
+    assert sink.gauges['s3_requests_in_flight'][(('adapter', 'repo'),)] == 0
+    assert sink.histograms['s3_request_duration_seconds']
+
+
+def test_loggable_kwargs_hides_body():
+    assert loggable_kwargs({'Key': 'a', 'Body': b'x' * 10}) == {'Key': 'a', 'Body': '<10 bytes>'}
+    assert loggable_kwargs({'Key': 'a', 'Body': BytesIO()}) == {'Key': 'a', 'Body': '<BytesIO>'}
+    assert loggable_kwargs({'Key': 'a'}) == {'Key': 'a'}
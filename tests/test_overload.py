@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+from botocore.exceptions import ClientError
+
+from metrics import InMemoryMetricsSink
+from overload import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    AdaptiveConcurrencyLimit,
+    BreakerPolicy,
+    CircuitBreaker,
+    CircuitOpen,
+    EndpointGuard,
+    LimitPolicy,
+    LoadShed,
+)
+
+
+def client_error(http_status_code, code):
+    return ClientError({'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': http_status_code}}, 'GetObject')
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_then_closes_after_trial_calls():
+    clock = Clock()
+    breaker = CircuitBreaker(BreakerPolicy(window=10, min_calls=4, open_s=5, half_open_calls=2), clock=clock)
+    for failed in (False, True, False):
+        breaker.acquire()
+        breaker.record(failed, 0.01)
+    assert breaker.state == CLOSED
+    breaker.acquire()
+    breaker.record(True, 0.01)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.acquire()
+
+    clock.now = 5
+    breaker.acquire()
+    breaker.acquire()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.acquire()
+    breaker.record(False, 0.01)
+    breaker.record(False, 0.01)
+    assert breaker.state == CLOSED
+
+
+def test_breaker_reopens_on_failed_trial_call():
+    clock = Clock()
+    breaker = CircuitBreaker(BreakerPolicy(min_calls=1, open_s=5), clock=clock)
+    breaker.acquire()
+    breaker.record(True, 0.01)
+    clock.now = 5
+    breaker.acquire()
+    breaker.record(True, 0.01)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.acquire()
+
+
+def test_breaker_counts_slow_calls_as_failures():
+    breaker = CircuitBreaker(BreakerPolicy(min_calls=2, slow_call_s=1))
+    breaker.record(False, 2)
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+
+
+def test_limit_backs_off_once_per_round_trip_and_grows_back():
+    clock = Clock()
+    limiter = AdaptiveConcurrencyLimit(10, LimitPolicy(min_limit=2), clock=clock)
+    for _ in range(10):
+        assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+
+    for _ in range(5):
+        limiter.release('get_object', 0.1, overloaded=True)
+    assert limiter.limit == 9
+    clock.now = 1
+    limiter.release('get_object', 0.1, overloaded=True)
+    assert limiter.limit == pytest.approx(8.1)
+
+    for _ in range(4):
+        limiter.try_acquire()
+        limiter.release('get_object', 0.1, overloaded=False)
+    assert 8.1 < limiter.limit <= 10
+
+
+def test_limit_backs_off_when_latency_rises():
+    limiter = AdaptiveConcurrencyLimit(10)
+    limiter.try_acquire()
+    limiter.release('get_object', 0.01, overloaded=False)
+    limiter.try_acquire()
+    limiter.release('get_object', 0.5, overloaded=False)
+    assert limiter.limit == 9
+
+
+async def test_guard_sheds_over_the_limit():
+    sink = InMemoryMetricsSink()
+    limiter = AdaptiveConcurrencyLimit(1, LimitPolicy())
+    guard = EndpointGuard('s3', limiter=limiter, sink=sink)
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def send():
+        started.set()
+        await release.wait()
+        return 'response'
+
+    task = asyncio.create_task(guard.call('get_object', send))
+    await started.wait()
+    with pytest.raises(LoadShed):
+        await guard.call('get_object', send)
+    release.set()
+    assert await task == 'response'
+    assert limiter.in_flight == 0
+    assert sink.counters['s3_requests_rejected_total'][(('endpoint', 's3'), ('reason', 'shed'))] == 1
+
+
+async def test_guard_opens_on_overload_errors_only():
+    sink = InMemoryMetricsSink()
+    guard = EndpointGuard('s3', breaker=CircuitBreaker(BreakerPolicy(min_calls=2)), sink=sink)
+
+    async def not_found():
+        raise client_error(404, 'NoSuchKey')
+
+    async def slow_down():
+        raise client_error(503, 'SlowDown')
+
+    for send in (not_found, not_found):
+        with pytest.raises(ClientError):
+            await guard.call('get_object', send)
+    assert guard.breaker.state == CLOSED
+    for send in (slow_down, slow_down):
+        with pytest.raises(ClientError):
+            await guard.call('get_object', send)
+    assert guard.breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        await guard.call('get_object', not_found)
+    assert sink.counters['s3_requests_rejected_total'][(('endpoint', 's3'), ('reason', 'circuit_open'))] == 1
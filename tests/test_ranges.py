@@ -0,0 +1,68 @@
+import pytest
+
+from ranges import ByteRange, RangeNotSatisfiable, RangeResponse, multipart_byteranges, parse_content_range, parse_range_header
+
+
+@pytest.mark.parametrize(
+    'header, expected',
+    (
+            ('bytes=0-99', [ByteRange(0, 99)]),
+            ('bytes=900-', [ByteRange(900, 999)]),
+            ('bytes=-100', [ByteRange(900, 999)]),
+            ('bytes=950-2000', [ByteRange(950, 999)]),
+            ('bytes=0-0, 10-19', [ByteRange(0, 0), ByteRange(10, 19)]),
+            ('bytes=0-99, 5000-', [ByteRange(0, 99)]),
+            (None, None),
+            ('items=0-9', None),
+            ('bytes=9-0', None),
+            ('bytes=abc', None),
+            ('bytes=' + ','.join(['0-1'] * 17), None),
+    )
+)
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, 1000) == expected
+
+
+def test_parse_range_header_not_satisfiable():
+    with pytest.raises(RangeNotSatisfiable) as error:
+        parse_range_header('bytes=1000-', 1000)
+
+    assert error.value.content_range == 'bytes */1000'
+
+
+def test_parse_content_range():
+    assert parse_content_range('bytes 0-99/1000') == (ByteRange(0, 99), 1000)
+    assert parse_content_range('bytes 0-99/*') == (ByteRange(0, 99), None)
+    with pytest.raises(ValueError):
+        parse_content_range('0-99/1000')
+
+
+async def chunks(*values):
+    for value in values:
+        yield value
+
+
+async def test_multipart_byteranges_frames_each_part():
+    responses = chunks(
+        RangeResponse(chunks(b'ab', b'c'), ByteRange(0, 2), 10, 'image/png'),
+        RangeResponse(chunks(b'j'), ByteRange(9, 9), 10, 'image/png'),
+    )
+
+    body = b''.join([chunk async for chunk in multipart_byteranges(responses, 'XYZ')])
+
+    assert body == (
+        b'--XYZ\r\nContent-Type: image/png\r\nContent-Range: bytes 0-2/10\r\n\r\nabc\r\n'
+        b'--XYZ\r\nContent-Type: image/png\r\nContent-Range: bytes 9-9/10\r\n\r\nj\r\n'
+        b'--XYZ--\r\n'
+    )
+
+
+def test_range_response_headers():
+    response = RangeResponse(chunks(), ByteRange(10, 19), 100, 'image/png', '"etag"')
+
+    assert response.headers == {
+        'Content-Range': 'bytes 10-19/100',
+        'Content-Length': '10',
+        'Accept-Ranges': 'bytes',
+        'ETag': '"etag"',
+    }
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+from botocore.exceptions import ClientError
+
+from resilience import DeadlineExceeded, HedgePolicy, Resilience, RetryPolicy
+
+
+def client_error(http_status_code, code):
+    return ClientError({'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': http_status_code}}, 'HeadObject')
+
+
+async def test_retries_throttling_until_success():
+    resilience = Resilience(RetryPolicy(max_attempts=3, base_delay_s=0))
+    errors = [client_error(503, 'SlowDown'), client_error(500, 'InternalError')]
+
+    async def attempt():
+        if errors:
+            raise errors.pop(0)
+        return 'response'
+
+    assert await resilience.call('head_object', attempt, retryable=True) == 'response'
+    assert resilience.stats.attempts == 3
+    assert resilience.stats.retries == 2
+
+
+@pytest.mark.parametrize('retryable, error', (
+        (True, client_error(404, 'NoSuchKey')),
+        (False, client_error(503, 'SlowDown')),
+))
+async def test_does_not_retry(retryable, error):
+    resilience = Resilience(RetryPolicy(max_attempts=3, base_delay_s=0))
+
+    async def attempt():
+        raise error
+
+    with pytest.raises(ClientError):
+        await resilience.call('head_object', attempt, retryable=retryable)
+    assert resilience.stats.attempts == 1
+
+
+async def test_deadline_bounds_all_attempts():
+    resilience = Resilience(RetryPolicy(max_attempts=5, deadline_s=0.01))
+
+    async def attempt():
+        await asyncio.sleep(1)
+
+    with pytest.raises(DeadlineExceeded):
+        await resilience.call('head_object', attempt, retryable=True)
+    assert resilience.stats.deadline_exceeded == 1
+
+
+async def test_hedge_answers_for_slow_request():
+    resilience = Resilience(hedge=HedgePolicy(min_samples=1, min_delay_s=0.001), max_in_flight=10)
+    resilience.latencies.record('get_object', 0.001)
+    delays = [1, 0]
+
+    async def attempt():
+        await asyncio.sleep(delays.pop(0))
+        return 'response'
+
+    assert await asyncio.wait_for(resilience.call('get_object', attempt, hedgeable=True), 0.5) == 'response'
+    assert resilience.stats.hedges == 1
+    assert resilience.stats.hedge_wins == 1
+
+
+async def test_no_hedge_when_pool_is_full():
+    resilience = Resilience(hedge=HedgePolicy(min_samples=1, min_delay_s=0.001), max_in_flight=1)
+    resilience.latencies.record('get_object', 0.001)
+
+    async def attempt():
+        await asyncio.sleep(0.01)
+        return 'response'
+
+    assert await resilience.call('get_object', attempt, hedgeable=True) == 'response'
+    assert resilience.stats.hedges == 0
@@ -1,11 +1,24 @@
-from io import BufferedReader
+import asyncio
+import gzip
+import os
+from io import BufferedReader, BytesIO
 from unittest import mock
 
 import pytest
 from aiobotocore.response import StreamingBody
 from botocore.exceptions import ClientError
 
+from aio_utils import SingleFlight
+from bodies import BytesBody, MappedBody
+from caches import MetadataCache, ObjectCache, PresignedUrlCache
+from checksums import checksum_of
+from content_codecs import CompressionPolicy, GzipCodec
+from dedup import InMemoryDigestIndex
+from disk_cache import DiskCache
+from overload import OPEN, BreakerPolicy, CircuitBreaker, EndpointGuard
+from resilience import Resilience, RetryPolicy
 from some_stuff.adapters.s3.repositories.exceptions import SomeStuffRepositoryError
+from some_stuff.adapters.s3.repositories.SomeStuff_repository import SomeStuffRepository
 from some_stuff.config import settings
 
 
@@ -150,6 +163,20 @@ async def test_get_some_stuff_no_such_key(SomeStuff_repository, s3_response_mock
     )
 
 
+async def test_put_some_stuff_error_does_not_render_body(SomeStuff_repository, s3_response_mock):
+    s3_client_mock = SomeStuff_repository.s3_client
+    s3_client_mock.put_object = s3_response_mock
+    s3_response_mock.side_effect = ClientError(
+        {'Error': {'Code': 'InternalError'}, 'ResponseMetadata': {'HTTPStatusCode': 500}}, 'PutObject'
+    )
+
+    with pytest.raises(SomeStuffRepositoryError) as excinfo:
+        await SomeStuff_repository.put_some_stuff_chunks('some_stuff.png', BytesBody(b'secret').iter_chunks(), {})
+
+    assert "'Body': '<6 bytes>'" in str(excinfo.value)
+    assert 'secret' not in str(excinfo.value)
+
+
 async def test_get_some_stuff_metadata_success(SomeStuff_repository, s3_response_mock):
     object_name = 'some_stuff.png'
     s3_client_mock = SomeStuff_repository.s3_client
@@ -280,3 +307,986 @@ async def test_remove_some_stuff_failes(SomeStuff_repository,
         Bucket=SomeStuff_repository.bucket,
         Key=object_name
     )
+
+
+@pytest.fixture
+def multipart_repository(SomeStuff_repository, mocker):
+    SomeStuff_repository.multipart_threshold = 10
+    SomeStuff_repository.multipart_chunksize = 4
+    s3_client_mock = SomeStuff_repository.s3_client
+
+    async def create_multipart_upload(**kwargs):
+        return {'UploadId': 'upload-id', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def upload_part(**kwargs):
+        return {'ETag': f'"etag-{kwargs["PartNumber"]}"', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def complete_multipart_upload(**kwargs):
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def abort_multipart_upload(**kwargs):
+        return {'ResponseMetadata': {'HTTPStatusCode': 204}}
+
+    s3_client_mock.create_multipart_upload = mocker.Mock(wraps=create_multipart_upload)
+    s3_client_mock.upload_part = mocker.Mock(wraps=upload_part)
+    s3_client_mock.complete_multipart_upload = mocker.Mock(wraps=complete_multipart_upload)
+    s3_client_mock.abort_multipart_upload = mocker.Mock(wraps=abort_multipart_upload)
+    return SomeStuff_repository
+
+
+async def test_put_some_stuff_multipart_success(multipart_repository):
+    s3_client_mock = multipart_repository.s3_client
+    data = BytesIO(b'0123456789ab')
+
+    result = await multipart_repository.put_some_stuff('some_stuff.csv', data, 'text/csv')
+
+    assert result is True
+    s3_client_mock.create_multipart_upload.assert_called_once_with(
+        Bucket=multipart_repository.bucket,
+        Key='some_stuff.csv',
+        ContentType='text/csv',
+    )
+    assert [call.kwargs['Body'] for call in s3_client_mock.upload_part.call_args_list] == [b'0123', b'4567', b'89ab']
+    s3_client_mock.complete_multipart_upload.assert_called_once_with(
+        Bucket=multipart_repository.bucket,
+        Key='some_stuff.csv',
+        UploadId='upload-id',
+        MultipartUpload={'Parts': [
+            {'ETag': '"etag-1"', 'PartNumber': 1},
+            {'ETag': '"etag-2"', 'PartNumber': 2},
+            {'ETag': '"etag-3"', 'PartNumber': 3},
+        ]},
+    )
+    s3_client_mock.abort_multipart_upload.assert_not_called()
+
+
+async def test_put_some_stuff_chunks_regroups_them_into_parts(multipart_repository):
+    s3_client_mock = multipart_repository.s3_client
+    chunks = BytesBody(b'0123456789').iter_chunks(3)
+
+    await multipart_repository.put_some_stuff_chunks('some_stuff.csv', chunks, {'ContentEncoding': 'gzip'})
+
+    s3_client_mock.create_multipart_upload.assert_called_once_with(
+        Bucket=multipart_repository.bucket, Key='some_stuff.csv', ContentEncoding='gzip'
+    )
+    assert [call.kwargs['Body'] for call in s3_client_mock.upload_part.call_args_list] == [b'0123', b'4567', b'89']
+
+
+async def test_put_some_stuff_multipart_aborts_on_failure(multipart_repository):
+    s3_client_mock = multipart_repository.s3_client
+
+    async def upload_part(**kwargs):
+        if kwargs['PartNumber'] == 2:
+            raise ClientError({'Error': {'Code': 'InternalError'}, 'ResponseMetadata': {'HTTPStatusCode': 500}},
+                              'UploadPart')
+        return {'ETag': '"etag"', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    s3_client_mock.upload_part.side_effect = upload_part
+
+    with pytest.raises(SomeStuffRepositoryError) as excinfo:
+        await multipart_repository.put_some_stuff('some_stuff.csv', BytesIO(b'0123456789ab'), 'text/csv')
+
+    assert "command='upload_part'" in str(excinfo.value)
+    s3_client_mock.complete_multipart_upload.assert_not_called()
+    s3_client_mock.abort_multipart_upload.assert_called_once_with(
+        Bucket=multipart_repository.bucket,
+        Key='some_stuff.csv',
+        UploadId='upload-id',
+    )
+
+
+
+async def test_put_some_stuff_multipart_grows_parts_to_fit_the_part_limit(multipart_repository, mocker):
+    mocker.patch(f'{SomeStuffRepository.__module__}.MAX_PARTS', 2)
+    s3_client_mock = multipart_repository.s3_client
+
+    await multipart_repository.put_some_stuff('some_stuff.csv', BytesIO(b'0123456789ab'), 'text/csv')
+
+    assert [call.kwargs['Body'] for call in s3_client_mock.upload_part.call_args_list] == [b'012345', b'6789ab']
+
+
+async def test_put_some_stuff_chunks_aborts_past_the_part_limit(multipart_repository, mocker):
+    mocker.patch(f'{SomeStuffRepository.__module__}.MAX_PARTS', 2)
+    s3_client_mock = multipart_repository.s3_client
+    chunks = BytesBody(b'0123456789').iter_chunks(3)
+
+    with pytest.raises(SomeStuffRepositoryError, match='more than 2 parts of 4 bytes'):
+        await multipart_repository.put_some_stuff_chunks('some_stuff.csv', chunks, {})
+
+    s3_client_mock.complete_multipart_upload.assert_not_called()
+    s3_client_mock.abort_multipart_upload.assert_called_once()
+
+
+def test_repository_rejects_parts_smaller_than_s3_takes(s3_client_mock):
+    with pytest.raises(ValueError, match='multipart_chunksize'):
+        SomeStuffRepository(s3_client_mock, multipart_chunksize=1024)
+
+
+def serve_ranges(repository, mocker, content):
+    async def head_object(**kwargs):
+        return {'ContentLength': len(content), 'ETag': '"etag"', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def get_object(**kwargs):
+        start, end = map(int, kwargs['Range'].removeprefix('bytes=').split('-'))
+        body = mock.MagicMock(spec=StreamingBody)
+        body.__aenter__.return_value = body
+        body.read = mock.AsyncMock(return_value=content[start:end + 1])
+        return {'Body': body, 'ETag': '"etag"', 'ResponseMetadata': {'HTTPStatusCode': 206}}
+
+    repository.s3_client.head_object = mocker.Mock(wraps=head_object)
+    repository.s3_client.get_object = mocker.Mock(wraps=get_object)
+
+
+async def test_download_some_stuff_parallel_success(SomeStuff_repository, mocker):
+    content = b'0123456789'
+    s3_client_mock = SomeStuff_repository.s3_client
+    serve_ranges(SomeStuff_repository, mocker, content)
+    buffer = bytearray(len(content))
+
+    result = await SomeStuff_repository.download_some_stuff_parallel('some_stuff.csv', buffer, part_size=4)
+
+    assert result == len(content)
+    assert buffer == content
+    assert sorted(call.kwargs['Range'] for call in s3_client_mock.get_object.call_args_list) == [
+        'bytes=0-3', 'bytes=4-7', 'bytes=8-9',
+    ]
+    assert all(call.kwargs['IfMatch'] == '"etag"' for call in s3_client_mock.get_object.call_args_list)
+
+
+async def test_download_some_stuff_parallel_to_path(SomeStuff_repository, mocker, tmp_path):
+    serve_ranges(SomeStuff_repository, mocker, b'0123456789')
+
+    result = await SomeStuff_repository.download_some_stuff_parallel('some_stuff.csv', tmp_path / 'out', part_size=3)
+
+    assert result == 10
+    assert (tmp_path / 'out').read_bytes() == b'0123456789'
+    SomeStuff_repository.s3_client.head_object.assert_called_once()
+
+
+async def test_iter_some_stuff_parallel_waits_for_cancelled_prefetches(SomeStuff_repository, mocker):
+    serve_ranges(SomeStuff_repository, mocker, b'0123456789')
+    chunks = SomeStuff_repository.iter_some_stuff_parallel('some_stuff.csv', part_size=2, max_concurrency=3)
+
+    assert await anext(chunks) == b'01'
+    await chunks.aclose()
+
+    pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    assert not pending
+
+
+async def test_get_some_stuff_cached_revalidates_with_etag(SomeStuff_repository, mocker, streaming_body_mock):
+    SomeStuff_repository.object_cache = ObjectCache(max_bytes=100, ttl_s=0)
+    s3_client_mock = SomeStuff_repository.s3_client
+    streaming_body_mock.__aenter__.return_value = streaming_body_mock
+    streaming_body_mock.read = mock.AsyncMock(return_value=b'content')
+
+    async def get_object(**kwargs):
+        if 'IfNoneMatch' in kwargs:
+            raise ClientError({'Error': {'Code': '304', 'Message': 'Not Modified'},
+                               'ResponseMetadata': {'HTTPStatusCode': 304}}, 'GetObject')
+        return {'Body': streaming_body_mock, 'ETag': '"etag"', 'ContentLength': 7,
+                'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    s3_client_mock.get_object = mocker.Mock(wraps=get_object)
+
+    first = await SomeStuff_repository.get_some_stuff('some_stuff.png')
+    second = await SomeStuff_repository.get_some_stuff('some_stuff.png')
+
+    assert await first.read() == b'content'
+    assert await second.read() == b'content'
+    assert s3_client_mock.get_object.call_args_list == [
+        mock.call(Bucket=SomeStuff_repository.bucket, Key='some_stuff.png'),
+        mock.call(Bucket=SomeStuff_repository.bucket, Key='some_stuff.png', IfNoneMatch='"etag"'),
+    ]
+    assert SomeStuff_repository.object_cache.stats.revalidations == 1
+
+
+async def test_get_some_stuff_metadata_caches_missing_key(SomeStuff_repository, s3_response_mock):
+    SomeStuff_repository.metadata_cache = MetadataCache(ttl_s=10, negative_ttl_s=10)
+    s3_client_mock = SomeStuff_repository.s3_client
+    s3_client_mock.head_object = s3_response_mock
+    s3_response_mock.side_effect = ClientError(
+        {'Error': {'Code': '404', 'Message': 'Not Found'}, 'ResponseMetadata': {'HTTPStatusCode': 404}},
+        'HeadObject'
+    )
+
+    for _ in range(2):
+        with pytest.raises(SomeStuffRepositoryError) as excinfo:
+            await SomeStuff_repository.get_some_stuff_metadata('some_stuff.png')
+        assert 'code=404' in str(excinfo.value)
+
+    s3_client_mock.head_object.assert_called_once_with(
+        Bucket=SomeStuff_repository.bucket,
+        Key='some_stuff.png'
+    )
+
+
+async def test_get_some_stuff_metadata_cache_invalidated_by_remove(SomeStuff_repository, mocker):
+    SomeStuff_repository.metadata_cache = MetadataCache(ttl_s=10)
+    s3_client_mock = SomeStuff_repository.s3_client
+
+    async def head_object(**kwargs):
+        return {'ContentLength': 4, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def delete_object(**kwargs):
+        return {'ResponseMetadata': {'HTTPStatusCode': 204}}
+
+    s3_client_mock.head_object = mocker.Mock(wraps=head_object)
+    s3_client_mock.delete_object = mocker.Mock(wraps=delete_object)
+
+    await SomeStuff_repository.get_some_stuff_metadata('some_stuff.png')
+    await SomeStuff_repository.get_some_stuff_metadata('some_stuff.png')
+    await SomeStuff_repository.remove_some_stuff('some_stuff.png')
+    await SomeStuff_repository.get_some_stuff_metadata('some_stuff.png')
+
+    assert s3_client_mock.head_object.call_count == 2
+
+
+async def test_remove_many_some_stuff_reports_per_key_errors(SomeStuff_repository, mocker):
+    s3_client_mock = SomeStuff_repository.s3_client
+
+    async def delete_objects(**kwargs):
+        keys = [obj['Key'] for obj in kwargs['Delete']['Objects']]
+        if 'c' in keys:
+            raise ClientError({'Error': {'Code': 'InternalError'}, 'ResponseMetadata': {'HTTPStatusCode': 500}},
+                              'DeleteObjects')
+        errors = [{'Key': 'b', 'Code': 'AccessDenied', 'Message': 'Access Denied'}] if 'b' in keys else []
+        return {'Errors': errors, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    s3_client_mock.delete_objects = mocker.Mock(wraps=delete_objects)
+
+    result = await SomeStuff_repository.remove_many_some_stuff(['a', 'b', 'c', 'd', 'e'], batch_size=2)
+
+    assert result['a'] is None
+    assert result['e'] is None
+    assert "object_name='b'" in str(result['b'])
+    assert isinstance(result['c'], SomeStuffRepositoryError)
+    assert result['c'] is result['d']
+    assert s3_client_mock.delete_objects.call_count == 3
+    s3_client_mock.delete_objects.assert_any_call(
+        Bucket=SomeStuff_repository.bucket,
+        Delete={'Objects': [{'Key': 'a'}, {'Key': 'b'}], 'Quiet': True},
+    )
+
+
+async def test_get_many_some_stuff_metadata_reports_errors_per_item(SomeStuff_repository, mocker):
+    s3_client_mock = SomeStuff_repository.s3_client
+
+    async def head_object(**kwargs):
+        if kwargs['Key'] == 'missing.png':
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'},
+                               'ResponseMetadata': {'HTTPStatusCode': 404}}, 'HeadObject')
+        return {'ContentLength': 4, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    s3_client_mock.head_object = mocker.Mock(wraps=head_object)
+
+    results = dict([
+        result async for result in SomeStuff_repository.get_many_some_stuff_metadata(['a.png', 'missing.png', 'b.png'])
+    ])
+
+    assert results['a.png']['ContentLength'] == 4
+    assert results['b.png']['ContentLength'] == 4
+    assert isinstance(results['missing.png'], SomeStuffRepositoryError)
+    assert s3_client_mock.head_object.call_count == 3
+
+
+async def test_bulk_requests_are_capped_by_pool_size(SomeStuff_repository, mocker):
+    s3_client_mock = SomeStuff_repository.s3_client
+    in_flight = max_in_flight = 0
+
+    async def head_object(**kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    s3_client_mock.head_object = mocker.Mock(wraps=head_object)
+    names = [f'{number}.png' for number in range(50)]
+
+    async def consume():
+        return [result async for result in SomeStuff_repository.get_many_some_stuff_metadata(names)]
+
+    await asyncio.gather(consume(), consume())
+
+    assert max_in_flight == SomeStuff_repository.pool_size
+
+
+async def test_get_some_stuff_coalesces_concurrent_reads(SomeStuff_repository, mocker):
+    SomeStuff_repository.single_flight = SingleFlight()
+    s3_client_mock = SomeStuff_repository.s3_client
+    release = asyncio.Event()
+
+    async def get_object(**kwargs):
+        await release.wait()
+        return {'Body': BytesBody(b'content'), 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    s3_client_mock.get_object = mocker.Mock(wraps=get_object)
+    s3_client_mock.head_object = mock.AsyncMock()
+
+    readers = [asyncio.create_task(SomeStuff_repository.get_some_stuff('some_stuff.png')) for _ in range(10)]
+    await asyncio.sleep(0)
+    release.set()
+    bodies = await asyncio.gather(*readers)
+
+    assert [await body.read() for body in bodies] == [b'content'] * 10
+    s3_client_mock.get_object.assert_called_once_with(
+        Bucket=SomeStuff_repository.bucket,
+        Key='some_stuff.png'
+    )
+    s3_client_mock.head_object.assert_not_called()
+
+
+async def test_get_some_stuff_streams_large_objects_uncoalesced(SomeStuff_repository, mocker):
+    SomeStuff_repository.single_flight = SingleFlight()
+    SomeStuff_repository.coalesce_max_bytes = 4
+    s3_client_mock = SomeStuff_repository.s3_client
+    s3_client_mock.get_object = mocker.AsyncMock(side_effect=lambda **kwargs: {
+        'Body': BytesBody(b'content'), 'ResponseMetadata': {'HTTPStatusCode': 200}
+    })
+
+    bodies = await asyncio.gather(*(SomeStuff_repository.get_some_stuff('some_stuff.png') for _ in range(3)))
+
+    assert [await body.read() for body in bodies] == [b'content'] * 3
+    # the shared read found the body too large and went to one caller, the others read their own
+    assert s3_client_mock.get_object.call_count == 3
+
+
+async def test_get_some_stuff_metadata_coalesces_errors(SomeStuff_repository, mocker):
+    SomeStuff_repository.single_flight = SingleFlight()
+    s3_client_mock = SomeStuff_repository.s3_client
+
+    async def head_object(**kwargs):
+        await asyncio.sleep(0.001)
+        raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'},
+                           'ResponseMetadata': {'HTTPStatusCode': 404}}, 'HeadObject')
+
+    s3_client_mock.head_object = mocker.Mock(wraps=head_object)
+
+    results = await asyncio.gather(
+        *(SomeStuff_repository.get_some_stuff_metadata('missing.png') for _ in range(5)),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, SomeStuffRepositoryError) for result in results)
+    s3_client_mock.head_object.assert_called_once()
+
+
+def list_objects_v2_pages(keys, page_size):
+    async def list_objects_v2(**kwargs):
+        matching = [key for key in keys if key.startswith(kwargs['Prefix'])]
+        start = int(kwargs.get('ContinuationToken', 0))
+        page = matching[start:start + page_size]
+        response = {'Contents': [{'Key': key, 'Size': 1} for key in page],
+                    'IsTruncated': start + page_size < len(matching),
+                    'ResponseMetadata': {'HTTPStatusCode': 200}}
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = str(start + page_size)
+        return response
+    return list_objects_v2
+
+
+async def test_list_some_stuff_follows_continuation_tokens(SomeStuff_repository, mocker):
+    s3_client_mock = SomeStuff_repository.s3_client
+    keys = [f'uid-{number:02}' for number in range(5)]
+    s3_client_mock.list_objects_v2 = mocker.Mock(wraps=list_objects_v2_pages(keys, page_size=2))
+
+    listed = [item['Key'] async for item in SomeStuff_repository.list_some_stuff('uid-', page_size=2)]
+
+    assert listed == keys
+    assert s3_client_mock.list_objects_v2.call_count == 3
+    s3_client_mock.list_objects_v2.assert_called_with(
+        Bucket=SomeStuff_repository.bucket, Prefix='uid-', MaxKeys=2, ContinuationToken='4'
+    )
+
+
+async def test_list_some_stuff_fails_on_error_response(SomeStuff_repository, mocker):
+    async def list_objects_v2(**kwargs):
+        return {'ResponseMetadata': {'HTTPStatusCode': 403}}
+
+    SomeStuff_repository.s3_client.list_objects_v2 = mocker.Mock(wraps=list_objects_v2)
+
+    with pytest.raises(SomeStuffRepositoryError, match="Listing of some_stuff prefix='a' failed"):
+        async for _ in SomeStuff_repository.list_some_stuff('a'):
+            pass
+
+
+async def test_list_many_some_stuff_merges_prefixes(SomeStuff_repository, mocker):
+    keys = [f'{prefix}/{number}' for prefix in 'abc' for number in range(3)]
+    SomeStuff_repository.s3_client.list_objects_v2 = mocker.Mock(wraps=list_objects_v2_pages(keys, page_size=2))
+
+    listed = [item['Key'] async for item in SomeStuff_repository.list_many_some_stuff(
+        ['a/', 'b/', 'c/'], max_concurrency=2, page_size=2
+    )]
+
+    assert sorted(listed) == keys
+
+
+def range_body(data, mocker):
+    async def iter_chunks(chunk_size):
+        yield data
+
+    body = mocker.MagicMock(spec=StreamingBody)
+    body.iter_chunks = iter_chunks
+    return body
+
+
+async def test_get_some_stuff_range_success(SomeStuff_repository, mocker):
+    s3_client_mock = SomeStuff_repository.s3_client
+
+    async def get_object(**kwargs):
+        return {'Body': range_body(b'x' * 10, mocker), 'ContentRange': 'bytes 10-19/100', 'ContentLength': 10,
+                'ContentType': 'image/png', 'ETag': '"abc"', 'ResponseMetadata': {'HTTPStatusCode': 206}}
+
+    s3_client_mock.get_object = mocker.Mock(wraps=get_object)
+
+    response = await SomeStuff_repository.get_some_stuff_range('some_stuff.png', 10, 19)
+
+    assert response.content_range == 'bytes 10-19/100'
+    assert response.length == 10
+    assert b''.join([chunk async for chunk in response.body]) == b'x' * 10
+    s3_client_mock.get_object.assert_called_once_with(
+        Bucket=SomeStuff_repository.bucket, Key='some_stuff.png', Range='bytes=10-19'
+    )
+
+
+async def test_get_some_stuff_ranges_pins_etag(SomeStuff_repository, mocker):
+    s3_client_mock = SomeStuff_repository.s3_client
+
+    async def get_object(**kwargs):
+        start, end = map(int, kwargs['Range'].removeprefix('bytes=').split('-'))
+        return {'Body': range_body(b'x' * (end - start + 1), mocker), 'ContentRange': f'bytes {start}-{end}/100',
+                'ETag': '"abc"', 'ResponseMetadata': {'HTTPStatusCode': 206}}
+
+    s3_client_mock.get_object = mocker.Mock(wraps=get_object)
+
+    responses = [response async for response in
+                 SomeStuff_repository.get_some_stuff_ranges('some_stuff.png', [(0, 9), (50, 59), (90, 99)])]
+
+    assert [response.content_range for response in responses] == [
+        'bytes 0-9/100', 'bytes 50-59/100', 'bytes 90-99/100'
+    ]
+    s3_client_mock.get_object.assert_called_with(
+        Bucket=SomeStuff_repository.bucket, Key='some_stuff.png', Range='bytes=90-99', IfMatch='"abc"'
+    )
+
+
+async def test_get_some_stuff_range_not_satisfiable(SomeStuff_repository, mocker):
+    async def get_object(**kwargs):
+        raise ClientError({'Error': {'Code': 'InvalidRange'}, 'ResponseMetadata': {'HTTPStatusCode': 416}},
+                          'GetObject')
+
+    SomeStuff_repository.s3_client.get_object = mocker.Mock(wraps=get_object)
+
+    with pytest.raises(SomeStuffRepositoryError):
+        await SomeStuff_repository.get_some_stuff_range('some_stuff.png', 1000)
+
+
+async def test_put_some_stuff_compresses_text(SomeStuff_repository, s3_response_mock):
+    SomeStuff_repository.compression = CompressionPolicy(GzipCodec())
+    s3_client_mock = SomeStuff_repository.s3_client
+    s3_client_mock.put_object = s3_response_mock
+    data = b'uid,name\n' * 1000
+
+    await SomeStuff_repository.put_some_stuff('some_stuff.csv', BytesIO(data), 'text/csv')
+
+    kwargs = s3_client_mock.put_object.call_args.kwargs
+    assert kwargs['ContentEncoding'] == 'gzip'
+    assert kwargs['Metadata'] == {'codec': 'gzip'}
+    assert gzip.decompress(kwargs['Body']) == data
+
+
+async def test_put_some_stuff_compressed_multipart(multipart_repository):
+    multipart_repository.compression = CompressionPolicy(GzipCodec(), min_size=0)
+    s3_client_mock = multipart_repository.s3_client
+    data = os.urandom(3 * multipart_repository.multipart_chunksize)
+
+    await multipart_repository.put_some_stuff('some_stuff.csv', BytesIO(data), 'text/csv')
+
+    s3_client_mock.create_multipart_upload.assert_called_once_with(
+        Bucket=multipart_repository.bucket, Key='some_stuff.csv', ContentType='text/csv',
+        ContentEncoding='gzip', Metadata={'codec': 'gzip'},
+    )
+    bodies = [call.kwargs['Body'] for call in s3_client_mock.upload_part.call_args_list]
+    assert gzip.decompress(b''.join(bodies)) == data
+
+
+
+async def test_put_some_stuff_compressed_grows_parts_to_fit_the_part_limit(multipart_repository, mocker):
+    mocker.patch(f'{SomeStuffRepository.__module__}.MAX_PARTS', 4)
+    multipart_repository.compression = CompressionPolicy(GzipCodec(), min_size=0)
+    s3_client_mock = multipart_repository.s3_client
+    data = b'0123456789' * 10
+
+    await multipart_repository.put_some_stuff('some_stuff.csv', BytesIO(data), 'text/csv')
+
+    bodies = [call.kwargs['Body'] for call in s3_client_mock.upload_part.call_args_list]
+    assert all(len(body) <= 25 for body in bodies) and len(bodies[0]) == 25
+    assert gzip.decompress(b''.join(bodies)) == data
+
+
+async def test_put_some_stuff_compressed_below_threshold_is_one_put(multipart_repository, s3_response_mock):
+    multipart_repository.compression = CompressionPolicy(GzipCodec(), min_size=0)
+    multipart_repository.multipart_threshold = 1000
+    s3_client_mock = multipart_repository.s3_client
+    s3_client_mock.put_object = s3_response_mock
+    data = os.urandom(200)
+
+    await multipart_repository.put_some_stuff('some_stuff.csv', BytesIO(data), 'text/csv')
+
+    s3_client_mock.create_multipart_upload.assert_not_called()
+    assert gzip.decompress(s3_client_mock.put_object.call_args.kwargs['Body']) == data
+
+
+async def test_get_some_stuff_decompresses(SomeStuff_repository, mocker):
+    data = b'uid,name\n' * 1000
+
+    async def get_object(**kwargs):
+        return {'Body': BytesBody(gzip.compress(data)), 'Metadata': {'codec': 'gzip'},
+                'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    SomeStuff_repository.s3_client.get_object = mocker.Mock(wraps=get_object)
+
+    async with await SomeStuff_repository.get_some_stuff('some_stuff.csv') as body:
+        assert await body.read() == data
+
+
+@pytest.fixture
+def dedup_repository(SomeStuff_repository, mocker):
+    SomeStuff_repository.digest_index = InMemoryDigestIndex()
+    s3_client_mock = SomeStuff_repository.s3_client
+    objects = {}
+
+    async def put_object(**kwargs):
+        await asyncio.sleep(0.001)
+        objects[kwargs['Key']] = kwargs['Body'].read()
+        return {'ETag': f'"{len(objects)}"', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def copy_object(**kwargs):
+        if kwargs['CopySource']['Key'] not in objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}, 'ResponseMetadata': {'HTTPStatusCode': 404}},
+                              'CopyObject')
+        objects[kwargs['Key']] = objects[kwargs['CopySource']['Key']]
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def delete_object(**kwargs):
+        objects.pop(kwargs['Key'], None)
+        return {'ResponseMetadata': {'HTTPStatusCode': 204}}
+
+    s3_client_mock.put_object = mocker.Mock(wraps=put_object)
+    s3_client_mock.copy_object = mocker.Mock(wraps=copy_object)
+    s3_client_mock.delete_object = mocker.Mock(wraps=delete_object)
+    SomeStuff_repository.objects = objects
+    return SomeStuff_repository
+
+
+async def test_put_some_stuff_dedup_copies_known_content(dedup_repository):
+    s3_client_mock = dedup_repository.s3_client
+
+    await dedup_repository.put_some_stuff('first.png', BytesIO(b'image'), 'image/png')
+    await dedup_repository.put_some_stuff('second.png', BytesIO(b'image'), 'image/png')
+
+    s3_client_mock.put_object.assert_called_once()
+    s3_client_mock.copy_object.assert_called_once_with(
+        Bucket=dedup_repository.bucket,
+        Key='second.png',
+        CopySource={'Bucket': dedup_repository.bucket, 'Key': 'first.png'},
+        CopySourceIfMatch='"1"',
+        MetadataDirective='COPY',
+    )
+    assert dedup_repository.objects['second.png'] == b'image'
+
+
+async def test_put_some_stuff_dedup_concurrent_uploads_send_content_once(dedup_repository):
+    s3_client_mock = dedup_repository.s3_client
+
+    await asyncio.gather(*(
+        dedup_repository.put_some_stuff(f'{number}.png', BytesIO(b'image'), 'image/png') for number in range(5)
+    ))
+
+    assert s3_client_mock.put_object.call_count == 1
+    assert s3_client_mock.copy_object.call_count == 4
+    assert set(dedup_repository.objects.values()) == {b'image'}
+
+
+async def test_put_some_stuff_dedup_uploads_when_source_removed(dedup_repository):
+    s3_client_mock = dedup_repository.s3_client
+    await dedup_repository.put_some_stuff('first.png', BytesIO(b'image'), 'image/png')
+    # removed behind the repository's back, so the index still points at it
+    dedup_repository.objects.clear()
+
+    await dedup_repository.put_some_stuff('second.png', BytesIO(b'image'), 'image/png')
+    await dedup_repository.put_some_stuff('third.png', BytesIO(b'image'), 'image/png')
+
+    assert s3_client_mock.put_object.call_count == 2
+    s3_client_mock.copy_object.assert_called_with(
+        Bucket=dedup_repository.bucket,
+        Key='third.png',
+        CopySource={'Bucket': dedup_repository.bucket, 'Key': 'second.png'},
+        CopySourceIfMatch='"1"',
+        MetadataDirective='COPY',
+    )
+
+
+async def test_remove_some_stuff_drops_dedup_source(dedup_repository):
+    s3_client_mock = dedup_repository.s3_client
+    await dedup_repository.put_some_stuff('first.png', BytesIO(b'image'), 'image/png')
+
+    await dedup_repository.remove_some_stuff('first.png')
+    await dedup_repository.put_some_stuff('second.png', BytesIO(b'image'), 'image/png')
+
+    assert s3_client_mock.put_object.call_count == 2
+    s3_client_mock.copy_object.assert_not_called()
+
+
+async def test_presign_get_some_stuff_is_cached(SomeStuff_repository, mocker):
+    SomeStuff_repository.presigned_url_cache = PresignedUrlCache()
+    s3_client_mock = SomeStuff_repository.s3_client
+
+    async def generate_presigned_url(command, Params, ExpiresIn):
+        return f"https://storage/{Params['Key']}?expires={ExpiresIn}"
+
+    s3_client_mock.generate_presigned_url = mocker.Mock(wraps=generate_presigned_url)
+
+    urls = [await SomeStuff_repository.presign_get_some_stuff('some_stuff.png', expires_in=600) for _ in range(3)]
+
+    assert urls == ['https://storage/some_stuff.png?expires=600'] * 3
+    s3_client_mock.generate_presigned_url.assert_called_once_with(
+        'get_object', Params={'Bucket': SomeStuff_repository.bucket, 'Key': 'some_stuff.png'}, ExpiresIn=600
+    )
+    await SomeStuff_repository.presign_get_some_stuff('some_stuff.png', expires_in=900)
+    assert s3_client_mock.generate_presigned_url.call_count == 2
+
+
+async def test_create_presigned_multipart_upload(SomeStuff_repository, mocker):
+    s3_client_mock = SomeStuff_repository.s3_client
+
+    async def create_multipart_upload(**kwargs):
+        return {'UploadId': 'upload-id', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def generate_presigned_url(command, Params, ExpiresIn):
+        return f"https://storage/{Params['Key']}?partNumber={Params['PartNumber']}&uploadId={Params['UploadId']}"
+
+    s3_client_mock.create_multipart_upload = mocker.Mock(wraps=create_multipart_upload)
+    s3_client_mock.generate_presigned_url = mocker.Mock(wraps=generate_presigned_url)
+
+    upload = await SomeStuff_repository.create_presigned_multipart_upload('large.csv', 'text/csv', part_count=3)
+
+    assert upload.upload_id == 'upload-id'
+    assert upload.part_urls == [f'https://storage/large.csv?partNumber={number}&uploadId=upload-id'
+                                for number in (1, 2, 3)]
+    with pytest.raises(SomeStuffRepositoryError, match='10000 parts'):
+        await SomeStuff_repository.create_presigned_multipart_upload('large.csv', 'text/csv', part_count=10_001)
+
+
+async def test_create_presigned_multipart_upload_aborts_when_presigning_fails(SomeStuff_repository, mocker):
+    s3_client_mock = SomeStuff_repository.s3_client
+    s3_client_mock.create_multipart_upload = mock.AsyncMock(
+        return_value={'UploadId': 'upload-id', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+    )
+    s3_client_mock.generate_presigned_url = mock.AsyncMock(side_effect=RuntimeError('no credentials'))
+    s3_client_mock.abort_multipart_upload = mock.AsyncMock(return_value={'ResponseMetadata': {'HTTPStatusCode': 204}})
+
+    with pytest.raises(RuntimeError):
+        await SomeStuff_repository.create_presigned_multipart_upload('large.csv', 'text/csv', part_count=3)
+
+    s3_client_mock.abort_multipart_upload.assert_called_once_with(
+        Bucket=SomeStuff_repository.bucket, Key='large.csv', UploadId='upload-id'
+    )
+
+
+@pytest.fixture
+def copy_repository(SomeStuff_repository, mocker):
+    s3_client_mock = SomeStuff_repository.s3_client
+    objects = {'a.png': 10, 'b.png': 20, 'huge.bin': 6 * 1024 ** 3}
+
+    async def head_object(**kwargs):
+        if kwargs['Key'] not in objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}, 'ResponseMetadata': {'HTTPStatusCode': 404}},
+                              'HeadObject')
+        return {'ContentLength': objects[kwargs['Key']], 'ETag': '"source"', 'ContentType': 'image/png',
+                'Metadata': {}, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def copy_object(**kwargs):
+        objects[kwargs['Key']] = objects[kwargs['CopySource']['Key']]
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def create_multipart_upload(**kwargs):
+        return {'UploadId': 'upload-id', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def upload_part_copy(**kwargs):
+        return {'CopyPartResult': {'ETag': f'"etag-{kwargs["PartNumber"]}"'}, 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def complete_multipart_upload(**kwargs):
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def abort_multipart_upload(**kwargs):
+        return {'ResponseMetadata': {'HTTPStatusCode': 204}}
+
+    async def delete_objects(**kwargs):
+        for item in kwargs['Delete']['Objects']:
+            objects.pop(item['Key'])
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    for handler in (head_object, copy_object, create_multipart_upload, upload_part_copy, complete_multipart_upload,
+                    abort_multipart_upload, delete_objects):
+        setattr(s3_client_mock, handler.__name__, mocker.Mock(wraps=handler))
+    SomeStuff_repository.objects = objects
+    return SomeStuff_repository
+
+
+async def test_copy_some_stuff_uses_copy_object(copy_repository):
+    s3_client_mock = copy_repository.s3_client
+
+    result = await copy_repository.copy_some_stuff('a.png', 'c.png', target_bucket='other')
+
+    assert result is True
+    s3_client_mock.copy_object.assert_called_once_with(
+        Bucket='other',
+        Key='c.png',
+        CopySource={'Bucket': copy_repository.bucket, 'Key': 'a.png'},
+        MetadataDirective='COPY',
+    )
+    s3_client_mock.create_multipart_upload.assert_not_called()
+
+
+async def test_copy_some_stuff_large_object_copies_parts(copy_repository):
+    s3_client_mock = copy_repository.s3_client
+
+    await copy_repository.copy_some_stuff('huge.bin', 'huge-copy.bin', part_size=2 * 1024 ** 3)
+
+    s3_client_mock.copy_object.assert_not_called()
+    s3_client_mock.create_multipart_upload.assert_called_once_with(
+        Bucket=copy_repository.bucket, Key='huge-copy.bin', ContentType='image/png',
+    )
+    part_calls = sorted(s3_client_mock.upload_part_copy.call_args_list, key=lambda call: call.kwargs['PartNumber'])
+    assert [call.kwargs['CopySourceRange'] for call in part_calls] == [
+        'bytes=0-2147483647', 'bytes=2147483648-4294967295', 'bytes=4294967296-6442450943',
+    ]
+    assert {call.kwargs['CopySourceIfMatch'] for call in part_calls} == {'"source"'}
+    s3_client_mock.complete_multipart_upload.assert_called_once_with(
+        Bucket=copy_repository.bucket,
+        Key='huge-copy.bin',
+        UploadId='upload-id',
+        MultipartUpload={'Parts': [{'ETag': f'"etag-{number}"', 'PartNumber': number} for number in (1, 2, 3)]},
+    )
+
+
+async def test_copy_some_stuff_large_object_aborts_on_failure(copy_repository):
+    s3_client_mock = copy_repository.s3_client
+
+    async def upload_part_copy(**kwargs):
+        raise ClientError({'Error': {'Code': 'PreconditionFailed'}, 'ResponseMetadata': {'HTTPStatusCode': 412}},
+                          'UploadPartCopy')
+
+    s3_client_mock.upload_part_copy.side_effect = upload_part_copy
+
+    with pytest.raises(SomeStuffRepositoryError):
+        await copy_repository.copy_some_stuff('huge.bin', 'huge-copy.bin')
+
+    s3_client_mock.complete_multipart_upload.assert_not_called()
+    s3_client_mock.abort_multipart_upload.assert_called_once_with(
+        Bucket=copy_repository.bucket, Key='huge-copy.bin', UploadId='upload-id',
+    )
+
+
+async def test_move_many_some_stuff_removes_copied_sources(copy_repository):
+    s3_client_mock = copy_repository.s3_client
+
+    results = await copy_repository.move_many_some_stuff([('a.png', 'x/a.png'), ('missing.png', 'x/missing.png'),
+                                                          ('b.png', 'b.png')])
+
+    assert results['a.png'] is None
+    assert results['b.png'] is None
+    assert isinstance(results['missing.png'], SomeStuffRepositoryError)
+    assert copy_repository.objects.keys() == {'x/a.png', 'b.png', 'huge.bin'}
+    s3_client_mock.delete_objects.assert_called_once()
+
+
+async def test_put_some_stuff_sends_checksum(SomeStuff_repository, s3_response_mock):
+    SomeStuff_repository.checksum_algorithm = 'SHA256'
+    s3_client_mock = SomeStuff_repository.s3_client
+    s3_client_mock.put_object = s3_response_mock
+    data = BytesIO(b'image')
+
+    await SomeStuff_repository.put_some_stuff('some_stuff.png', data, 'image/png')
+
+    s3_client_mock.put_object.assert_called_once_with(
+        Bucket=SomeStuff_repository.bucket,
+        Key='some_stuff.png',
+        Body=b'image',
+        ContentType='image/png',
+        ChecksumAlgorithm='SHA256',
+        ChecksumSHA256=checksum_of('SHA256', b'image').b64digest(),
+    )
+
+
+async def test_put_some_stuff_multipart_sends_full_object_checksum(multipart_repository):
+    multipart_repository.checksum_algorithm = 'CRC32'
+    s3_client_mock = multipart_repository.s3_client
+
+    await multipart_repository.put_some_stuff('some_stuff.csv', BytesIO(b'0123456789ab'), 'text/csv')
+
+    s3_client_mock.create_multipart_upload.assert_called_once_with(
+        Bucket=multipart_repository.bucket,
+        Key='some_stuff.csv',
+        ContentType='text/csv',
+        ChecksumAlgorithm='CRC32',
+        ChecksumType='FULL_OBJECT',
+    )
+    part_checksums = {call.kwargs['PartNumber']: call.kwargs['ChecksumCRC32']
+                      for call in s3_client_mock.upload_part.call_args_list}
+    assert part_checksums == {1: checksum_of('CRC32', b'0123').b64digest(),
+                              2: checksum_of('CRC32', b'4567').b64digest(),
+                              3: checksum_of('CRC32', b'89ab').b64digest()}
+    complete_kwargs = s3_client_mock.complete_multipart_upload.call_args.kwargs
+    assert complete_kwargs['ChecksumCRC32'] == checksum_of('CRC32', b'0123456789ab').b64digest()
+    assert complete_kwargs['ChecksumType'] == 'FULL_OBJECT'
+    assert complete_kwargs['MultipartUpload']['Parts'][0] == {
+        'ETag': '"etag-1"', 'PartNumber': 1, 'ChecksumCRC32': part_checksums[1],
+    }
+
+
+@pytest.mark.parametrize('stored, fails', ((b'image', False), (b'imagf', True)))
+async def test_get_some_stuff_verifies_checksum(SomeStuff_repository, mocker, stored, fails):
+    SomeStuff_repository.verify_checksums = True
+
+    async def get_object(**kwargs):
+        return {'Body': BytesBody(stored), 'ChecksumCRC32': checksum_of('CRC32', b'image').b64digest(),
+                'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    SomeStuff_repository.s3_client.get_object = mocker.Mock(wraps=get_object)
+
+    body = await SomeStuff_repository.get_some_stuff('some_stuff.png')
+    if fails:
+        with pytest.raises(SomeStuffRepositoryError, match='checksum mismatch'):
+            await body.read()
+    else:
+        assert await body.read() == b'image'
+    SomeStuff_repository.s3_client.get_object.assert_called_once_with(
+        Bucket=SomeStuff_repository.bucket, Key='some_stuff.png', ChecksumMode='ENABLED',
+    )
+
+
+async def test_open_circuit_fails_fast(SomeStuff_repository, s3_response_mock):
+    SomeStuff_repository.guard = EndpointGuard('s3', breaker=CircuitBreaker(BreakerPolicy(min_calls=1)))
+    s3_client_mock = SomeStuff_repository.s3_client
+    s3_client_mock.head_object = s3_response_mock
+    s3_response_mock.side_effect = ClientError(
+        {'Error': {'Code': 'SlowDown', 'Message': 'Slow Down'}, 'ResponseMetadata': {'HTTPStatusCode': 503}},
+        'HeadObject'
+    )
+
+    with pytest.raises(SomeStuffRepositoryError, match='code=503'):
+        await SomeStuff_repository.get_some_stuff_metadata('some_stuff.png')
+    with pytest.raises(SomeStuffRepositoryError, match='was not sent'):
+        await SomeStuff_repository.get_some_stuff_metadata('some_stuff.png')
+    s3_client_mock.head_object.assert_called_once()
+
+
+async def test_guard_counts_every_retry(SomeStuff_repository, s3_response_mock):
+    breaker = CircuitBreaker(BreakerPolicy(min_calls=2))
+    SomeStuff_repository.guard = EndpointGuard('s3', breaker=breaker)
+    SomeStuff_repository.resilience = Resilience(RetryPolicy(max_attempts=3, base_delay_s=0))
+    s3_client_mock = SomeStuff_repository.s3_client
+    s3_client_mock.head_object = s3_response_mock
+    s3_response_mock.side_effect = ClientError(
+        {'Error': {'Code': 'SlowDown', 'Message': 'Slow Down'}, 'ResponseMetadata': {'HTTPStatusCode': 503}},
+        'HeadObject'
+    )
+
+    with pytest.raises(SomeStuffRepositoryError, match='was not sent'):
+        await SomeStuff_repository.get_some_stuff_metadata('some_stuff.png')
+
+    assert breaker.state == OPEN
+    assert s3_client_mock.head_object.call_count == 2
+
+
+@pytest.fixture
+def disk_repository(SomeStuff_repository, mocker, tmp_path):
+    SomeStuff_repository.disk_cache = DiskCache(tmp_path, max_bytes=100, ttl_s=0)
+    responses = []
+
+    async def get_object(**kwargs):
+        if 'IfNoneMatch' in kwargs:
+            raise ClientError({'Error': {'Code': '304', 'Message': 'Not Modified'},
+                               'ResponseMetadata': {'HTTPStatusCode': 304}}, 'GetObject')
+        responses.append(kwargs)
+        return {'Body': BytesBody(b'content'), 'ETag': '"etag"', 'ContentLength': 7, 'ContentType': 'image/png',
+                'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    SomeStuff_repository.s3_client.get_object = mocker.Mock(wraps=get_object)
+    return SomeStuff_repository
+
+
+async def test_get_some_stuff_reads_through_disk_cache(disk_repository):
+    first = await disk_repository.get_some_stuff('some_stuff.png')
+    second = await disk_repository.get_some_stuff('some_stuff.png')
+
+    assert isinstance(second, MappedBody)
+    assert await first.read() == b'content'
+    assert await second.read() == b'content'
+    assert disk_repository.s3_client.get_object.call_args_list == [
+        mock.call(Bucket=disk_repository.bucket, Key='some_stuff.png'),
+        mock.call(Bucket=disk_repository.bucket, Key='some_stuff.png', IfNoneMatch='"etag"'),
+    ]
+    assert disk_repository.disk_cache.stats.revalidations == 1
+
+
+async def test_get_some_stuff_fills_object_cache_from_disk(disk_repository):
+    disk_repository.disk_cache.ttl_s = 60
+    await disk_repository.get_some_stuff('some_stuff.png')
+    disk_repository.object_cache = ObjectCache(max_bytes=100, ttl_s=60)
+
+    body = await disk_repository.get_some_stuff('some_stuff.png')
+
+    assert await body.read() == b'content'
+    assert disk_repository.object_cache.lookup(disk_repository.bucket, 'some_stuff.png').data == b'content'
+    disk_repository.s3_client.get_object.assert_called_once()
+
+
+async def test_get_some_stuff_file_stays_readable_after_eviction(disk_repository):
+    cached = await disk_repository.get_some_stuff_file('some_stuff.png')
+
+    assert (cached.content_type, cached.headers()) == ('image/png', {'ETag': '"etag"'})
+    await disk_repository._invalidate('some_stuff.png')
+    assert not cached.path.exists()
+    assert cached.file.read() == b'content'
+    cached.close()
+
+
+
+async def test_get_some_stuff_drops_disk_entry_whose_file_is_gone(disk_repository):
+    disk_repository.disk_cache.ttl_s = 60
+    cached = await disk_repository.get_some_stuff_file('some_stuff.png')
+    cached.close()
+    cached.path.unlink()
+
+    body = await disk_repository.get_some_stuff('some_stuff.png')
+
+    assert await body.read() == b'content'
+    assert await disk_repository.disk_cache.count() == 0
+    assert await disk_repository.disk_cache.size() == 0
+
+
+async def test_get_some_stuff_ranges_closes_discarded_prefetched_bodies(SomeStuff_repository, mocker):
+    bodies = []
+
+    async def get_object(**kwargs):
+        start, end = map(int, kwargs['Range'].removeprefix('bytes=').split('-'))
+        bodies.append(range_body(b'x' * (end - start + 1), mocker))
+        return {'Body': bodies[-1], 'ContentRange': f'bytes {start}-{end}/100',
+                'ETag': '"abc"', 'ResponseMetadata': {'HTTPStatusCode': 206}}
+
+    SomeStuff_repository.s3_client.get_object = mocker.Mock(wraps=get_object)
+
+    responses = SomeStuff_repository.get_some_stuff_ranges('some_stuff.png', [(0, 9), (50, 59), (90, 99)])
+    await anext(responses)
+    await anext(responses)
+    await asyncio.sleep(0)
+    await responses.aclose()
+
+    # the third range was prefetched and dropped without anyone iterating its body
+    assert len(bodies) == 3
+    bodies[2].close.assert_called_once()
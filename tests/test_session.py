@@ -0,0 +1,107 @@
+import asyncio
+import logging
+
+import pytest
+from botocore.client import Config
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+import session
+from session import SharedAsyncClient, get_shared_client, on_shutdown, on_startup, prewarm_connections
+
+
+class FakeClient:
+    def __init__(self, head_bucket_errors=()):
+        self.head_bucket_errors = list(head_bucket_errors)
+        self.head_bucket_calls = 0
+        self.closed = False
+
+    async def head_bucket(self, Bucket):
+        self.head_bucket_calls += 1
+        if self.head_bucket_errors:
+            raise self.head_bucket_errors.pop()
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    created = []
+
+    def create_client(config=None):
+        created.append(FakeClient())
+        return created[-1]
+
+    monkeypatch.setattr(session, '_create_client', create_client)
+    return created
+
+
+async def test_shared_client_starts_once_and_restarts_after_stop(clients):
+    shared = SharedAsyncClient(Config(max_pool_connections=3))
+    with pytest.raises(RuntimeError):
+        shared.client
+
+    first, again = await asyncio.gather(shared.start(), shared.start())
+
+    assert first is again is shared.client
+    assert len(clients) == 1
+    await shared.stop()
+    await shared.stop()
+    assert first.closed and not shared.started
+    with pytest.raises(RuntimeError):
+        shared.client
+
+    assert await shared.start() is not first
+    assert len(clients) == 2
+    await shared.stop()
+
+
+async def test_shared_client_prewarms_its_pool(clients):
+    shared = SharedAsyncClient(Config(max_pool_connections=3))
+
+    client = await shared.start(prewarm=True)
+
+    assert client.head_bucket_calls == 3
+    await shared.stop()
+
+
+async def test_prewarm_counts_only_transport_failures(caplog):
+    not_found = ClientError({'Error': {'Code': '404'}, 'ResponseMetadata': {'HTTPStatusCode': 404}}, 'HeadBucket')
+    client = FakeClient([not_found, EndpointConnectionError(endpoint_url='http://s3')])
+
+    with caplog.at_level(logging.WARNING, logger=session.__name__):
+        await prewarm_connections(client, 3, bucket='bucket')
+
+    assert client.head_bucket_calls == 3
+    assert '1 of 3 S3 connections failed to prewarm' in caplog.text
+
+
+async def test_shared_client_closes_client_when_prewarm_fails(clients, monkeypatch):
+    async def prewarm_connections(client, connections, bucket=None):
+        raise asyncio.CancelledError
+
+    monkeypatch.setattr(session, 'prewarm_connections', prewarm_connections)
+    shared = SharedAsyncClient(Config(max_pool_connections=3))
+
+    with pytest.raises(asyncio.CancelledError):
+        await shared.start(prewarm=True)
+
+    assert clients[0].closed and not shared.started
+    assert await shared.start() is clients[1]
+    await shared.stop()
+
+
+async def test_startup_hooks_manage_the_process_client(clients, monkeypatch):
+    monkeypatch.setattr(session, 'shared_client', SharedAsyncClient(Config(max_pool_connections=3)))
+
+    await on_startup(prewarm=False)
+    assert get_shared_client() is clients[0]
+    await on_shutdown()
+
+    assert clients[0].closed
+    with pytest.raises(RuntimeError):
+        get_shared_client()
@@ -0,0 +1,186 @@
+import asyncio
+from collections import Counter
+from io import BytesIO
+
+import pytest
+from aiobotocore.client import AioBaseClient
+from botocore.exceptions import ClientError
+
+from bodies import BytesBody
+from metrics import InMemoryMetricsSink
+from repo_s3 import SomeStuffRepository
+from sharding import HashRing, ShardedSomeStuffRepository
+
+KEYS = [f'some_stuff_{number}.png' for number in range(2000)]
+
+
+def test_hash_ring_spreads_keys_evenly():
+    ring = HashRing(['a', 'b', 'c', 'd'])
+
+    owners = Counter(ring.node_for(key) for key in KEYS)
+
+    assert set(owners) == {'a', 'b', 'c', 'd'}
+    assert all(350 < count < 650 for count in owners.values())
+    assert sum(ring.shares().values()) == pytest.approx(1)
+
+
+def test_hash_ring_add_only_moves_keys_to_the_new_node():
+    ring = HashRing(['a', 'b', 'c', 'd'])
+    before = {key: ring.node_for(key) for key in KEYS}
+
+    ring.add('e')
+
+    moved = {key for key in KEYS if ring.node_for(key) != before[key]}
+    assert {ring.node_for(key) for key in moved} == {'e'}
+    assert 250 < len(moved) < 550
+    with pytest.raises(ValueError):
+        ring.add('e')
+
+
+def shard_repository(mocker, endpoint):
+    objects = {}
+    headers = {}
+    s3_client_mock = mocker.Mock(spec=AioBaseClient)
+    s3_client_mock.meta = mocker.Mock(endpoint_url=endpoint)
+
+    def not_found(operation):
+        return ClientError({'Error': {'Code': 'NoSuchKey'}, 'ResponseMetadata': {'HTTPStatusCode': 404}}, operation)
+
+    async def put_object(Bucket, Key, Body, ContentType, **kwargs):
+        objects[Key] = (Body if isinstance(Body, bytes) else Body.read(), ContentType)
+        headers[Key] = kwargs
+        return {'ETag': '"etag"', 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def get_object(Bucket, Key, Range=None, **kwargs):
+        if Key not in objects:
+            raise not_found('GetObject')
+        data = objects[Key][0]
+        if Range is not None:
+            return {'Body': BytesBody(data), 'ContentRange': f'bytes 0-{len(data) - 1}/{len(data)}',
+                    'ResponseMetadata': {'HTTPStatusCode': 206}}
+        return {'Body': BytesBody(data), 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def head_object(Bucket, Key, **kwargs):
+        if Key not in objects:
+            raise not_found('HeadObject')
+        data, content_type = objects[Key]
+        return {'ContentLength': len(data), 'ContentType': content_type, 'ETag': '"etag"', **headers.get(Key, {}),
+                'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    async def delete_object(Bucket, Key, **kwargs):
+        objects.pop(Key, None)
+        return {'ResponseMetadata': {'HTTPStatusCode': 204}}
+
+    async def list_objects_v2(Bucket, Prefix, MaxKeys, **kwargs):
+        return {'Contents': [{'Key': key} for key in sorted(objects) if key.startswith(Prefix)],
+                'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    for handler in (put_object, get_object, head_object, delete_object, list_objects_v2):
+        setattr(s3_client_mock, handler.__name__, mocker.Mock(wraps=handler))
+    repository = SomeStuffRepository(s3_client_mock, bucket=f'bucket-{endpoint}')
+    repository.objects = objects
+    repository.headers = headers
+    return repository
+
+
+@pytest.fixture
+def sharded_repository(mocker):
+    shards = {name: shard_repository(mocker, name) for name in ('a', 'b', 'c')}
+    return ShardedSomeStuffRepository(shards, sink=InMemoryMetricsSink())
+
+
+async def put_keys(repository, keys):
+    for key in keys:
+        await repository.put_some_stuff(key, BytesIO(key.encode()), 'image/png')
+
+
+async def test_sharded_repository_routes_by_key(sharded_repository):
+    keys = KEYS[:100]
+    await put_keys(sharded_repository, keys)
+
+    for key in keys:
+        assert key in sharded_repository.shards[sharded_repository.shard_for(key)].objects
+        async with await sharded_repository.get_some_stuff(key) as body:
+            assert await body.read() == key.encode()
+    assert sorted([item['Key'] async for item in sharded_repository.list_some_stuff()]) == sorted(keys)
+    counters = sharded_repository.sink.counters['s3_shard_operations_total']
+    assert sum(counters.values()) == 200
+
+
+async def test_add_shard_reads_fall_back_until_rebalanced(sharded_repository, mocker):
+    keys = KEYS[:200]
+    await put_keys(sharded_repository, keys)
+
+    sharded_repository.add_shard('d', shard_repository(mocker, 'd'))
+    moved = [key for key in keys if sharded_repository.shard_for(key) == 'd']
+    assert moved
+    # served by the previous shard before the rebalance
+    async with await sharded_repository.get_some_stuff(moved[0]) as body:
+        assert await body.read() == moved[0].encode()
+
+    report = await sharded_repository.start_rebalance(max_concurrency=4)
+
+    assert report.moved == len(moved) and not report.failed
+    assert sorted(sharded_repository.shards['d'].objects) == sorted(moved)
+    assert sum(len(shard.objects) for shard in sharded_repository.shards.values()) == len(keys)
+    assert sharded_repository.previous_ring is None
+    assert sharded_repository.shards['d'].objects[moved[0]] == (moved[0].encode(), 'image/png')
+
+
+async def test_rebalance_moves_stored_bytes_with_their_headers(sharded_repository):
+    key = KEYS[0]
+    source = sharded_repository.shards[sharded_repository.shard_for(key)]
+    headers = {'ContentEncoding': 'gzip', 'CacheControl': 'max-age=60', 'Metadata': {'codec': 'gzip'}}
+    source.objects[key] = (b'compressed', 'application/json')
+    source.headers[key] = headers
+
+    sharded_repository.remove_shard(sharded_repository.shard_for(key))
+    report = await sharded_repository.rebalance()
+
+    target = sharded_repository.shards[sharded_repository.shard_for(key)]
+    assert report.moved == 1 and not report.failed
+    assert target.objects[key] == (b'compressed', 'application/json')
+    assert target.headers[key] == headers
+    source.s3_client.get_object.assert_called_once_with(Bucket=source.bucket, Key=key, Range='bytes=0-',
+                                                        IfMatch='"etag"')
+
+
+async def test_rebalance_keeps_writes_made_after_the_ring_changed(sharded_repository, mocker):
+    keys = KEYS[:200]
+    await put_keys(sharded_repository, keys)
+    sharded_repository.add_shard('d', shard_repository(mocker, 'd'))
+    key = next(key for key in keys if sharded_repository.shard_for(key) == 'd')
+
+    await asyncio.gather(sharded_repository.rebalance(),
+                         sharded_repository.put_some_stuff(key, BytesIO(b'new'), 'image/png'))
+
+    assert sharded_repository.shards['d'].objects[key] == (b'new', 'image/png')
+    assert all(key not in sharded_repository.shards[name].objects for name in 'abc')
+
+
+async def test_remove_shard_moves_its_keys_away(sharded_repository):
+    keys = KEYS[:200]
+    await put_keys(sharded_repository, keys)
+
+    sharded_repository.remove_shard('c')
+    report = await sharded_repository.rebalance()
+
+    assert not report.failed
+    assert set(sharded_repository.shards) == {'a', 'b'}
+    assert sum(len(shard.objects) for shard in sharded_repository.shards.values()) == len(keys)
+
+
+async def test_rebalance_keeps_objects_of_shards_sharing_a_bucket(sharded_repository):
+    keys = KEYS[:200]
+    await put_keys(sharded_repository, keys)
+    source = sharded_repository.shards['a']
+    sharded_repository.add_shard('d', SomeStuffRepository(source.s3_client, bucket=source.bucket))
+    in_place = [key for key in source.objects if sharded_repository.shard_for(key) == 'd']
+    assert in_place
+
+    report = await sharded_repository.rebalance()
+
+    assert not report.failed and report.skipped == len(in_place)
+    assert all(key in source.objects for key in in_place)
+    assert sum(len(sharded_repository.shards[name].objects) for name in 'abc') == len(keys)
+    source.s3_client.delete_object.assert_not_called()
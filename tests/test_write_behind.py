@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from metrics import InMemoryMetricsSink
+from resilience import RetryPolicy
+from write_behind import FAILED_DIR, WriteBehindFull, WriteBehindQueue
+
+
+class Uploads:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self, key, data, content_type):
+        await self.release.wait()
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('MinIO is down')
+        self.sent.append((key, data.read(), content_type))
+
+
+@pytest.fixture
+def sink():
+    return InMemoryMetricsSink()
+
+
+async def test_put_is_acknowledged_before_upload(tmp_path, sink):
+    uploads = Uploads()
+    uploads.release.clear()
+    queue = WriteBehindQueue(uploads, tmp_path, sink=sink)
+    await queue.start()
+
+    await queue.put('some_stuff.png', b'image', 'image/png')
+
+    assert uploads.sent == []
+    assert await queue.read('some_stuff.png') == b'image'
+    assert sink.gauges['s3_write_behind_queue_depth'][(('queue', 'write_behind'),)] == 1
+
+    uploads.release.set()
+    await queue.stop()
+
+    assert uploads.sent == [('some_stuff.png', b'image', 'image/png')]
+    assert await queue.read('some_stuff.png') is None
+    assert list(tmp_path.glob('*.data')) == []
+    assert queue.pending == 0
+
+
+async def test_put_again_before_upload_sends_newest_once(tmp_path, sink):
+    uploads = Uploads()
+    uploads.release.clear()
+    queue = WriteBehindQueue(uploads, tmp_path, workers=2, sink=sink)
+    await queue.start()
+
+    for version in (b'v1', b'v2', b'v3'):
+        await queue.put('some_stuff.png', version, 'image/png')
+    uploads.release.set()
+    await queue.stop()
+
+    assert [data for _, data, _ in uploads.sent] in ([b'v3'], [b'v1', b'v3'])
+    assert uploads.sent[-1][1] == b'v3'
+
+
+async def test_failed_uploads_are_retried_then_parked(tmp_path, sink):
+    uploads = Uploads(failures=3)
+    queue = WriteBehindQueue(uploads, tmp_path, retry=RetryPolicy(max_attempts=2, base_delay_s=0), sink=sink)
+    await queue.start()
+
+    await queue.put('a.png', b'a', 'image/png')
+    await queue.flush()
+    await queue.put('b.png', b'b', 'image/png')
+    await queue.stop()
+
+    assert uploads.sent == [('b.png', b'b', 'image/png')]
+    assert len(list((tmp_path / FAILED_DIR).glob('*.data'))) == 1
+    counters = sink.counters['s3_write_behind_uploads_total']
+    assert counters[(('queue', 'write_behind'), ('status', 'failed'))] == 1
+    assert counters[(('queue', 'write_behind'), ('status', 'retried'))] == 2
+
+
+async def test_put_applies_backpressure(tmp_path, sink):
+    uploads = Uploads()
+    uploads.release.clear()
+    queue = WriteBehindQueue(uploads, tmp_path, max_pending=2, sink=sink)
+    await queue.start()
+    await queue.put('a.png', b'a', 'image/png')
+    await queue.put('b.png', b'b', 'image/png')
+
+    with pytest.raises(WriteBehindFull):
+        await queue.put('c.png', b'c', 'image/png', wait=False)
+    blocked = asyncio.create_task(queue.put('c.png', b'c', 'image/png'))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    uploads.release.set()
+    await blocked
+    await queue.stop()
+
+    assert sorted(key for key, _, _ in uploads.sent) == ['a.png', 'b.png', 'c.png']
+
+
+async def test_start_recovers_spool(tmp_path, sink):
+    uploads = Uploads()
+    uploads.release.clear()
+    queue = WriteBehindQueue(uploads, tmp_path, sink=sink)
+    await queue.start()
+    await queue.put('a.png', b'old', 'image/png')
+    await queue.put('b.png', b'b', 'image/png')
+    await queue.stop(drain=False)
+    # leftovers of a put interrupted by the crash
+    (tmp_path / 'partial.data.tmp').write_bytes(b'x')
+    (tmp_path / 'orphan.data').write_bytes(b'x')
+
+    recovered = Uploads()
+    queue = WriteBehindQueue(recovered, tmp_path, sink=sink)
+    await queue.start()
+    await queue.stop()
+
+    assert sorted(recovered.sent) == [('a.png', b'old', 'image/png'), ('b.png', b'b', 'image/png')]
+    assert [path.name for path in tmp_path.iterdir()] == [FAILED_DIR]
@@ -3,15 +3,15 @@ import asyncio
 from aiobotocore.session import get_session
 
 from some_stuff.adapters.s3.repositories.some_stuffs_repository import some_stuffsRepository
-from some_stuff.adapters.s3.storage.sessions import CONFIG
+from some_stuff.adapters.s3.storage.sessions import CONFIG, shared_client
 from some_stuff.config import settings
 from some_stuff.containers.some_stuff_api_container import SomeStuffApiContainer
 
 
 async def get_rep_from_container() -> some_stuffsRepository:
+    await shared_client.start()
     container = SomeStuffApiContainer()
-    rep: asyncio.Future[some_stuffsRepository] = container.some_stuffs_repository()
-    r: some_stuffsRepository = await rep
+    r: some_stuffsRepository = container.some_stuffs_repository()
     return r
 
 async def main2() -> None:
@@ -46,6 +46,7 @@ async def main() -> None:
     res = await r.get_some_stuff_metadata('Untitled 2.csv')
     res = await r.remove_some_stuff('Untitled 2.csv')
     a = res
+    await shared_client.stop()
 
 if __name__ == "__main__":
     asyncio.run(main2())
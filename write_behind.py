@@ -0,0 +1,315 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Awaitable, BinaryIO, Callable
+
+from aio_utils import KeyedLock
+from metrics import MetricsSink, default_sink
+from resilience import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_PENDING = 1000
+DEFAULT_MAX_PENDING_BYTES = 1024 * 1024 * 1024
+DEFAULT_RETRY = RetryPolicy(max_attempts=5, base_delay_s=0.5, max_delay_s=30.0)
+COPY_CHUNK_SIZE = 1024 * 1024
+# uploads that ran out of attempts are parked here; move them back to the spool to retry them
+FAILED_DIR = 'failed'
+
+Upload = Callable[[str, BinaryIO, str], Awaitable[Any]]
+
+
+class WriteBehindFull(Exception):
+    pass
+
+
+@dataclass
+class SpoolEntry:
+    entry_id: str
+    key: str
+    content_type: str
+    size: int
+    # time.time_ns() when spooled; orders entries, including across restarts
+    seq: int
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_atomically(path: Path, write: Callable[[BinaryIO], None]) -> None:
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as file:
+        write(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+class WriteBehindQueue:
+    """Acknowledge uploads once they are on local disk and send them to S3 in the background.
+
+    ``put`` writes the object and a JSON sidecar to ``spool_dir`` atomically and returns;
+    ``workers`` tasks drain the spool through ``upload`` (e.g. ``SomeStuffRepository.put_some_stuff``
+    or ``S3Client.put_binary_file``), retrying with ``retry``. Uploads of one key run in the
+    order they were put, and a key put again before it was sent is only sent once.
+
+    Until an object is sent ``read`` serves it from the spool, so readers should try it before S3::
+
+        data = await queue.read(object_name)
+        if data is None:
+            data = await repository.get_some_stuff(object_name)
+
+    ``put`` waits while ``max_pending`` objects or ``max_pending_bytes`` are spooled. ``start``
+    re-queues whatever a previous process left in the spool.
+    """
+
+    def __init__(self,
+                 upload: Upload,
+                 spool_dir: str | os.PathLike,
+                 workers: int = DEFAULT_WORKERS,
+                 max_pending: int = DEFAULT_MAX_PENDING,
+                 max_pending_bytes: int = DEFAULT_MAX_PENDING_BYTES,
+                 retry: RetryPolicy = DEFAULT_RETRY,
+                 sink: MetricsSink = default_sink,
+                 name: str = 'write_behind') -> None:
+        self.upload = upload
+        self.spool_dir = Path(spool_dir)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_pending_bytes = max_pending_bytes
+        self.retry = retry
+        self.sink = sink
+        self.name = name
+        # spooled, not picked up by a worker yet: the newest entry per key
+        self._waiting: dict[str, SpoolEntry] = {}
+        # picked up by a worker: the newest entry per key
+        self._sending: dict[str, SpoolEntry] = {}
+        self._keys: asyncio.Queue[str] = asyncio.Queue()
+        self._key_locks = KeyedLock()
+        self._pending = 0
+        self._pending_bytes = 0
+        self._space = asyncio.Condition()
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def pending_bytes(self) -> int:
+        return self._pending_bytes
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        entries = await loop.run_in_executor(None, self._recover)
+        for entry in entries:
+            await self._track(entry)
+        if entries:
+            logger.info('Recovered %s spooled uploads from %s', len(entries), self.spool_dir)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, drain: bool = True) -> None:
+        """Stop the workers, after sending everything spooled when ``drain``; the rest is sent on next start."""
+        if drain:
+            await self.flush()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def flush(self) -> None:
+        """Wait until every object spooled so far was sent or given up on."""
+        await self._keys.join()
+
+    async def put(self, key: str, data: bytes | BinaryIO, content_type: str, wait: bool = True) -> None:
+        """Spool ``data`` for upload; waits for room, or raises WriteBehindFull when not ``wait``.
+
+        The size of a stream is only known once it is spooled, so it counts towards
+        ``max_pending_bytes`` from then on rather than up front.
+        """
+        size = len(data) if isinstance(data, (bytes, bytearray, memoryview)) else 0
+        async with self._space:
+            if not wait and not self._has_room(size):
+                raise WriteBehindFull(f'Write-behind spool is full: {self._pending} objects, '
+                                      f'{self._pending_bytes} bytes')
+            await self._space.wait_for(lambda: self._has_room(size))
+            # reserve the slot, so puts racing on the spool write can't overshoot the limits
+            self._pending += 1
+            self._pending_bytes += size
+
+        entry = SpoolEntry(uuid.uuid4().hex, key, content_type, size, time.time_ns())
+        loop = asyncio.get_running_loop()
+        try:
+            entry.size = await loop.run_in_executor(None, self._spool, entry, data)
+        finally:
+            self._pending -= 1
+            self._pending_bytes -= size
+        await self._track(entry)
+        # a superseded entry of the key may have freed room
+        await self._notify_space()
+
+    async def read(self, key: str) -> bytes | None:
+        """The spooled body of ``key`` if it wasn't sent yet, None otherwise."""
+        loop = asyncio.get_running_loop()
+        entry = self._waiting.get(key) or self._sending.get(key)
+        while entry is not None:
+            try:
+                return await loop.run_in_executor(None, self._data_path(entry).read_bytes)
+            except FileNotFoundError:
+                # sent or superseded meanwhile
+                newer = self._waiting.get(key) or self._sending.get(key)
+                entry = newer if newer is not entry else None
+        return None
+
+    def _has_room(self, size: int) -> bool:
+        if self._pending == 0:
+            return True
+        return self._pending < self.max_pending and self._pending_bytes + size <= self.max_pending_bytes
+
+    def _data_path(self, entry: SpoolEntry) -> Path:
+        return self.spool_dir / f'{entry.entry_id}.data'
+
+    def _meta_path(self, entry: SpoolEntry) -> Path:
+        return self.spool_dir / f'{entry.entry_id}.json'
+
+    def _spool(self, entry: SpoolEntry, data: bytes | BinaryIO) -> int:
+        def write_data(file: BinaryIO) -> None:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                file.write(data)
+            else:
+                while chunk := data.read(COPY_CHUNK_SIZE):
+                    file.write(chunk)
+
+        data_path = self._data_path(entry)
+        _write_atomically(data_path, write_data)
+        entry.size = data_path.stat().st_size
+        # the sidecar is written last: an entry without one is an interrupted put
+        _write_atomically(self._meta_path(entry), lambda file: file.write(json.dumps(asdict(entry)).encode()))
+        _fsync_dir(self.spool_dir)
+        return entry.size
+
+    def _remove_files(self, entry: SpoolEntry) -> None:
+        self._meta_path(entry).unlink(missing_ok=True)
+        self._data_path(entry).unlink(missing_ok=True)
+
+    def _recover(self) -> list[SpoolEntry]:
+        """Load the spool left by a previous process: the newest complete entry per key, oldest first."""
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        (self.spool_dir / FAILED_DIR).mkdir(exist_ok=True)
+        for tmp_path in self.spool_dir.glob('*.tmp'):
+            tmp_path.unlink()
+
+        newest: dict[str, SpoolEntry] = {}
+        for meta_path in self.spool_dir.glob('*.json'):
+            try:
+                entry = SpoolEntry(**json.loads(meta_path.read_bytes()))
+            except (ValueError, TypeError):
+                logger.warning('Dropping unreadable spool entry %s', meta_path)
+                meta_path.unlink()
+                continue
+            if not self._data_path(entry).exists():
+                meta_path.unlink()
+                continue
+            previous = newest.get(entry.key)
+            if previous is not None and previous.seq > entry.seq:
+                self._remove_files(entry)
+                continue
+            if previous is not None:
+                self._remove_files(previous)
+            newest[entry.key] = entry
+
+        known = {entry.entry_id for entry in newest.values()}
+        for data_path in self.spool_dir.glob('*.data'):
+            if data_path.stem not in known:
+                data_path.unlink()
+        return sorted(newest.values(), key=lambda entry: entry.seq)
+
+    async def _track(self, entry: SpoolEntry) -> None:
+        previous = self._waiting.get(entry.key)
+        self._waiting[entry.key] = entry
+        self._pending += 1
+        self._pending_bytes += entry.size
+        self._set_gauges()
+        if previous is None:
+            self._keys.put_nowait(entry.key)
+        else:
+            # superseded before it was sent
+            await self._release(previous)
+
+    async def _release(self, entry: SpoolEntry) -> None:
+        self._forget(entry)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._remove_files, entry)
+
+    def _forget(self, entry: SpoolEntry) -> None:
+        self._pending -= 1
+        self._pending_bytes -= entry.size
+        self._set_gauges()
+
+    async def _notify_space(self) -> None:
+        async with self._space:
+            self._space.notify_all()
+
+    def _set_gauges(self) -> None:
+        self.sink.set_gauge('s3_write_behind_queue_depth', self._pending, queue=self.name)
+        self.sink.set_gauge('s3_write_behind_queue_bytes', self._pending_bytes, queue=self.name)
+
+    async def _work(self) -> None:
+        while True:
+            key = await self._keys.get()
+            try:
+                entry = self._waiting.pop(key, None)
+                if entry is not None:
+                    self._sending[key] = entry
+                    # a newer put of the key waits for this one, so S3 ends up with the newest body
+                    async with self._key_locks(key):
+                        if (self._waiting.get(key) or self._sending[key]) is not entry:
+                            # superseded while waiting for the previous upload of the key
+                            await self._release(entry)
+                        else:
+                            await self._send(entry)
+                    if self._sending.get(key) is entry:
+                        del self._sending[key]
+                    await self._notify_space()
+            finally:
+                self._keys.task_done()
+
+    async def _send(self, entry: SpoolEntry) -> None:
+        loop = asyncio.get_running_loop()
+        for attempt in range(1, self.retry.max_attempts + 1):
+            try:
+                data = await loop.run_in_executor(None, open, self._data_path(entry), 'rb')
+                try:
+                    await self.upload(entry.key, data, entry.content_type)
+                finally:
+                    data.close()
+            except Exception:
+                if attempt == self.retry.max_attempts:
+                    logger.exception('Giving up on write-behind upload of %s after %s attempts', entry.key, attempt)
+                    self.sink.increment('s3_write_behind_uploads_total', queue=self.name, status='failed')
+                    await loop.run_in_executor(None, self._park_failed, entry)
+                    self._forget(entry)
+                    return
+                self.sink.increment('s3_write_behind_uploads_total', queue=self.name, status='retried')
+                await asyncio.sleep(self.retry.backoff(attempt))
+            else:
+                self.sink.increment('s3_write_behind_uploads_total', queue=self.name, status='sent')
+                await loop.run_in_executor(None, self._remove_files, entry)
+                self._forget(entry)
+                return
+
+    def _park_failed(self, entry: SpoolEntry) -> None:
+        failed_dir = self.spool_dir / FAILED_DIR
+        os.replace(self._data_path(entry), failed_dir / self._data_path(entry).name)
+        os.replace(self._meta_path(entry), failed_dir / self._meta_path(entry).name)